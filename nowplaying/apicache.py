@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+''' on-disk cache of remote metadata lookups '''
+
+import logging
+import os
+import pathlib
+import threading
+import time
+import typing as t
+
+import diskcache
+
+from PySide6.QtCore import QStandardPaths  # pylint: disable=no-name-in-module
+
+DAY = 24 * 60 * 60
+
+# how long a lookup is considered fresh
+TTLS = {
+    'acoustid': 30 * DAY,
+    'discogs': 30 * DAY,
+    'fanarttv': 7 * DAY,
+    'fpcalc': 365 * DAY,
+    'musicbrainz': 30 * DAY,
+    'tags': 365 * DAY,
+    'theaudiodb': 7 * DAY,
+    'wikimedia': 30 * DAY,
+}
+DEFAULTTTL = 7 * DAY
+
+# how long to remember that a provider had nothing
+NEGATIVETTL = DAY
+
+# how long past its TTL an entry may still be used while it gets refreshed
+STALETTL = 30 * DAY
+
+
+class APICache:
+    ''' cache of API responses, keyed by (provider, key)
+
+        fetch() is the main entry point.  the value returned by the fetch
+        function decides what gets cached:
+
+        * None means the lookup failed (timeout, etc) and is not cached
+        * any other false value ({} / []) means 'not found' and is
+          cached for NEGATIVETTL
+        * everything else is cached for the provider's TTL
+
+        entries past their TTL are still returned while a background
+        thread refreshes them
+    '''
+
+    def __init__(self, cachedir=None, ttls=None):
+        if cachedir:
+            self.cachedir = pathlib.Path(cachedir)
+        elif os.environ.get('WNP_CONFIG_TEST_DIR'):
+            self.cachedir = pathlib.Path(os.environ['WNP_CONFIG_TEST_DIR']).joinpath('apicache')
+        else:
+            self.cachedir = pathlib.Path(
+                QStandardPaths.standardLocations(
+                    QStandardPaths.CacheLocation)[0]).joinpath('apicache')
+        self.ttls = TTLS | (ttls or {})
+        self.cache = diskcache.Cache(directory=self.cachedir, timeout=30)
+        self.refreshing: set[tuple[str, str]] = set()
+        self.lock = threading.Lock()
+
+    def _ttl(self, provider: str, data: t.Any) -> float:
+        if not data:
+            return NEGATIVETTL
+        return self.ttls.get(provider, DEFAULTTTL)
+
+    def get(self, provider: str, key: str) -> t.Optional[tuple[t.Any, bool]]:
+        ''' return (data, fresh) or None if nothing is cached '''
+        entry = self.cache.get((provider, key))
+        if entry is None:
+            return None
+        fetched, data = entry
+        return data, time.time() - fetched < self._ttl(provider, data)
+
+    def put(self, provider: str, key: str, data: t.Any):
+        ''' store data; None is never stored '''
+        if data is None:
+            return
+        expire = self._ttl(provider, data)
+        if data:
+            expire += STALETTL
+        self.cache.set((provider, key), (time.time(), data), expire=expire)
+
+    def _store(self, provider: str, key: str, data: t.Any) -> t.Any:
+        self.put(provider, key, data)
+        return data
+
+    def _refresh(self, provider: str, key: str, func: t.Callable, args, kwargs):
+        ''' re-run the lookup in the background '''
+        with self.lock:
+            if (provider, key) in self.refreshing:
+                return
+            self.refreshing.add((provider, key))
+
+        def refresh():
+            try:
+                self._store(provider, key, func(*args, **kwargs))
+            except Exception as error:  # pylint: disable=broad-except
+                logging.error('refreshing %s %s failed: %s', provider, key, error)
+            finally:
+                with self.lock:
+                    self.refreshing.discard((provider, key))
+
+        logging.debug('refreshing stale %s %s', provider, key)
+        threading.Thread(target=refresh, name=f'apicache-{provider}', daemon=True).start()
+
+    def fetch(self, provider: str, key: str, func: t.Callable, *args, **kwargs) -> t.Any:
+        ''' return the cached value for (provider, key), otherwise call func '''
+        if cached := self.get(provider, key):
+            data, fresh = cached
+            if not fresh:
+                self._refresh(provider, key, func, args, kwargs)
+            return data
+        return self._store(provider, key, func(*args, **kwargs))
+
+    def close(self):
+        ''' close the cache '''
+        self.cache.close()
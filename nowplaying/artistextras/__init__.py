@@ -6,6 +6,7 @@ import contextlib
 import sys
 import typing as t
 
+import nowplaying.apicache
 from nowplaying.plugin import WNPBasePlugin
 
 
@@ -15,6 +16,7 @@ class ArtistExtrasPlugin(WNPBasePlugin):
     def __init__(self, config=None, qsettings=None):
         super().__init__(config=config, qsettings=qsettings)
         self.plugintype: str = 'artistextras'
+        self.apicache: t.Optional[nowplaying.apicache.APICache] = None
 
 #### Plug-in methods
 
@@ -43,3 +45,10 @@ class ArtistExtrasPlugin(WNPBasePlugin):
             delay = max(delay / 2, 5)
 
         return delay
+
+    def cached_fetch(self, key: str, func: t.Callable, *args, **kwargs) -> t.Any:
+        ''' look up key in the API cache for this provider, calling func on a miss '''
+        if not self.apicache:
+            self.apicache = nowplaying.apicache.APICache()
+        provider = self.__module__.rsplit('.', maxsplit=1)[-1]
+        return self.apicache.fetch(provider, key, func, *args, **kwargs)
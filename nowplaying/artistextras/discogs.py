@@ -7,7 +7,7 @@ import socket
 import requests.exceptions
 import urllib3.exceptions
 import nowplaying.vendor.discogs_client
-from nowplaying.vendor.discogs_client import models
+from nowplaying.vendor.discogs_client import exceptions, models
 
 from nowplaying.artistextras import ArtistExtrasPlugin
 import nowplaying.utils
@@ -39,12 +39,40 @@ class Plugin(ArtistExtrasPlugin):
         logging.error('Discogs API key is either wrong or missing.')
         return False
 
+    def _fetch_artist(self, artistnum):
+        ''' the parts of a discogs artist that get used; {} if discogs does not have it '''
+        try:
+            artist = self.client.artist(artistnum)
+            return {
+                'name': str(artist.name),
+                'images': artist.images or [],
+                'profile': artist.profile_plaintext,
+                'urls': artist.urls or [],
+            }
+        except exceptions.HTTPError as error:
+            if error.status_code == 404:
+                return {}
+            logging.error('discogs hit %s', error)
+        except (
+                requests.exceptions.ReadTimeout,  # pragma: no cover
+                urllib3.exceptions.ReadTimeoutError,
+                socket.timeout,
+                TimeoutError):
+            logging.error('discogs artist timeout error')
+        except Exception as error:  # pragma: no cover pylint: disable=broad-except
+            logging.error('discogs hit %s', error)
+        return None
+
+    def _artist(self, artistnum):
+        ''' cached version of _fetch_artist '''
+        return self.cached_fetch(f'artist:{artistnum}', self._fetch_artist, artistnum)
+
     def _process_metadata(self, artistname, artist, imagecache):
         ''' update metadata based upon an artist record '''
-        if artist.images and imagecache:
+        if artist['images'] and imagecache:
             self.addmeta['artistfanarturls'] = []
             gotonefanart = False
-            for record in artist.images:
+            for record in artist['images']:
                 if record['type'] == 'primary' and record.get(
                         'uri150') and self.config.cparser.value('discogs/thumbnails', type=bool):
                     imagecache.fill_queue(config=self.config,
@@ -63,10 +91,10 @@ class Plugin(ArtistExtrasPlugin):
                     self.addmeta['artistfanarturls'].append(record['uri'])
 
         if self.config.cparser.value('discogs/bio', type=bool):
-            self.addmeta['artistlongbio'] = artist.profile_plaintext
+            self.addmeta['artistlongbio'] = artist['profile']
 
         if self.config.cparser.value('discogs/websites', type=bool):
-            self.addmeta['artistwebsites'] = artist.urls
+            self.addmeta['artistwebsites'] = artist['urls']
 
     def _find_discogs_website(self, metadata, imagecache):
         ''' use websites listing to find discogs entries '''
@@ -81,21 +109,20 @@ class Plugin(ArtistExtrasPlugin):
         discogs_websites = [url for url in metadata['artistwebsites'] if 'discogs' in url]
         if len(discogs_websites) == 1:
             artistnum = discogs_websites[0].split('/')[-1]
-            artist = self.client.artist(artistnum)
-            artistname = str(artist.name)
-            logging.debug('Found a singular discogs artist URL using %s instead of %s', artistname,
-                          metadata['artist'])
+            if artist := self._artist(artistnum):
+                logging.debug('Found a singular discogs artist URL using %s instead of %s',
+                              artist['name'], metadata['artist'])
         elif len(discogs_websites) > 1:
             for website in discogs_websites:
                 artistnum = website.split('/')[-1]
-                artist = self.client.artist(artistnum)
-                webartistname = str(artist.name)
+                if not (artist := self._artist(artistnum)):
+                    continue
+                webartistname = artist['name']
                 if nowplaying.utils.normalize(webartistname) == nowplaying.utils.normalize(
                         metadata['artist']):
                     logging.debug(
                         'Found near exact match discogs artist URL %s using %s instead of %s',
                         website, webartistname, metadata['artist'])
-                    artistname = webartistname
                     break
                 artist = None
         if artist:
@@ -105,7 +132,7 @@ class Plugin(ArtistExtrasPlugin):
         return False
 
     def _find_discogs_artist_releaselist(self, metadata):
-        ''' given metadata, find the releases for an artist '''
+        ''' given metadata, find the artist record via their releases '''
         if not self.client and not self._setup_client():
             return None
 
@@ -113,10 +140,19 @@ class Plugin(ArtistExtrasPlugin):
             return None
 
         artistname = metadata['artist']
+        artistid = self.cached_fetch(
+            f"release:{nowplaying.utils.normalize_text(artistname)}:"
+            f"{nowplaying.utils.normalize_text(metadata['album'])}", self._fetch_release_artistid,
+            artistname, metadata['album'])
+        if not artistid:
+            return None
+        return self._artist(artistid)
+
+    def _fetch_release_artistid(self, artistname, album):
+        ''' the discogs artist id of a release; 0 if there is no match '''
         try:
-            logging.debug('Fetching %s - %s', artistname, metadata['album'])
-            resultlist = self.client.search(metadata['album'], artist=artistname,
-                                            type='title').page(1)
+            logging.debug('Fetching %s - %s', artistname, album)
+            resultlist = self.client.search(album, artist=artistname, type='title').page(1)
         except (
                 requests.exceptions.ReadTimeout,  # pragma: no cover
                 urllib3.exceptions.ReadTimeoutError,
@@ -129,8 +165,8 @@ class Plugin(ArtistExtrasPlugin):
             return None
 
         return next(
-            (result.artists[0] for result in resultlist if isinstance(result, models.Release)),
-            None,
+            (result.artists[0].id for result in resultlist if isinstance(result, models.Release)),
+            0,
         )
 
     def download(self, metadata=None, imagecache=None):  # pylint: disable=too-many-branches, too-many-return-statements
@@ -43,6 +43,17 @@ class Plugin(ArtistExtrasPlugin):
 
         return artistrequest
 
+    def _fetch_artist(self, apikey, artistid):
+        ''' the artist's json; {} if fanart.tv does not know them, None if the call failed '''
+        artistrequest = self._fetch(apikey, artistid)
+        if artistrequest is None:
+            return None
+        if artistrequest.status_code == 404:
+            return {}
+        if not artistrequest:
+            return None
+        return artistrequest.json()
+
     def download(self, metadata=None, imagecache=None):  # pylint: disable=too-many-branches
         ''' download the extra data '''
 
@@ -64,12 +75,10 @@ class Plugin(ArtistExtrasPlugin):
         #fnstr = nowplaying.utils.normalize(metadata['artist'])
         logging.debug('got musicbrainzartistid: %s', metadata['musicbrainzartistid'])
         for artistid in metadata['musicbrainzartistid']:
-            artistrequest = self._fetch(apikey, artistid)
-            if not artistrequest:
+            artist = self.cached_fetch(artistid, self._fetch_artist, apikey, artistid)
+            if not artist:
                 return None
 
-            artist = artistrequest.json()
-
             # if artist.get('name') and nowplaying.utils.normalize(artist['name']) in fnstr:
             #     logging.debug("fanarttv Trusting : %s", artist['name'])
             # else:
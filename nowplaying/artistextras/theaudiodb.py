@@ -174,22 +174,31 @@ class Plugin(ArtistExtrasPlugin):
 
         return self._handle_extradata(extradata, metadata, imagecache)
 
+    def _fetch_artists(self, apikey, api):
+        ''' the list of artists from an api call; None if the call failed '''
+        data = self._fetch(apikey, api)
+        if data is None:
+            return None
+        return data.get('artists') or []
+
     def artistdatafrommbid(self, apikey, mbartistid):
         ''' get artist data from mbid '''
-        data = self._fetch(apikey, f'artist-mb.php?i={mbartistid}')
-        if not data or not data.get('artists'):
+        artists = self.cached_fetch(f'mbid:{mbartistid}', self._fetch_artists, apikey,
+                                    f'artist-mb.php?i={mbartistid}')
+        if not artists:
             return None
-        return data
+        return {'artists': artists}
 
     def artistdatafromname(self, apikey, artist):
         ''' get artist data from name '''
         if not artist:
             return None
         urlart = requests.utils.requote_uri(artist)
-        data = self._fetch(apikey, f'search.php?s={urlart}')
-        if not data or not data.get('artists'):
+        artists = self.cached_fetch(f'name:{nowplaying.utils.normalize_text(artist)}',
+                                    self._fetch_artists, apikey, f'search.php?s={urlart}')
+        if not artists:
             return None
-        return data
+        return {'artists': artists}
 
     def providerinfo(self):  # pylint: disable=no-self-use
         ''' return list of what is provided by this plug-in '''
@@ -32,37 +32,68 @@ class Plugin(ArtistExtrasPlugin):
         return False
 
     def _get_page(self, entity, lang):
+        ''' the wptools page; None on failure, LookupError if wikidata does not have it '''
         logging.debug("Processing %s", entity)
+        langs = [lang]
+        if lang != 'en' and self.config.cparser.value('wikimedia/bio_iso_en_fallback', type=bool):
+            langs.append('en')
+
+        missing = 0
+        for trylang in langs:
+            try:
+                page = wptools.page(wikibase=entity, lang=trylang, silent=True)
+                page.get()
+                return page
+            except LookupError:
+                missing += 1
+            except Exception as err:  # pylint: disable=broad-except
+                logging.exception("wikimedia page failure (%s): %s", err, entity)
+
+        if missing == len(langs):
+            raise LookupError(entity)
+        return None
+
+    def _fetch_page_data(self, entity, lang):
+        ''' the parts of a wikidata page that get used; {} if wikidata does not have it '''
         try:
-            page = wptools.page(wikibase=entity, lang=lang, silent=True)
-            page.get()
-        except Exception:  # pylint: disable=broad-except
-            page = None
-            if self.config.cparser.value('wikimedia/bio_iso_en_fallback',
-                                         type=bool) and lang != 'en':
-                try:
-                    page = wptools.page(wikibase=entity, lang='en', silent=True)
-                    page.get()
-                except Exception as err:  # pylint: disable=broad-except
-                    page = None
-                    logging.exception("wikimedia page failure (%s): %s", err, entity)
-
-        return page
+            page = self._get_page(entity, lang)
+        except LookupError:
+            logging.debug('wikidata does not have %s', entity)
+            return {}
+
+        if not page:
+            return None
+
+        if not page.data:
+            return {}
+
+        claims = page.data.get('claims') or {}
+        return {
+            'extext': page.data.get('extext'),
+            'description': page.data.get('description'),
+            'claims': {claim: claims[claim]
+                       for claim in ['P434', 'P1953'] if claims.get(claim)},
+            'images': page.images(['kind', 'url']) if page.images() else [],
+        }
+
+    def _page_data(self, entity, lang):
+        ''' cached version of _fetch_page_data '''
+        return self.cached_fetch(f'{entity}:{lang}', self._fetch_page_data, entity, lang)
 
     def download(self, metadata=None, imagecache: "nowplaying.imagecache.ImageCache" = None):  # pylint: disable=too-many-branches
         ''' download content '''
 
         def _get_bio():
-            if page.data.get('extext'):
-                mymeta['artistlongbio'] = page.data['extext']
+            if page.get('extext'):
+                mymeta['artistlongbio'] = page['extext']
             elif lang != 'en' and self.config.cparser.value('wikimedia/bio_iso_en_fallback',
                                                             type=bool):
-                temppage = self._get_page(entity, 'en')
-                if temppage.data.get('extext'):
-                    mymeta['artistlongbio'] = temppage.data['extext']
+                temppage = self._page_data(entity, 'en')
+                if temppage and temppage.get('extext'):
+                    mymeta['artistlongbio'] = temppage['extext']
 
-            if not mymeta.get('artistlongbio') and page.data.get('description'):
-                mymeta['artistshortbio'] = page.data['description']
+            if not mymeta.get('artistlongbio') and page.get('description'):
+                mymeta['artistshortbio'] = page['description']
 
         if not metadata or self._check_missing(metadata):
             return {}
@@ -77,24 +108,24 @@ class Plugin(ArtistExtrasPlugin):
             lang = self.config.cparser.value('wikimedia/bio_iso', type=str) or 'en'
             for website in wikidata_websites:
                 entity = website.split('/')[-1]
-                page = self._get_page(entity, lang)
-                if not page or not page.data:
+                page = self._page_data(entity, lang)
+                if not page:
                     continue
 
                 if self.config.cparser.value('wikimedia/bio', type=bool):
                     _get_bio()
 
-                if page.data['claims'].get('P434'):
-                    mymeta['musicbrainzartistid'] = page.data['claims'].get('P434')
+                if page['claims'].get('P434'):
+                    mymeta['musicbrainzartistid'] = page['claims'].get('P434')
                 mymeta['artistwebsites'] = []
-                if page.data['claims'].get('P1953'):
+                if page['claims'].get('P1953'):
                     mymeta['artistwebsites'].append(
-                        f"https://discogs.com/artist/{page.data['claims'].get('P1953')[0]}")
+                        f"https://discogs.com/artist/{page['claims'].get('P1953')[0]}")
                 mymeta['artistfanarturls'] = []
                 thumbs = []
-                if page.images():
+                if page['images']:
                     gotonefanart = False
-                    for image in page.images(['kind', 'url']):
+                    for image in page['images']:
                         if image.get('url') and image['kind'] in [
                                 'wikidata-image', 'parse-image'
                         ] and self.config.cparser.value('wikimedia/fanart', type=bool):
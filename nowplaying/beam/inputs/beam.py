@@ -193,6 +193,7 @@ class Plugin(InputPlugin):  # pylint: disable = too-many-instance-attributes
                 'artistthumbnailraw',
                 'coverurl',
                 'dbid',
+                'dbrevision',
                 'filename',
                 'hostfqdn',
                 'hostip',
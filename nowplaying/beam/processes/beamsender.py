@@ -17,7 +17,6 @@ import socket
 import struct
 import sys
 import threading
-import time
 import traceback
 
 import aiohttp
@@ -27,6 +26,7 @@ import nowplaying.bootstrap
 import nowplaying.config
 import nowplaying.db
 import nowplaying.frozen
+import nowplaying.trackbus
 import nowplaying.trackrequests
 
 
@@ -41,7 +41,7 @@ class BeamHandler():  # pylint: disable=too-many-instance-attributes
         self.config = config
         self.stopevent = stopevent
         self.tasks = set()
-        self.watcher = None
+        self.trackbus = None
         self.metadb = None
         self.idname = None
         self.port = None
@@ -86,16 +86,17 @@ class BeamHandler():  # pylint: disable=too-many-instance-attributes
 
     async def _start_watcher(self):
         self.metadb = nowplaying.db.MetadataDB()
-        self.watcher = self.metadb.watcher()
-        self.watcher.start()
+        trackbus = nowplaying.trackbus.TrackSubscriber('beamsender')
+        await trackbus.start()
+        self.trackbus = trackbus
 
     async def _websocket_client(self):
         ''' start the websocket client '''
 
         try:
-            while not self.watcher and not self.stopevent.is_set():
+            while not self.trackbus and not self.stopevent.is_set():
                 await asyncio.sleep(1)
-                logging.debug('waiting for a watcher')
+                logging.debug('waiting for the track bus')
 
             logging.debug('starting ws client')
 
@@ -156,11 +157,11 @@ class BeamHandler():  # pylint: disable=too-many-instance-attributes
                 logging.error('Do not know how to handle %s', jsondata)
 
     async def _websocket_metadata_write(self, connection):
-        mytime = 0
+        # -1 so that whatever is already in the metadb gets sent first
+        seq = -1
         while not self.stopevent.is_set() and not connection.closed:
-            if mytime < self.watcher.updatetime:
-                mytime = await self._wss_do_update(connection)
-            await asyncio.sleep(1)
+            if await self.trackbus.wait_for_update(seq, timeout=1):
+                seq = await self._wss_do_update(connection)
 
     async def _find_beam(self):
         ''' keep track of the remote host '''
@@ -273,12 +274,18 @@ class BeamHandler():  # pylint: disable=too-many-instance-attributes
         # early launch can be a bit weird so
         # pause a bit
         prefilter = None
+        seq = self.trackbus.seq
 
         while not prefilter and not self.stopevent.is_set() and not connection.closed:
             if self.stopevent.is_set() or connection.closed:
-                return 0
-            prefilter = self.metadb.read_last_meta()
-            await asyncio.sleep(1)
+                return -1
+            seq = self.trackbus.seq
+            prefilter = self.trackbus.latest() or self.metadb.read_last_meta()
+            if not prefilter:
+                await asyncio.sleep(1)
+
+        if not prefilter:
+            return -1
 
         metadata = {
             k: v
@@ -290,6 +297,7 @@ class BeamHandler():  # pylint: disable=too-many-instance-attributes
                 'artistshortbio',
                 'artistthumbnailraw',
                 'dbid',
+                'dbrevision',
                 'coverurl',
                 'filename',
                 'hostfqdn',
@@ -304,15 +312,15 @@ class BeamHandler():  # pylint: disable=too-many-instance-attributes
         beamdata['msgtype'] = 'METADATA'
         beamdata['metadata'] = self._base64ifier(metadata)
         if connection.closed:
-            return 0
+            return -1
         logging.debug('Beaming to %s:%s', self.ipaddr, self.port)
         await connection.send_json(beamdata)
-        return time.time()
+        return seq
 
     async def stop_server(self):
         ''' stop our server '''
-        if self.watcher:
-            self.watcher.stop()
+        if self.trackbus:
+            await self.trackbus.stop()
 
     def forced_stop(self, signum=None, frame=None):  # pylint: disable=unused-argument
         ''' caught an int signal so tell the world to stop '''
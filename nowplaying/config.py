@@ -144,8 +144,12 @@ class ConfigFile:  # pylint: disable=too-many-instance-attributes, too-many-publ
 
         settings.setValue('artistextras/fanart', 10)
         settings.setValue('artistextras/processes', 5)
+        for provider, connections in [('discogs', 2), ('fanarttv', 4), ('theaudiodb', 4),
+                                      ('wikimedia', 2)]:
+            settings.setValue(f'artistextras/connections/{provider}', connections)
         settings.setValue('artistextras/cachesize', 5)
         settings.setValue('artistextras/fanartdelay', 8)
+        settings.setValue('artistextras/deadline', 5.0)
         settings.setValue('artistextras/coverfornofanart', True)
         settings.setValue('artistextras/coverfornologos', False)
         settings.setValue('artistextras/coverfornothumbs', True)
@@ -160,6 +164,7 @@ class ConfigFile:  # pylint: disable=too-many-instance-attributes, too-many-publ
         settings.setValue('settings/initialized', False)
         settings.setValue('settings/loglevel', self.loglevel)
         settings.setValue('settings/notif', self.notif)
+        settings.setValue('settings/previoustracks', 100)
         settings.setValue('settings/stripextras', False)
 
         settings.setValue('textoutput/file', None)
@@ -1,7 +1,9 @@
 #!/usr/bin/env python3
 ''' routines to read/write the metadb '''
 
+import contextlib
 import copy
+import hashlib
 import logging
 import os
 import pathlib
@@ -15,7 +17,7 @@ import aiosqlite
 from watchdog.observers import Observer  # pylint: disable=import-error
 from watchdog.events import PatternMatchingEventHandler  # pylint: disable=import-error
 
-from PySide6.QtCore import QStandardPaths  # pylint: disable=import-error, no-name-in-module
+from PySide6.QtCore import QCoreApplication, QSettings, QStandardPaths  # pylint: disable=import-error, no-name-in-module
 
 SPLITSTR = '@@SPLITHERE@@'
 
@@ -80,6 +82,33 @@ METADATABLOBLIST = [
     'requesterimageraw'
 ]
 
+# how many tracks previoustrack holds by default
+PREVIOUSTRACKLIMIT = 100
+
+# images live in the blobs table, content-addressed by hash;
+# currentmeta only stores the hash
+BLOBHASHKEYS = {key: key.replace('raw', 'hash') for key in METADATABLOBLIST}
+
+
+def blobhash(data) -> str:
+    ''' content address of an image '''
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+# fixed statements so sqlite3's per-connection statement cache
+# only ever compiles them once
+INSERTMETACOLUMNS = METADATALIST + list(BLOBHASHKEYS.values())
+INSERTMETASQL = (f'INSERT INTO currentmeta ({", ".join(INSERTMETACOLUMNS)}) '
+                 f'VALUES ({",".join("?" * len(INSERTMETACOLUMNS))})')
+INSERTBLOBSQL = 'INSERT OR IGNORE INTO blobs (hash, data) VALUES (?,?)'
+UPDATEMETASQL = ('UPDATE currentmeta SET ' +
+                 ', '.join(f'{column}=?' for column in INSERTMETACOLUMNS) +
+                 ', revision=revision+1 WHERE id=? RETURNING revision')
+LASTMETASQL = 'SELECT * FROM currentmeta ORDER BY id DESC LIMIT 1'
+READBLOBSQL = 'SELECT data FROM blobs WHERE hash=?'
+
 
 class DBWatcher:
     ''' utility to watch for database changes '''
@@ -97,7 +126,7 @@ class DBWatcher:
         directory = os.path.dirname(self.databasefile)
         filename = os.path.basename(self.databasefile)
         logging.info('Watching for changes on %s', self.databasefile)
-        self.event_handler = PatternMatchingEventHandler(patterns=[filename],
+        self.event_handler = PatternMatchingEventHandler(patterns=[filename, f'{filename}-wal'],
                                                          ignore_patterns=['.DS_Store'],
                                                          ignore_directories=True,
                                                          case_sensitive=False)
@@ -137,8 +166,20 @@ class DBWatcher:
 class MetadataDB:
     """ Metadata DB module"""
 
-    def __init__(self, databasefile: t.Optional[str] = None, initialize=False):
+    # one connection per database file for the life of the process,
+    # keyed by path and checked against the file's identity so that
+    # a DB recreated by setupsql gets a fresh connection
+    connections: dict[pathlib.Path, tuple[tuple[int, int], sqlite3.Connection]] = {}
+    aconnections: dict[pathlib.Path, tuple[tuple[int, int], aiosqlite.Connection]] = {}
+
+    def __init__(self,
+                 databasefile: t.Optional[str] = None,
+                 initialize=False,
+                 previoustracklimit: t.Optional[int] = None):
         self.watchers = set()
+        self.previoustracklimit = previoustracklimit or self.configured_previoustracklimit()
+        # dbid -> artist/title, oldest first
+        self.history = {}
 
         self.databasefile = self.init_db_var(databasefile=databasefile)
         logging.debug("Metadata DB at %s", self.databasefile)
@@ -146,6 +187,20 @@ class MetadataDB:
             logging.debug('Setting up a new DB')
             self.setupsql()
 
+    @staticmethod
+    def configured_previoustracklimit() -> int:
+        ''' settings/previoustracks, so every process trims the same window '''
+        if sys.platform == "win32":
+            qsettingsformat = QSettings.IniFormat
+        else:
+            qsettingsformat = QSettings.NativeFormat
+        settings = QSettings(qsettingsformat, QSettings.UserScope,
+                             QCoreApplication.organizationName(),
+                             QCoreApplication.applicationName())
+        return settings.value('settings/previoustracks',
+                              type=int,
+                              defaultValue=PREVIOUSTRACKLIMIT) or PREVIOUSTRACKLIMIT
+
     @staticmethod
     def init_db_var(databasefile) -> pathlib.Path:
         """ split this out to make testing easier """
@@ -163,112 +218,265 @@ class MetadataDB:
         watcher._set_callback(self.watchers.discard)  # pylint: disable=protected-access
         return watcher
 
+    def watchfiles(self) -> list[pathlib.Path]:
+        ''' files that change when a track is written
+
+            in WAL mode new rows land in the -wal file and only
+            reach the main file on checkpoint
+        '''
+        return [self.databasefile, pathlib.Path(f'{self.databasefile}-wal')]
+
     def __del__(self):
         for watcher in copy.copy(self.watchers):
             logging.exception("Clearing leftover watcher")
             watcher.stop()
 
-    async def write_to_metadb(self, metadata=None):
-        ''' update metadb '''
+    def _identity(self) -> t.Optional[tuple[int, int]]:
+        ''' which file is currently at databasefile, if any '''
+        try:
+            stat = self.databasefile.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _connect(self) -> t.Optional[sqlite3.Connection]:
+        ''' the long-lived connection for this process '''
+        if not (identity := self._identity()):
+            return None
 
-        def filterkeys(mydict):
-            return {key: mydict[key] for key in METADATALIST + METADATABLOBLIST if key in mydict}
+        if cached := self.connections.get(self.databasefile):
+            if cached[0] == identity:
+                return cached[1]
+            cached[1].close()
+
+        connection = sqlite3.connect(self.databasefile, timeout=10, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA synchronous=NORMAL')
+        self.connections[self.databasefile] = (identity, connection)
+        return connection
+
+    async def _aconnect(self) -> t.Optional[aiosqlite.Connection]:
+        ''' the long-lived async connection for this process '''
+        if not (identity := self._identity()):
+            return None
+
+        if cached := self.aconnections.get(self.databasefile):
+            if cached[0] == identity:
+                return cached[1]
+            with contextlib.suppress(ValueError, sqlite3.Error):
+                await cached[1].close()
+
+        connection = aiosqlite.connect(self.databasefile, timeout=10)
+        # the worker thread lives as long as the process; never
+        # let it hold up interpreter shutdown
+        connection.daemon = True
+        await connection
+        connection.row_factory = sqlite3.Row
+        await connection.execute('PRAGMA synchronous=NORMAL')
+        if (cached := self.aconnections.get(self.databasefile)) and cached[0] == identity:
+            # another task won the race to connect
+            await connection.close()
+            return cached[1]
+        self.aconnections[self.databasefile] = (identity, connection)
+        return connection
+
+    def close(self):
+        ''' close this process' connection to the metadb '''
+        if cached := self.connections.pop(self.databasefile, None):
+            cached[1].close()
+
+    async def close_async(self):
+        ''' close this process' connections to the metadb '''
+        self.close()
+        if cached := self.aconnections.pop(self.databasefile, None):
+            with contextlib.suppress(ValueError, sqlite3.Error):
+                await cached[1].close()
+
+    @staticmethod
+    def _prepare_write(metadata):
+        ''' convert metadata into the currentmeta columns + blobs keyed by hash
+
+            the values are only referenced, never copied; the caller's
+            dictionary is left untouched
+        '''
+
+        row = {}
+        for key in METADATALIST:
+            value = metadata.get(key)
+            if isinstance(value, list):
+                value = SPLITSTR.join(value)
+            if isinstance(value, str) and len(value) == 0:
+                value = None
+            row[key] = value
+
+        blobs = {}
+        for key, hashkey in BLOBHASHKEYS.items():
+            row[hashkey] = None
+            # artistfanartraw is never stored in this DB
+            if key != 'artistfanartraw' and (data := metadata.get(key)):
+                row[hashkey] = blobhash(data)
+                blobs[row[hashkey]] = data
+        return row, blobs
+
+    async def write_to_metadb(self, metadata=None):
+        ''' update metadb, returning the dbid of the new row '''
 
         logging.debug('Called (async) write_to_metadb')
         if (not metadata or not METADATALIST or 'title' not in metadata
                 or 'artist' not in metadata):
             logging.debug('metadata is either empty or too incomplete')
-            return
+            return None
 
         if not self.databasefile.exists():
             self.setupsql()
 
-        async with aiosqlite.connect(self.databasefile, timeout=10) as connection:
-            # do not want to modify the original dictionary
-            # otherwise Bad Things(tm) will happen
-            mdcopy = copy.deepcopy(metadata)
-            mdcopy['artistfanartraw'] = None
+        connection = await self._aconnect()
+        row, blobs = self._prepare_write(metadata)
 
-            # toss any keys we do not care about
-            mdcopy = filterkeys(mdcopy)
+        logging.debug('Adding record with %s/%s', row['artist'], row['title'])
 
-            cursor = await connection.cursor()
+        await connection.executemany(INSERTBLOBSQL, blobs.items())
+        async with connection.execute(INSERTMETASQL, tuple(row.values())) as cursor:
+            dbid = cursor.lastrowid
+        await connection.commit()
+        return dbid
 
-            logging.debug('Adding record with %s/%s', mdcopy['artist'], mdcopy['title'])
+    async def update_in_metadb(self, dbid, metadata=None) -> t.Optional[int]:
+        ''' store an updated copy of the track in place, returning its new revision.
 
-            for key in METADATABLOBLIST:
-                if key not in mdcopy:
-                    mdcopy[key] = None
+            the track keeps its dbid so history and anything that only
+            happens once per track are unaffected; caches of the track's
+            contents should key on (dbid, dbrevision) instead
+        '''
+        if not metadata or not (connection := await self._aconnect()):
+            return None
 
-            for data in mdcopy:
-                if isinstance(mdcopy[data], list):
-                    mdcopy[data] = SPLITSTR.join(mdcopy[data])
-                if isinstance(mdcopy[data], str) and len(mdcopy[data]) == 0:
-                    mdcopy[data] = None
+        row, blobs = self._prepare_write(metadata)
+        await connection.executemany(INSERTBLOBSQL, blobs.items())
+        async with connection.execute(UPDATEMETASQL, (*row.values(), dbid)) as cursor:
+            updated = await cursor.fetchone()
+        await connection.commit()
+        return updated[0] if updated else None
+
+    async def make_record_async(self, metadata, dbid, revision=0):
+        ''' build what read_last_meta_async would return for metadata stored as dbid
+
+            used to publish a track without having to read it back
+        '''
+        row, blobs = self._prepare_write(metadata)
+        for key in METADATALIST:
+            # columns are TEXT, so sqlite hands numbers back as strings
+            if isinstance(row[key], (int, float)):
+                row[key] = str(row[key])
+        row['id'] = dbid
+        row['revision'] = revision
+        record = self._postprocess_read_last_meta(row, blobs)
+        record['previoustrack'] = await self.make_previoustracklist_async(lastid=dbid)
+        return record
+
+    def _check_history(self, lastid):
+        ''' drop the history cache if the DB got recreated underneath us '''
+        if lastid is not None and self.history and lastid < next(reversed(self.history)):
+            logging.debug('metadb was reset; clearing history cache')
+            self.history = {}
+
+    def _history_query(self):
+        ''' only fetch rows newer than what is already cached '''
+        lastid = next(reversed(self.history)) if self.history else 0
+        return ('SELECT id, artist, title FROM currentmeta WHERE id > ? ORDER BY id DESC LIMIT ?',
+                (lastid, self.previoustracklimit))
+
+    def _update_history(self, records):
+        ''' merge new rows into the history cache and build previoustrack '''
+        for row in reversed(records):
+            self.history[row['id']] = {'artist': row['artist'], 'title': row['title']}
+        while len(self.history) > self.previoustracklimit:
+            del self.history[next(iter(self.history))]
+        return [dict(track) for track in reversed(self.history.values())]
+
+    def make_previoustracklist(self, lastid=None):
+        ''' create a reversed list of the last previoustracklimit tracks played '''
+
+        if not (connection := self._connect()):
+            logging.error('MetadataDB does not exist yet?')
+            return None
 
-            sql = 'INSERT INTO currentmeta ('
-            sql += ', '.join(mdcopy.keys()) + ') VALUES ('
-            sql += '?,' * (len(mdcopy.keys()) - 1) + '?)'
+        self._check_history(lastid)
+        try:
+            records = connection.execute(*self._history_query()).fetchall()
+        except sqlite3.OperationalError:
+            return None
 
-            datatuple = tuple(list(mdcopy.values()))
-            await cursor.execute(sql, datatuple)
-            await connection.commit()
+        return self._update_history(records)
 
-    def make_previoustracklist(self):
-        ''' create a reversed list of the tracks played '''
+    async def make_previoustracklist_async(self, lastid=None):
+        ''' create a reversed list of the last previoustracklimit tracks played '''
 
-        if not self.databasefile.exists():
+        if not (connection := await self._aconnect()):
             logging.error('MetadataDB does not exist yet?')
             return None
 
-        with sqlite3.connect(self.databasefile, timeout=10) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            try:
-                cursor.execute('''SELECT artist, title FROM currentmeta ORDER BY id DESC''')
-            except sqlite3.OperationalError:
-                return None
-
-            records = cursor.fetchall()
+        self._check_history(lastid)
+        try:
+            async with connection.execute(*self._history_query()) as cursor:
+                records = await cursor.fetchall()
+        except sqlite3.OperationalError:
+            return None
 
-        previouslist = []
-        if records:
-            previouslist.extend({'artist': row['artist'], 'title': row['title']} for row in records)
+        return self._update_history(records)
 
-        return previouslist
+    @staticmethod
+    def _history_sql(before, limit):
+        ''' build a paginated history query '''
+        sql = 'SELECT id, artist, title FROM currentmeta'
+        params = []
+        if before:
+            sql += ' WHERE id < ?'
+            params.append(before)
+        sql += ' ORDER BY id DESC'
+        if limit:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return sql, params
+
+    def read_history(self, before=None, limit=None):
+        ''' tracks played before dbid before, newest first '''
+
+        if not (connection := self._connect()):
+            logging.error('MetadataDB does not exist yet?')
+            return []
 
-    async def make_previoustracklist_async(self):
-        ''' create a reversed list of the tracks played '''
+        try:
+            records = connection.execute(*self._history_sql(before, limit)).fetchall()
+        except sqlite3.OperationalError:
+            return []
 
-        if not self.databasefile.exists():
-            logging.error('MetadataDB does not exist yet?')
-            return None
+        return [{'dbid': row['id'], 'artist': row['artist'], 'title': row['title']} for row in records]
 
-        async with aiosqlite.connect(self.databasefile, timeout=10) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = await connection.cursor()
-            try:
-                await cursor.execute('''SELECT artist, title FROM currentmeta ORDER BY id DESC''')
-            except sqlite3.OperationalError:
-                return None
+    async def read_history_async(self, before=None, limit=None):
+        ''' tracks played before dbid before, newest first '''
 
-            records = await cursor.fetchall()
-            await connection.commit()
+        if not (connection := await self._aconnect()):
+            logging.error('MetadataDB does not exist yet?')
+            return []
 
-        previouslist = []
-        if records:
-            previouslist.extend({'artist': row['artist'], 'title': row['title']} for row in records)
+        try:
+            async with connection.execute(*self._history_sql(before, limit)) as cursor:
+                records = await cursor.fetchall()
+        except sqlite3.OperationalError:
+            return []
 
-        return previouslist
+        return [{'dbid': row['id'], 'artist': row['artist'], 'title': row['title']} for row in records]
 
     @staticmethod
-    def _postprocess_read_last_meta(row):
+    def _postprocess_read_last_meta(row, blobs=None):
         ''' common post-process of read_last_meta '''
         metadata = {data: row[data] for data in METADATALIST}
-        for key in METADATABLOBLIST:
-            metadata[key] = row[key]
-            if not metadata[key]:
-                del metadata[key]
+        for key, hashkey in BLOBHASHKEYS.items():
+            if row[hashkey]:
+                metadata[hashkey] = row[hashkey]
+                if blobs and blobs.get(row[hashkey]):
+                    metadata[key] = blobs[row[hashkey]]
 
         for key in LISTFIELDS:
             metadata[key] = row[key]
@@ -276,59 +484,91 @@ class MetadataDB:
                 metadata[key] = metadata[key].split(SPLITSTR)
 
         metadata['dbid'] = row['id']
+        metadata['dbrevision'] = row['revision']
         return metadata
 
-    async def read_last_meta_async(self):
-        ''' update metadb '''
+    @staticmethod
+    def _blob_query(row):
+        ''' sql to fetch every image referenced by a currentmeta row '''
+        hashes = [row[hashkey] for hashkey in BLOBHASHKEYS.values() if row[hashkey]]
+        sql = f'SELECT hash, data FROM blobs WHERE hash IN ({",".join("?" * len(hashes))})'
+        return sql, hashes
+
+    async def read_last_meta_async(self, blobs=True):
+        ''' update metadb
 
-        if not self.databasefile.exists():
+            blobs=False skips the image data entirely; the *hash keys
+            can be used to fetch individual images via read_blob_async
+        '''
+
+        if not (connection := await self._aconnect()):
             logging.error('MetadataDB does not exist yet?')
             return None
 
-        async with aiosqlite.connect(self.databasefile, timeout=10) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = await connection.cursor()
-            try:
-                await cursor.execute('''SELECT * FROM currentmeta ORDER BY id DESC LIMIT 1''')
-            except sqlite3.OperationalError as err:
-                logging.exception("SQLite3 error: %s", err)
-                return None
+        blobdata = None
+        try:
+            async with connection.execute(LASTMETASQL) as cursor:
+                row = await cursor.fetchone()
+        except sqlite3.OperationalError as err:
+            logging.exception("SQLite3 error: %s", err)
+            return None
 
-            row = await cursor.fetchone()
-            await cursor.close()
-            await connection.commit()
+        if not row:
+            return None
 
-            if not row:
-                return None
+        if blobs:
+            async with connection.execute(*self._blob_query(row)) as cursor:
+                blobdata = {blobrow['hash']: blobrow['data'] for blobrow in await cursor.fetchall()}
 
-        metadata = self._postprocess_read_last_meta(row)
-        metadata['previoustrack'] = await self.make_previoustracklist_async()
+        metadata = self._postprocess_read_last_meta(row, blobdata)
+        metadata['previoustrack'] = await self.make_previoustracklist_async(lastid=row['id'])
         return metadata
 
-    def read_last_meta(self):
-        ''' update metadb '''
+    def read_last_meta(self, blobs=True):
+        ''' update metadb
 
-        if not self.databasefile.exists():
+            blobs=False skips the image data entirely; the *hash keys
+            can be used to fetch individual images via read_blob
+        '''
+
+        if not (connection := self._connect()):
             logging.error('MetadataDB does not exist yet?')
             return None
 
-        with sqlite3.connect(self.databasefile, timeout=10) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            try:
-                cursor.execute('''SELECT * FROM currentmeta ORDER BY id DESC LIMIT 1''')
-            except sqlite3.OperationalError as err:
-                logging.exception("SQLite3 error: %s", err)
-                return None
-
-            row = cursor.fetchone()
-            if not row:
-                return None
-
-        metadata = self._postprocess_read_last_meta(row)
-        metadata['previoustrack'] = self.make_previoustracklist()
+        blobdata = None
+        try:
+            row = connection.execute(LASTMETASQL).fetchone()
+        except sqlite3.OperationalError as err:
+            logging.exception("SQLite3 error: %s", err)
+            return None
+
+        if not row:
+            return None
+
+        if blobs:
+            blobdata = {
+                blobrow['hash']: blobrow['data']
+                for blobrow in connection.execute(*self._blob_query(row)).fetchall()
+            }
+
+        metadata = self._postprocess_read_last_meta(row, blobdata)
+        metadata['previoustrack'] = self.make_previoustracklist(lastid=row['id'])
         return metadata
 
+    async def read_blob_async(self, imagehash):
+        ''' fetch a single image by its hash '''
+
+        if not imagehash or not (connection := await self._aconnect()):
+            return None
+
+        try:
+            async with connection.execute(READBLOBSQL, (imagehash, )) as cursor:
+                row = await cursor.fetchone()
+        except sqlite3.OperationalError as err:
+            logging.exception("SQLite3 error: %s", err)
+            return None
+        return row[0] if row else None
+
     def setupsql(self):
         ''' setup the default database '''
 
@@ -336,20 +576,30 @@ class MetadataDB:
             logging.error('No dbfile')
             sys.exit(1)
 
+        self.history = {}
+        self.close()
         self.databasefile.parent.mkdir(parents=True, exist_ok=True)
         if self.databasefile.exists():
             logging.info('Clearing cache file %s', self.databasefile)
             os.unlink(self.databasefile)
+        for suffix in ('-wal', '-shm'):
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(f'{self.databasefile}{suffix}')
 
         with sqlite3.connect(self.databasefile, timeout=10) as connection:
             cursor = connection.cursor()
+            # readers in the other processes never block the writer
+            cursor.execute('PRAGMA journal_mode=WAL')
 
             sql = 'CREATE TABLE currentmeta (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            sql += 'revision INTEGER DEFAULT 0, '
             sql += ' TEXT, '.join(METADATALIST) + ' TEXT, '
-            sql += ' BLOB, '.join(METADATABLOBLIST) + ' BLOB)'
+            sql += ' TEXT, '.join(BLOBHASHKEYS.values()) + ' TEXT)'
 
             cursor.execute(sql)
+            cursor.execute('CREATE TABLE blobs (hash TEXT PRIMARY KEY, data BLOB)')
             logging.debug('Cache db file created')
+        connection.close()
 
 
 def create_setlist(config=None, databasefile=None):
@@ -363,12 +613,7 @@ def create_setlist(config=None, databasefile=None):
     setlistpath = pathlib.Path(config.getsetlistdir())
     logging.debug('setlistpath = %s', setlistpath)
     metadb = MetadataDB(databasefile=databasefile, initialize=False)
-    metadata = metadb.read_last_meta()
-    if not metadata:
-        logging.info('No tracks were played; not saving setlist')
-        return
-
-    previoustrack = metadata['previoustrack']
+    previoustrack = metadb.read_history()
     if not previoustrack:
         logging.info('No previoustracks were played; not saving setlist')
         return
@@ -4,11 +4,18 @@
 
 import asyncio
 import concurrent.futures
+import contextlib
+import functools
+import hashlib
+import multiprocessing
+import os
 import pathlib
+import queue
 import random
 import sqlite3
 import threading
 import time
+import urllib.parse
 import uuid
 import typing as t
 
@@ -16,9 +23,9 @@ import logging
 import logging.config
 import logging.handlers
 
+import aiohttp
 import aiosqlite
 import diskcache
-import requests_cache
 
 from PySide6.QtCore import QStandardPaths  # pylint: disable=no-name-in-module
 
@@ -29,6 +36,39 @@ import nowplaying.version  # pylint: disable=import-error, no-name-in-module
 MAX_FANART_DOWNLOADS = 50
 
 
+# put on the download queue to stop queue_process
+STOPMARKER = 'STOPWNP'
+
+# simultaneous downloads per image provider, keyed by domain
+HOSTLIMITS = {
+    'discogs.com': 2,
+    'fanart.tv': 4,
+    'theaudiodb.com': 4,
+    'wikimedia.org': 2,
+}
+DEFAULTHOSTLIMIT = 2
+
+# config name -> domain for artistextras/connections/*
+PROVIDERHOSTS = {
+    'discogs': 'discogs.com',
+    'fanarttv': 'fanart.tv',
+    'theaudiodb': 'theaudiodb.com',
+    'wikimedia': 'wikimedia.org',
+}
+
+# download attempts and the base delay between them
+RETRIES = 3
+BACKOFF = 0.5
+RETRYSTATUS = {429, 500, 502, 503, 504}
+
+# processes for decoding and PNG conversion
+CONVERTWORKERS = 2
+
+# seconds between checks of the db for rows queued by an ImageCache
+# whose dlqueue nobody drains, e.g. the webserver's
+DBPOLL = 5
+
+
 class ImageCache:
     ''' database operations for caches '''
 
@@ -42,7 +82,21 @@ class ImageCache:
      );
     '''
 
+    INDEXDEFS = [
+        '''CREATE INDEX IF NOT EXISTS identifiersha_identifier
+ ON identifiersha(identifier, imagetype, cachekey);''',
+        '''CREATE INDEX IF NOT EXISTS identifiersha_cachekey
+ ON identifiersha(cachekey, timestamp);''',
+    ]
+
+    # one connection per process per database file, shared by every
+    # ImageCache in that process.  keyed by pid so that forked children
+    # never use their parent's connection
+    connections: dict[tuple[int, pathlib.Path], tuple[tuple[int, int], sqlite3.Connection]] = {}
+    locks: dict[tuple[int, pathlib.Path], threading.RLock] = {}
+
     def __init__(self, sizelimit=1, initialize=False, cachedir=None, stopevent=None):
+        self.sizelimit = sizelimit
         if not cachedir:
             self.cachedir = pathlib.Path(
                 QStandardPaths.standardLocations(
@@ -55,7 +109,6 @@ class ImageCache:
         self.databasefile = self.cachedir.joinpath('imagecachev2.db')
         if not self.databasefile.exists():
             initialize = True
-        self.httpcachefile = self.cachedir.joinpath('http')
         self.cache = diskcache.Cache(directory=self.cachedir.joinpath('diskcache'),
                                      timeout=30,
                                      eviction_policy='least-frequently-used',
@@ -65,6 +118,55 @@ class ImageCache:
         self.session = None
         self.logpath = None
         self.stopevent: asyncio.Event = stopevent
+        # srclocations to download, fed by put_db_srclocation from any
+        # process that inherited this object and drained by queue_process.
+        # other instances still get picked up by the DBPOLL scan
+        self.dlqueue = multiprocessing.Queue()
+
+    def _identity(self) -> t.Optional[tuple[int, int]]:
+        ''' which file is currently at databasefile, if any '''
+        try:
+            stat = self.databasefile.stat()
+        except FileNotFoundError:
+            return None
+        return stat.st_dev, stat.st_ino
+
+    def _connect(self, key: tuple[int, pathlib.Path]) -> sqlite3.Connection:
+        if not (identity := self._identity()):
+            raise sqlite3.OperationalError(f'{self.databasefile} does not exist')
+
+        if cached := self.connections.get(key):
+            if cached[0] == identity:
+                return cached[1]
+            cached[1].close()
+
+        # autocommit; batches use explicit transactions
+        connection = sqlite3.connect(self.databasefile,
+                                     timeout=30,
+                                     isolation_level=None,
+                                     check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        for indexdef in self.INDEXDEFS:
+            connection.execute(indexdef)
+        self.connections[key] = (identity, connection)
+        return connection
+
+    @contextlib.contextmanager
+    def _db(self) -> t.Iterator[sqlite3.Connection]:
+        ''' this process' long-lived connection, one thread at a time.
+            raises sqlite3.OperationalError if the database is missing '''
+        key = (os.getpid(), self.databasefile)
+        with self.locks.setdefault(key, threading.RLock()):
+            yield self._connect(key)
+
+    def close(self):
+        ''' close this process' connection to the database '''
+        key = (os.getpid(), self.databasefile)
+        with self.locks.setdefault(key, threading.RLock()):
+            if cached := self.connections.pop(key, None):
+                cached[1].close()
 
     def attempt_v1tov2_upgrade(self):
         ''' dbv1 to dbv2 '''
@@ -103,17 +205,28 @@ class ImageCache:
             return
 
         logging.info('Create imagecache db file %s', self.databasefile)
+        # a connection to a database that was removed out from under it
+        # keeps its -wal/-shm around, which would corrupt the new file
+        self.close()
+        for suffix in ['-wal', '-shm']:
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(f'{self.databasefile}{suffix}')
         self.databasefile.resolve().parent.mkdir(parents=True, exist_ok=True)
 
         with sqlite3.connect(self.databasefile, timeout=30) as connection:
 
             cursor = connection.cursor()
 
+            # readers in the other processes never block the writer
+            cursor.execute('PRAGMA journal_mode=WAL')
             try:
                 cursor.execute(self.TABLEDEF)
             except sqlite3.OperationalError:
                 cursor.execute('DROP TABLE identifiersha;')
                 cursor.execute(self.TABLEDEF)
+            for indexdef in self.INDEXDEFS:
+                cursor.execute(indexdef)
+        connection.close()
 
         logging.debug('initialize imagecache')
         self.cache.clear()
@@ -122,39 +235,35 @@ class ImageCache:
     def random_fetch(self, identifier, imagetype):
         ''' fetch a random row from a cache for the identifier '''
         normalidentifier = nowplaying.utils.normalize(identifier, sizecheck=0, nospaces=True)
-        data = None
         if not self.databasefile.exists():
             self.setup_sql()
             return None
 
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            try:
-                cursor.execute(
-                    '''SELECT * FROM identifiersha
- WHERE identifier=?
- AND imagetype=?
- AND cachekey NOT NULL
- ORDER BY random() LIMIT 1;''', (
-                        normalidentifier,
-                        imagetype,
-                    ))
-            except sqlite3.OperationalError as error:
-                self._log_sqlite_error(error)
-                return None
-
-            row = cursor.fetchone()
-            if not row:
-                return None
+        # pick by offset rather than ORDER BY random() so that
+        # only the index is walked
+        where = 'WHERE identifier=? AND imagetype=? AND cachekey NOT NULL'
+        try:
+            with self._db() as connection:
+                count = connection.execute(f'SELECT COUNT(*) FROM identifiersha {where}',
+                                           (normalidentifier, imagetype)).fetchone()[0]
+                if not count:
+                    return None
+                row = connection.execute(f'SELECT * FROM identifiersha {where} LIMIT 1 OFFSET ?',
+                                         (normalidentifier, imagetype,
+                                          random.randrange(count))).fetchone()
+        except sqlite3.OperationalError as error:
+            self._log_sqlite_error(error)
+            return None
 
-            data = {
-                'identifier': row['identifier'],
-                'cachekey': row['cachekey'],
-                'srclocation': row['srclocation'],
-            }
-            logging.debug('random got %s/%s/%s', imagetype, row['identifier'], row['cachekey'])
+        if not row:
+            return None
 
+        data = {
+            'identifier': row['identifier'],
+            'cachekey': row['cachekey'],
+            'srclocation': row['srclocation'],
+        }
+        logging.debug('random got %s/%s/%s', imagetype, row['identifier'], row['cachekey'])
         return data
 
     def random_image_fetch(self, identifier, imagetype):
@@ -178,24 +287,22 @@ class ImageCache:
             self.setup_sql()
             return None
 
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            try:
-                cursor.execute('''SELECT * FROM identifiersha WHERE srclocation=?''',
-                               (srclocation, ))
-            except sqlite3.OperationalError as error:
-                self._log_sqlite_error(error)
-                return None
-
-            if row := cursor.fetchone():
-                data = {
-                    'identifier': row['identifier'],
-                    'cachekey': row['cachekey'],
-                    'imagetype': row['imagetype'],
-                    'srclocation': row['srclocation'],
-                    'timestamp': row['timestamp']
-                }
+        try:
+            with self._db() as connection:
+                row = connection.execute('''SELECT * FROM identifiersha WHERE srclocation=?''',
+                                         (srclocation, )).fetchone()
+        except sqlite3.OperationalError as error:
+            self._log_sqlite_error(error)
+            return None
+
+        if row:
+            data = {
+                'identifier': row['identifier'],
+                'cachekey': row['cachekey'],
+                'imagetype': row['imagetype'],
+                'srclocation': row['srclocation'],
+                'timestamp': row['timestamp']
+            }
         return data
 
     def find_cachekey(self, cachekey):
@@ -206,22 +313,21 @@ class ImageCache:
             self.setup_sql()
             return None
 
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            try:
-                cursor.execute('''SELECT * FROM identifiersha WHERE cachekey=?''', (cachekey, ))
-            except sqlite3.OperationalError:
-                return None
+        try:
+            with self._db() as connection:
+                row = connection.execute('''SELECT * FROM identifiersha WHERE cachekey=?''',
+                                         (cachekey, )).fetchone()
+        except sqlite3.OperationalError:
+            return None
 
-            if row := cursor.fetchone():
-                data = {
-                    'identifier': row['identifier'],
-                    'cachekey': row['cachekey'],
-                    'srclocation': row['srclocation'],
-                    'imagetype': row['imagetype'],
-                    'timestamp': row['timestamp']
-                }
+        if row:
+            data = {
+                'identifier': row['identifier'],
+                'cachekey': row['cachekey'],
+                'srclocation': row['srclocation'],
+                'imagetype': row['imagetype'],
+                'timestamp': row['timestamp']
+            }
 
         return data
 
@@ -247,52 +353,31 @@ class ImageCache:
         logging.debug('Putting %s unfiltered for %s/%s', min(len(srclocationlist), maxart),
                       imagetype, identifier)
         normalidentifier = nowplaying.utils.normalize(identifier, sizecheck=0, nospaces=True)
-        for srclocation in random.sample(srclocationlist, min(len(srclocationlist), maxart)):
-            self.put_db_srclocation(identifier=normalidentifier,
-                                    imagetype=imagetype,
-                                    srclocation=srclocation)
+        self.put_db_srclocations(identifier=normalidentifier,
+                                 imagetype=imagetype,
+                                 srclocations=random.sample(srclocationlist,
+                                                            min(len(srclocationlist), maxart)))
 
     def get_next_dlset(self):
-        ''' update metadb '''
-
-        def dict_factory(cursor, row):
-            d = {}
-            for idx, col in enumerate(cursor.description):
-                d[col[0]] = row[idx]
-            return d
+        ''' everything still waiting to be downloaded, banners/logos/thumbs first '''
 
-        dataset = None
         if not self.databasefile.exists():
             logging.error('imagecache does not exist yet?')
             return None
 
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = dict_factory
-            cursor = connection.cursor()
-            try:
-                cursor.execute('''SELECT * FROM identifiersha WHERE cachekey IS NULL
- AND EXISTS (SELECT * FROM identifiersha
- WHERE imagetype='artistthumbnail' OR imagetype='artistbanner' OR imagetype='artistlogo')
- ORDER BY TIMESTAMP DESC''')
-            except sqlite3.OperationalError as error:
-                logging.error(error)
-                return None
-
-            dataset = cursor.fetchall()
-
-            if dataset:
-                logging.debug('banner/logo/thumbs found')
-                return dataset
-
-            try:
-                cursor.execute('''SELECT * FROM identifiersha WHERE cachekey IS NULL
-ORDER BY TIMESTAMP DESC''')
-            except sqlite3.OperationalError as error:
-                logging.error(error)
-                return None
-
-            dataset = cursor.fetchall()
+        try:
+            with self._db() as connection:
+                dataset = [
+                    dict(row) for row in connection.execute(
+                        '''SELECT * FROM identifiersha WHERE cachekey IS NULL
+ ORDER BY TIMESTAMP DESC''').fetchall()
+                ]
+        except sqlite3.OperationalError as error:
+            logging.error(error)
+            return None
 
+        dataset.sort(key=lambda row: not any(kind in row['imagetype']
+                                             for kind in ['thumbnail', 'banner', 'logo']))
         if dataset:
             logging.debug('artwork found')
         return dataset
@@ -315,34 +400,66 @@ ORDER BY TIMESTAMP DESC''')
                           imagetype)
             return False
 
-        if not cachekey:
-            cachekey = str(uuid.uuid4())
-
         if content:
-            image = nowplaying.utils.image2png(content)
-            self.cache[cachekey] = image
+            cachekey = self._store_content(content, cachekey)
+        elif not cachekey:
+            cachekey = str(uuid.uuid4())
 
         normalidentifier = nowplaying.utils.normalize(identifier, sizecheck=0, nospaces=True)
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-
-            sql = '''
+        sql = '''
 INSERT OR REPLACE INTO
  identifiersha(srclocation, identifier, cachekey, imagetype) VALUES(?, ?, ?, ?);
 '''
-            try:
-                cursor.execute(sql, (
+        try:
+            with self._db() as connection:
+                connection.execute(sql, (
                     srclocation,
                     normalidentifier,
                     cachekey,
                     imagetype,
                 ))
-            except sqlite3.OperationalError as error:
-                self._log_sqlite_error(error)
-                return False
+        except sqlite3.OperationalError as error:
+            self._log_sqlite_error(error)
+            return False
         return True
 
+    @staticmethod
+    def contentkey(content: bytes) -> str:
+        ''' key that identical images share, no matter where they came from '''
+        return f'sha256:{hashlib.sha256(content).hexdigest()}'
+
+    def find_content(self, contentkey: str) -> t.Optional[bytes]:
+        ''' the cached image for content with this contentkey, if it is still cached '''
+        if not (cachekey := self.cache.get(contentkey)):
+            return None
+        return self.cache.get(cachekey)
+
+    def _known_content(self, content: bytes) -> t.Optional[str]:
+        ''' cachekey of an identical image that is still cached '''
+        if (knownkey := self.cache.get(self.contentkey(content))) and knownkey in self.cache:
+            logging.debug('image already cached as %s', knownkey)
+            return knownkey
+        return None
+
+    def _store_content(self,
+                       content: bytes,
+                       cachekey: t.Optional[str] = None,
+                       image: t.Optional[bytes] = None) -> str:
+        ''' store an image, converting it to PNG (unless image is the
+            already converted version) only if this exact content is not
+            already in the cache.  returns its cachekey '''
+        if knownkey := self._known_content(content):
+            return knownkey
+
+        if not cachekey:
+            cachekey = str(uuid.uuid4())
+        if image is None:
+            image = nowplaying.utils.image2png(content)
+        self.cache[cachekey] = image
+        if image:
+            self.cache[self.contentkey(content)] = cachekey
+        return cachekey
+
     @staticmethod
     def _log_sqlite_error(error):
         """ extract the error bits """
@@ -353,33 +470,47 @@ INSERT OR REPLACE INTO
 
     def put_db_srclocation(self, identifier, srclocation, imagetype=None):
         ''' update metadb '''
+        self.put_db_srclocations(identifier, [srclocation], imagetype=imagetype)
+
+    def put_db_srclocations(self, identifier, srclocations, imagetype=None):
+        ''' add srclocations in one transaction and queue the new ones for download '''
 
         if not self.databasefile.exists():
             logging.error('imagecache does not exist yet?')
             return
 
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-
-            sql = '''
-INSERT INTO
+        sql = '''
+INSERT OR IGNORE INTO
 identifiersha(srclocation, identifier, imagetype)
 VALUES (?,?,?);
 '''
-            try:
-                cursor.execute(sql, (
-                    srclocation,
-                    identifier,
-                    imagetype,
-                ))
-            except sqlite3.IntegrityError as error:
-                if 'UNIQUE' in str(error):
-                    logging.debug('Duplicate srclocation (%s), ignoring', srclocation)
-                else:
-                    logging.error(error)
-            except sqlite3.OperationalError as error:
-                logging.error(error)
+        added = []
+        try:
+            with self._db() as connection:
+                connection.execute('BEGIN')
+                try:
+                    for srclocation in srclocations:
+                        if connection.execute(sql, (srclocation, identifier,
+                                                    imagetype)).rowcount:
+                            added.append(srclocation)
+                        else:
+                            logging.debug('Duplicate srclocation (%s), ignoring', srclocation)
+                    connection.execute('COMMIT')
+                except sqlite3.Error:
+                    connection.execute('ROLLBACK')
+                    raise
+        except sqlite3.Error as error:
+            logging.error(error)
+            return
+
+        queued = time.time()
+        for srclocation in added:
+            self.dlqueue.put({
+                'srclocation': srclocation,
+                'identifier': identifier,
+                'imagetype': imagetype,
+                'queued': queued
+            })
 
     def erase_srclocation(self, srclocation):
         ''' update metadb '''
@@ -389,13 +520,8 @@ VALUES (?,?,?);
             return
 
         logging.debug('Erasing %s', srclocation)
-        with sqlite3.connect(self.databasefile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = connection.cursor()
-            try:
-                cursor.execute('DELETE FROM identifiersha WHERE srclocation=?;', (srclocation, ))
-            except sqlite3.OperationalError:
-                return
+        with contextlib.suppress(sqlite3.OperationalError), self._db() as connection:
+            connection.execute('DELETE FROM identifiersha WHERE srclocation=?;', (srclocation, ))
 
     def erase_cachekey(self, cachekey):
         ''' update metadb '''
@@ -404,52 +530,89 @@ VALUES (?,?,?);
             self.setup_sql()
             return
 
-        data = self.find_cachekey(cachekey)
-        if not data:
+        # identical images share a cachekey, so there may be several
+        try:
+            with self._db() as connection:
+                rows = connection.execute(
+                    'SELECT identifier, imagetype, srclocation FROM identifiersha WHERE cachekey=?',
+                    (cachekey, )).fetchall()
+        except sqlite3.OperationalError as error:
+            self._log_sqlite_error(error)
             return
 
-        # It was retrieved once before so put it back in the queue
-        # if it fails in the queue, it will be deleted
-        logging.debug('Cache %s  srclocation %s has left cache, requeue it.', cachekey,
-                      data['srclocation'])
-        self.erase_srclocation(data['srclocation'])
-        self.put_db_srclocation(identifier=data['identifier'],
-                                imagetype=data['imagetype'],
-                                srclocation=data['srclocation'])
-        return
-
-    def image_dl(self, imagedict):
-        ''' fetch an image and store it '''
-        nowplaying.bootstrap.setuplogging(logdir=self.logpath, rotate=False)
-        threading.current_thread().name = 'ICFollower'
-        logging.getLogger('requests_cache').setLevel(logging.CRITICAL + 1)
-        logging.getLogger('aiosqlite').setLevel(logging.CRITICAL + 1)
-        session = requests_cache.CachedSession(str(self.httpcachefile))
+        for row in rows:
+            # It was retrieved once before so put it back in the queue
+            # if it fails in the queue, it will be deleted
+            logging.debug('Cache %s  srclocation %s has left cache, requeue it.', cachekey,
+                          row['srclocation'])
+            self.erase_srclocation(row['srclocation'])
+            self.put_db_srclocation(identifier=row['identifier'],
+                                    imagetype=row['imagetype'],
+                                    srclocation=row['srclocation'])
 
-        logging.debug("Downloading %s %s", imagedict['imagetype'], imagedict['srclocation'])
-        try:
-            headers = {
+    @staticmethod
+    async def _fetch_image(session: aiohttp.ClientSession,
+                           srclocation: str,
+                           hostlimit: t.Optional[asyncio.Semaphore] = None) -> t.Optional[bytes]:
+        ''' download with retries; None if it could not be fetched '''
+        for attempt in range(RETRIES):
+            if attempt:
+                await asyncio.sleep(BACKOFF * 2**(attempt - 1))
+            try:
+                async with hostlimit or contextlib.nullcontext():
+                    async with session.get(srclocation) as response:
+                        if response.status == 200:
+                            return await response.read()
+                        if response.status not in RETRYSTATUS:
+                            logging.error('image_dl: status_code %s', response.status)
+                            return None
+                        logging.debug('image_dl: status_code %s, retrying %s', response.status,
+                                      srclocation)
+            except (aiohttp.ClientError, asyncio.TimeoutError) as error:
+                logging.error('image_dl: %s %s', srclocation, error)
+        return None
+
+    @staticmethod
+    def _session(connections: int = 100) -> aiohttp.ClientSession:
+        return aiohttp.ClientSession(
+            headers={
                 'user-agent':
                 f'whatsnowplaying/{nowplaying.version.__VERSION__}'  #pylint: disable=no-member
                 ' +https://whatsnowplaying.github.io/'
-            }
-            dlimage = session.get(imagedict['srclocation'], timeout=5, headers=headers)
-        except Exception as error:  # pylint: disable=broad-except
-            logging.error('image_dl: %s %s', imagedict['srclocation'], error)
-            self.erase_srclocation(imagedict['srclocation'])
-            return
-        if dlimage.status_code == 200:
-            if not self.put_db_cachekey(identifier=imagedict['identifier'],
-                                        srclocation=imagedict['srclocation'],
-                                        imagetype=imagedict['imagetype'],
-                                        content=dlimage.content):
-                logging.error("db put failed")
-        else:
-            logging.error('image_dl: status_code %s', dlimage.status_code)
+            },
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=5, sock_read=5),
+            connector=aiohttp.TCPConnector(limit=connections))
+
+    async def image_dl(self,
+                       imagedict: dict,
+                       session: t.Optional[aiohttp.ClientSession] = None,
+                       pool: t.Optional[concurrent.futures.Executor] = None,
+                       hostlimit: t.Optional[asyncio.Semaphore] = None):
+        ''' fetch an image and store it. the PNG conversion runs in pool if given '''
+        if not session:
+            async with self._session() as newsession:
+                return await self.image_dl(imagedict,
+                                           session=newsession,
+                                           pool=pool,
+                                           hostlimit=hostlimit)
+
+        logging.debug("Downloading %s %s", imagedict['imagetype'], imagedict['srclocation'])
+        content = await self._fetch_image(session, imagedict['srclocation'], hostlimit)
+        if not content:
             self.erase_srclocation(imagedict['srclocation'])
-            return
+            return None
+
+        if not (cachekey := self._known_content(content)):
+            image = await asyncio.get_running_loop().run_in_executor(
+                pool, nowplaying.utils.image2png, content)
+            cachekey = self._store_content(content, image=image)
 
-        return
+        if not self.put_db_cachekey(identifier=imagedict['identifier'],
+                                    srclocation=imagedict['srclocation'],
+                                    imagetype=imagedict['imagetype'],
+                                    cachekey=cachekey):
+            logging.error("db put failed")
+        return None
 
     async def verify_cache_timer(self, stopevent):
         ''' run verify_cache periodically '''
@@ -479,7 +642,7 @@ VALUES (?,?,?);
                         srclocation = row['srclocation']
                         if srclocation == 'STOPWNP':
                             continue
-                        cachekeys[row['cachekey']] = srclocation
+                        cachekeys.setdefault(row['cachekey'], []).append(srclocation)
         except Exception as err:  # pylint: disable=broad-except
             logging.exception("Error: %s", err)
 
@@ -490,67 +653,116 @@ VALUES (?,?,?);
 
         count = startsize
         # making this two separate operations unlocks the DB
-        for key, srclocation in cachekeys.items():
+        for key, srclocations in cachekeys.items():
             try:
                 image = self.cache[key]  # pylint: disable=unused-variable
             except KeyError:
                 count -= 1
-                logging.debug('%s/%s expired', key, srclocation)
-                self.erase_srclocation(srclocation)
+                for srclocation in srclocations:
+                    logging.debug('%s/%s expired', key, srclocation)
+                    self.erase_srclocation(srclocation)
         logging.debug('Finished image cache verification: %s/%s images', count, startsize)
 
-    def queue_process(self, logpath, maxworkers=5):
+    @staticmethod
+    def _dl_priority(entry: dict, current: t.Optional[str]) -> tuple:
+        ''' sort key for pending downloads: the current identifier first,
+            then thumbnails/logos/banners before fanart, then newest first '''
+        return (entry['identifier'] != current,
+                not any(kind in (entry['imagetype'] or '') for kind in ['thumb', 'logo', 'banner']),
+                -entry.get('queued', 0))
+
+    def _next_dlqueue(self, timeout: float) -> list[t.Optional[dict | str]]:
+        ''' wait for anything on the download queue, then drain it '''
+        try:
+            entries = [self.dlqueue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        with contextlib.suppress(queue.Empty):
+            while True:
+                entries.append(self.dlqueue.get_nowait())
+        return entries
+
+    def queue_process(self, logpath, maxworkers=5, hostlimits: t.Optional[dict[str, int]] = None):
         ''' Process to download stuff in the background to avoid the GIL '''
 
         threading.current_thread().name = 'ICQueue'
         nowplaying.bootstrap.setuplogging(logdir=logpath, rotate=False)
         self.logpath = logpath
-        self.erase_srclocation('STOPWNP')
-        endloop = False
-        oldset = []
-        with concurrent.futures.ProcessPoolExecutor(max_workers=maxworkers) as executor:
-            while not endloop and not self.stopevent.is_set():
-                if dataset := self.get_next_dlset():
-                    # sometimes images are downloaded but not
-                    # written to sql yet so don't try to resend
-                    # same data
-                    newset = []
-                    newdataset = []
-                    for entry in dataset:
-                        newset.append({
-                            'srclocation': entry['srclocation'],
-                            'time': int(time.time())
-                        })
-                        if entry['srclocation'] == 'STOPWNP':
-                            endloop = True
-                            break
-                        oldcopy = oldset
-                        for oldentry in oldcopy:
-                            if int(time.time()) - oldentry['time'] > 180:
-                                oldset.remove(oldentry)
-                                logging.debug('removing %s from the previously processed queue',
-                                              oldentry['srclocation'])
-                        if all(u['srclocation'] != entry['srclocation'] for u in oldset):
-                            logging.debug('skipping in-progress srclocation %s ',
-                                          entry['srclocation'])
-                        else:
-                            newdataset.append(entry)
-                    oldset = newset
-
-                    if endloop:
-                        break
-
-                    executor.map(self.image_dl, newdataset)
-                time.sleep(2)
-                if not self.databasefile.exists():
-                    self.setup_sql()
-
+        asyncio.run(self._download_queue(maxworkers, HOSTLIMITS | (hostlimits or {})))
         logging.debug('stopping download processes')
-        self.erase_srclocation('STOPWNP')
+
+    async def _download_queue(self, maxworkers: int, hostlimits: dict[str, int]):
+        ''' download everything that shows up on dlqueue, maxworkers at a time '''
+        loop = asyncio.get_running_loop()
+
+        pending: dict[str, dict] = {}
+        inflight: dict[str, asyncio.Task] = {}
+        lastpoll = 0.0
+        semaphores: dict[str, asyncio.Semaphore] = {}
+        current = None
+        getter = None
+
+        def hostlimit(srclocation: str) -> asyncio.Semaphore:
+            host = (urllib.parse.urlparse(srclocation).hostname or '').lower()
+            domain = next((domain for domain in hostlimits
+                           if host == domain or host.endswith(f'.{domain}')), host)
+            if domain not in semaphores:
+                semaphores[domain] = asyncio.Semaphore(hostlimits.get(domain, DEFAULTHOSTLIMIT))
+            return semaphores[domain]
+
+        async with self._session(connections=maxworkers) as session:
+            with concurrent.futures.ProcessPoolExecutor(max_workers=CONVERTWORKERS) as pool:
+                while not self.stopevent.is_set():
+                    if not getter:
+                        getter = loop.run_in_executor(None, self._next_dlqueue, 1)
+                    done, _ = await asyncio.wait({getter, *inflight.values()},
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    for srclocation, task in list(inflight.items()):
+                        if task in done:
+                            del inflight[srclocation]
+                            if error := task.exception():
+                                logging.error('image_dl %s failed: %s', srclocation, error)
+
+                    if getter in done:
+                        entries = getter.result()
+                        getter = None
+                        if STOPMARKER in entries:
+                            break
+                        for entry in entries:
+                            if not entry:
+                                continue
+                            current = entry['identifier']
+                            if entry['srclocation'] not in inflight:
+                                pending.setdefault(entry['srclocation'], entry)
+
+                    # anything left over from a previous run or queued
+                    # by an ImageCache in another process
+                    if time.monotonic() - lastpoll >= DBPOLL:
+                        lastpoll = time.monotonic()
+                        for entry in self.get_next_dlset() or []:
+                            if entry['srclocation'] not in inflight:
+                                pending.setdefault(entry['srclocation'], entry)
+
+                    while pending and len(inflight) < maxworkers:
+                        entry = min(pending.values(),
+                                    key=functools.partial(self._dl_priority, current=current))
+                        del pending[entry['srclocation']]
+                        inflight[entry['srclocation']] = loop.create_task(
+                            self.image_dl(entry,
+                                          session=session,
+                                          pool=pool,
+                                          hostlimit=hostlimit(entry['srclocation'])))
+
+                    if not self.databasefile.exists():
+                        self.setup_sql()
+
+                if inflight:
+                    await asyncio.wait(inflight.values())
 
     def stop_process(self):
         ''' stop the bg ImageCache process'''
         logging.debug('imagecache stop_process called')
-        self.put_db_srclocation('STOPWNP', 'STOPWNP', imagetype='STOPWNP')
+        self.dlqueue.put(STOPMARKER)
         self.cache.close()
+        self.close()
         logging.debug('WNP should be set')
@@ -2,11 +2,13 @@
 ''' djuced support '''
 
 import asyncio
+import collections
 import logging
+import os
 import pathlib
+import threading
 
 import sqlite3
-import aiosqlite
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
 from watchdog.events import PatternMatchingEventHandler
@@ -17,6 +19,9 @@ from nowplaying.exceptions import PluginVerifyError
 from nowplaying.inputs import InputPlugin
 import nowplaying.utils
 
+# how many (album, artist, title) lookups to remember
+LOOKUPCACHESIZE = 128
+
 
 class Plugin(InputPlugin):  # pylint: disable=too-many-instance-attributes
     ''' handler for NowPlaying '''
@@ -33,6 +38,13 @@ class Plugin(InputPlugin):  # pylint: disable=too-many-instance-attributes
         self.djuceddir = ''
         self._reset_meta()
         self.tasks = set()
+        self.connection = None
+        self.connectionfile = None
+        self.dblock = threading.RLock()
+        self.lookups: collections.OrderedDict[tuple[str, str, str],
+                                              dict] = collections.OrderedDict()
+        # DJUCED.db (and its WAL) as of the lookups above
+        self.lookupsidentity = None
 
     def install(self):
         ''' locate Virtual DJ '''
@@ -124,37 +136,96 @@ class Plugin(InputPlugin):  # pylint: disable=too-many-instance-attributes
                 return deck
         return None
 
-    async def _try_db(self, deck):
-        metadata = {}
+    @staticmethod
+    def _connect(dbfile):
+        ''' read-only connection to DJUCED.db
+
+            DJUCED keeps writing to its db while running, so immutable is only
+            used when nothing can write to the file anyway '''
+        uri = f'{dbfile.as_uri()}?mode=ro'
+        if not os.access(dbfile, os.W_OK):
+            uri += '&immutable=1'
+        connection = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=False)
+        connection.row_factory = sqlite3.Row
+        return connection
+
+    def _close(self):
+        ''' drop the db connection and anything read through it '''
+        with self.dblock:
+            if self.connection:
+                self.connection.close()
+            self.connection = None
+            self.connectionfile = None
+            self.lookups.clear()
+            self.lookupsidentity = None
+
+    def _query(self, sql, params):
+        ''' run sql against DJUCED.db on the long-lived connection '''
         dbfile = pathlib.Path(self.djuceddir).joinpath('DJUCED.db')
-        sql = ('SELECT  artist, comment, coverimage, title, bpm, tracknumber, length, absolutepath '
-               'FROM tracks WHERE album=? AND artist=? AND title=? '
-               'ORDER BY last_played')
-        async with aiosqlite.connect(dbfile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = await connection.cursor()
-            params = (
-                Plugin.decktracker[deck]['album'],
-                Plugin.decktracker[deck]['artist'],
-                Plugin.decktracker[deck]['title'],
-            )
-            await cursor.execute(sql, params)
-            row = await cursor.fetchone()
-            await connection.commit()
-
-            if row:
-                metadata = {
-                    'artist': str(row['artist']),
-                    'comment': str(row['comment']),
-                    'title': str(row['title']),
-                    'bpm': str(row['bpm']),
-                    'tracknumber': str(row['tracknumber']),
-                    'duration': str(row['length']),
-                    'filename': str(row['absolutepath']),
-                }
-                if row['coverimage']:
-                    metadata['rawcoverimage'] = nowplaying.utils.image2png(row['coverimage'])
-        return metadata
+        if not dbfile.exists():
+            return None
+        with self.dblock:
+            try:
+                if not self.connection or self.connectionfile != dbfile:
+                    if self.connection:
+                        self.connection.close()
+                    self.lookups.clear()
+                    self.connection = self._connect(dbfile)
+                    self.connectionfile = dbfile
+                return self.connection.execute(sql, params).fetchone()
+            except sqlite3.Error as error:
+                logging.error('DJUCED.db query failed: %s', error)
+                if self.connection:
+                    self.connection.close()
+                self.connection = None
+                return None
+
+    def _lookup(self, params):
+        ''' (album, artist, title) -> metadata, including the converted cover '''
+        dbfile = pathlib.Path(self.djuceddir).joinpath('DJUCED.db')
+        identity = tuple(
+            nowplaying.utils.file_identity(f'{dbfile}{suffix}') for suffix in ('', '-wal'))
+        with self.dblock:
+            if identity != self.lookupsidentity:
+                # DJUCED wrote to its db, so anything remembered may be stale
+                self.lookups.clear()
+                self.lookupsidentity = identity
+            if params in self.lookups:
+                self.lookups.move_to_end(params)
+                return self.lookups[params].copy()
+
+            sql = ('SELECT  artist, comment, coverimage, title, bpm, tracknumber, length, '
+                   'absolutepath FROM tracks WHERE album=? AND artist=? AND title=? '
+                   'ORDER BY last_played')
+            row = self._query(sql, params)
+            if not row:
+                return {}
+
+            metadata = {
+                'artist': str(row['artist']),
+                'comment': str(row['comment']),
+                'title': str(row['title']),
+                'bpm': str(row['bpm']),
+                'tracknumber': str(row['tracknumber']),
+                'duration': str(row['length']),
+                'filename': str(row['absolutepath']),
+            }
+            if row['coverimage']:
+                metadata['coverimageraw'] = nowplaying.utils.image2png(row['coverimage'])
+
+            self.lookups[params] = metadata
+            while len(self.lookups) > LOOKUPCACHESIZE:
+                self.lookups.popitem(last=False)
+            return metadata.copy()
+
+    async def _try_db(self, deck):
+        params = (
+            Plugin.decktracker[deck]['album'],
+            Plugin.decktracker[deck]['artist'],
+            Plugin.decktracker[deck]['title'],
+        )
+        # the query and the PNG conversion both stay off the event loop
+        return await asyncio.to_thread(self._lookup, params)
 
     # async def _try_songxml(self, deck):
     #     filename = None
@@ -198,22 +269,17 @@ class Plugin(InputPlugin):  # pylint: disable=too-many-instance-attributes
 
     async def getrandomtrack(self, playlist):
         ''' get a random track '''
-        dbfile = pathlib.Path(self.djuceddir).joinpath('DJUCED.db')
         sql = 'SELECT data FROM playlist2 WHERE name=? and type=3 ORDER BY random() LIMIT 1'
-        async with aiosqlite.connect(dbfile, timeout=30) as connection:
-            connection.row_factory = sqlite3.Row
-            cursor = await connection.cursor()
-            await cursor.execute(sql, (playlist, ))
-            row = await cursor.fetchone()
-            await connection.commit()
-            if not row:
-                return None
+        row = await asyncio.to_thread(self._query, sql, (playlist, ))
+        if not row:
+            return None
 
-            return row['filename']
+        return row['data']
 
     async def stop(self):
         ''' stop the m3u plugin '''
         self._reset_meta()
+        self._close()
         if self.observer:
             self.observer.stop()
             self.observer.join()
@@ -22,6 +22,13 @@ EXTVDJ_TITLE_RE = re.compile(r'.*<title>(.+)</title>.*')
 EXTVDJ_ARTIST_RE = re.compile(r'.*<artist>(.+)</artist>.*')
 EXTVDJ_REMIX_RE = re.compile(r'.*<remix>(.+)</remix>.*')
 
+# how much to read at a time when scanning backwards from the end of a file
+TAILBLOCK = 64 * 1024
+
+# bytes before the saved offset that must still match for a file to be
+# considered appended to rather than rewritten
+SIGNATURESIZE = 256
+
 # https://datatracker.ietf.org/doc/html/rfc8216
 
 
@@ -41,6 +48,7 @@ class Plugin(InputPlugin):
         self.mixmode = "newest"
         self.event_handler = None
         self.observer = None
+        self.tails = {}
         self._reset_meta()
 
     def install(self):
@@ -132,20 +140,89 @@ class Plugin(InputPlugin):
                     metadata['title'] += f' ({remix})'
         return metadata
 
-    def _read_full_file(self, filename):
-        ''' read the entire content of a file '''
-        content = []
-        with open(filename, 'rb') as m3ufh:
-            while True:
-                newline = m3ufh.readline()
-                if not newline:
+    @staticmethod
+    def _line_kind(line):
+        ''' ('extvdj', decoded line), ('file', line), or (None, None) for anything else '''
+        with contextlib.suppress(Exception):
+            decoded = line.decode('utf-8')
+            if '#EXTVDJ' in decoded:
+                return 'extvdj', decoded
+        if not line or line[0] == ord('#'):
+            return None, None
+        return 'file', line
+
+    @staticmethod
+    def _complete_end(m3ufh, size):
+        ''' offset just past the last newline; anything after it is still being written '''
+        position = size
+        while position > 0:
+            blocksize = min(TAILBLOCK, position)
+            position -= blocksize
+            m3ufh.seek(position)
+            if (newline := m3ufh.read(blocksize).rfind(b'\n')) >= 0:
+                return position + newline + 1
+        return 0
+
+    @staticmethod
+    def _reverse_lines(m3ufh, end):
+        ''' yield the lines before end, last one first '''
+        position = end
+        pending = b''
+        while position > 0:
+            blocksize = min(TAILBLOCK, position)
+            position -= blocksize
+            m3ufh.seek(position)
+            lines = (m3ufh.read(blocksize) + pending).split(b'\n')
+            pending = lines.pop(0)
+            for line in reversed(lines):
+                yield line.rstrip()
+        yield pending.rstrip()
+
+    @staticmethod
+    def _signature(m3ufh, offset):
+        ''' the bytes just before offset '''
+        start = max(0, offset - SIGNATURESIZE)
+        m3ufh.seek(start)
+        return m3ufh.read(offset - start)
+
+    def _tail(self, m3ufh, filename, size):
+        ''' find the last track and #EXTVDJ lines, only reading what is new
+
+            appended bytes are read forward from the last complete line seen,
+            leaving a trailing line without a newline for the next event.
+            otherwise (first look, truncated, or rewritten) the file is scanned
+            backwards from the very end until both have been found. the offset
+            still stops at the last newline, so if that trailing line was only
+            partly written, the next event reads it again. '''
+        state = self.tails.get(filename)
+        if state and (state['offset'] > size
+                      or self._signature(m3ufh, state['offset']) != state['signature']):
+            state = None
+
+        if state:
+            m3ufh.seek(state['offset'])
+            data = m3ufh.read(size - state['offset'])
+            complete = data.rfind(b'\n') + 1
+            for line in data[:complete].split(b'\n'):
+                kind, value = self._line_kind(line.rstrip())
+                if kind:
+                    state[f'track{kind}'] = value
+            state['offset'] += complete
+        else:
+            state = {'trackfile': None, 'trackextvdj': None}
+            state['offset'] = self._complete_end(m3ufh, size)
+            for line in self._reverse_lines(m3ufh, size):
+                kind, value = self._line_kind(line)
+                if kind == 'extvdj' and not state['trackextvdj']:
+                    state['trackextvdj'] = value
+                elif kind == 'file' and not state['trackfile']:
+                    state['trackfile'] = value
+                if state['trackfile'] and state['trackextvdj']:
                     break
-                newline = newline.rstrip()
-                if not newline:
-                    continue
-                if audiofilename := self._verify_file(filename, newline):
-                    content.append(audiofilename)
-        return content
+
+        state['signature'] = self._signature(m3ufh, state['offset'])
+        self.tails[filename] = state
+        return state
 
     def _read_track(self, event):
 
@@ -157,26 +234,17 @@ class Plugin(InputPlugin):
                       filename)
 
         # file is empty so ignore it
-        if os.stat(filename).st_size == 0:
+        size = os.stat(filename).st_size
+        if size == 0:
             logging.debug('%s is empty, ignoring for now.', filename)
+            self.tails.pop(filename, None)
             self._reset_meta()
             return
 
-        trackfile = None
-        trackextvdj = None
         with open(filename, 'rb') as m3ufh:
-            while True:
-                newline = m3ufh.readline()
-                if not newline:
-                    break
-                newline = newline.rstrip()
-                with contextlib.suppress(Exception):
-                    if '#EXTVDJ' in newline.decode('utf-8'):
-                        trackextvdj = newline.decode('utf-8')
-                        continue
-                if not newline or newline[0] == '#':
-                    continue
-                trackfile = newline
+            state = self._tail(m3ufh, filename, size)
+        trackfile = state['trackfile']
+        trackextvdj = state['trackextvdj']
 
         logging.debug('attempting to parse \'%s\' with various encodings', trackfile)
 
@@ -7,15 +7,20 @@
 
  '''
 
+import asyncio
 import collections
+import concurrent.futures
 import logging
 import pathlib
 import sys
 import urllib
-import urllib.request
+import urllib.parse
+
+import aiohttp
 
 try:
-    import dbus
+    from dbus_next.aio import MessageBus
+    from dbus_next.errors import DBusError, InterfaceNotFoundError
     DBUS_STATUS = True
 except ImportError:
     DBUS_STATUS = False
@@ -24,77 +29,154 @@ from PySide6.QtCore import Qt  # pylint: disable=no-name-in-module
 from nowplaying.inputs import InputPlugin
 
 MPRIS2_BASE = 'org.mpris.MediaPlayer2'
+MPRIS2_PATH = '/org/mpris/MediaPlayer2'
+
+DBUS_NAME = 'org.freedesktop.DBus'
+DBUS_PATH = '/org/freedesktop/DBus'
+
+ARTTIMEOUT = 5
+
 
+def _blank():
+    ''' start with a blank slate to prevent data bleeding '''
+    return {'artist': None, 'title': None, 'filename': None}
 
-class MPRIS2Handler():
-    ''' Read metadata from MPRIS2 '''
+
+class MPRIS2Handler():  # pylint: disable=too-many-instance-attributes
+    ''' Read metadata from MPRIS2
+
+        the player's Metadata is kept in a local snapshot that is updated
+        from PropertiesChanged signals, so getplayingtrack() never goes
+        to the bus.  the service is (re-)subscribed whenever its name
+        appears on the bus. '''
 
     def __init__(self, service=None):
-        self.service = None
+        self.service = service
         self.bus = None
-        self.proxy = None
+        self.daemon = None
+        self.busname = None
+        self.properties = None
+        self.meta = None
+        self.metadata = _blank()
+        self.arturl = None
+        self.artdata = None
+        self.arttask = None
+        self.tasks = set()
+        self.dbus_status = DBUS_STATUS
+
+    def _spawn(self, coro):
+        ''' run coro in the background, keeping a reference until it is done '''
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    async def _connect_bus(self):
+        ''' connect to the session bus and watch for services coming and going '''
+        if self.bus and self.bus.connected:
+            return
+        self.bus = await MessageBus().connect()
+        introspection = await self.bus.introspect(DBUS_NAME, DBUS_PATH)
+        self.daemon = self.bus.get_proxy_object(DBUS_NAME, DBUS_PATH,
+                                                introspection).get_interface(DBUS_NAME)
+        self.daemon.on_name_owner_changed(self._on_name_owner_changed)
+
+    def _ismyservice(self, busname):
+        ''' does busname belong to the configured service? '''
+        if not self.service or not busname.startswith(f'{MPRIS2_BASE}.'):
+            return False
+        if self.busname:
+            return busname == self.busname
+        name = busname.replace(f'{MPRIS2_BASE}.', '')
+        if '.' in self.service:
+            return name == self.service
+        return self.service in name
+
+    def _on_name_owner_changed(self, busname, oldowner, newowner):
+        ''' the service started or went away '''
+        if not self._ismyservice(busname):
+            return
+        if newowner:
+            logging.debug('%s appeared on the bus as %s', busname, newowner)
+            self._spawn(self._subscribe(busname))
+        else:
+            logging.debug('%s (%s) left the bus', busname, oldowner)
+            self._unsubscribe()
+
+    def _unsubscribe(self):
+        ''' stop listening to the current service '''
+        if self.properties:
+            self.properties.off_properties_changed(self._on_properties_changed)
+        self.properties = None
+        self.busname = None
         self.meta = None
-        self.metadata = None
+        self.metadata = _blank()
 
-        if not DBUS_STATUS:
-            self.dbus_status = False
+    async def _subscribe(self, busname):
+        ''' listen for PropertiesChanged from busname and take a first snapshot '''
+        self._unsubscribe()
+        try:
+            introspection = await self.bus.introspect(busname, MPRIS2_PATH)
+            proxy = self.bus.get_proxy_object(busname, MPRIS2_PATH, introspection)
+            properties = proxy.get_interface('org.freedesktop.DBus.Properties')
+            properties.on_properties_changed(self._on_properties_changed)
+            self.properties = properties
+            self.busname = busname
+            allprops = await properties.call_get_all(f'{MPRIS2_BASE}.Player')
+        except (DBusError, InterfaceNotFoundError) as error:
+            logging.error('Cannot subscribe to %s: %s', busname, error)
+            self._unsubscribe()
             return
+        if metadata := allprops.get('Metadata'):
+            self._update(metadata.value)
 
-        self.dbus_status = True
+    def _on_properties_changed(self, interface, changed, invalidated):
+        ''' the player sent new properties '''
+        if interface != f'{MPRIS2_BASE}.Player':
+            return
+        if metadata := changed.get('Metadata'):
+            self._update(metadata.value)
+        elif 'Metadata' in invalidated and self.busname:
+            self._spawn(self._subscribe(self.busname))
 
-        if service:
-            self.resetservice(service)
+    async def list_services(self):
+        ''' list of all MPRIS2 services '''
+        if not self.dbus_status:
+            return []
+        await self._connect_bus()
+        return [
+            name.replace(f'{MPRIS2_BASE}.', '') for name in await self.daemon.call_list_names()
+            if name.startswith(f'{MPRIS2_BASE}.')
+        ]
 
-    def resetservice(self, service=None):
+    async def resetservice(self, service=None):
         ''' reset the service name '''
         self.service = service
-
-        if '.' not in service and not self.find_service():
-            logging.error('%s is not a known MPRIS2 service.', service)
+        self._unsubscribe()
+        if not self.dbus_status or not service:
             return
 
-        self.bus = dbus.SessionBus()
         try:
-            self.proxy = self.bus.get_object(f'{MPRIS2_BASE}.{self.service}',
-                                             '/org/mpris/MediaPlayer2')
-        except dbus.exceptions.DBusException as error:
-            logging.error(error)
-
-        self.meta = None
-        self.metadata = {}
-
-    def getplayingtrack(self):  # pylint: disable=too-many-branches
-        ''' get the currently playing song '''
-
-        # start with a blank slate to prevent
-        # data bleeding
-        builddata = {'artist': None, 'title': None, 'filename': None}
-        if not DBUS_STATUS:
-            return builddata
-
-        artist = None
+            await self._connect_bus()
+            services = await self.list_services()
+        except (DBusError, OSError, ValueError) as error:
+            logging.error('Cannot connect to the session bus: %s', error)
+            self.bus = None
+            return
 
-        # if NowPlaying is launched before our service...
-        if not self.proxy:
-            self.resetservice(self.service)
-        if not self.proxy:
-            logging.error('Unknown service: %s', self.service)
-            return builddata
+        for name in services:
+            if self._ismyservice(f'{MPRIS2_BASE}.{name}'):
+                await self._subscribe(f'{MPRIS2_BASE}.{name}')
+                return
 
-        properties = dbus.Interface(self.proxy, dbus_interface='org.freedesktop.DBus.Properties')
-        if not properties:
-            logging.error('Unknown service: %s', self.service)
-            return builddata
+        # if NowPlaying is launched before our service, NameOwnerChanged
+        # will subscribe once it shows up
+        logging.error('%s is not a known MPRIS2 service.', service)
 
-        try:
-            self.meta = properties.GetAll(f'{MPRIS2_BASE}.Player')['Metadata']
-        except dbus.exceptions.DBusException as error:
-            # likely had a service and but now it is gone
-            logging.error(error)
-            self.metadata = {}
-            self.proxy = None
-            self.bus = None
-            return builddata
+    def _update(self, meta):
+        ''' convert MPRIS2 Metadata into our metadata '''
+        self.meta = {key: value.value for key, value in meta.items()}
+        builddata = _blank()
 
         if artists := self.meta.get('xesam:artist'):
             artists = collections.deque(artists)
@@ -127,44 +209,72 @@ class MPRIS2Handler():
         # if it doesn't have one. We need to avoid that.
         if title == filename or title and pathlib.Path(title).exists():
             builddata['title'] = None
-            title = None
-
-        # it looks like there is a race condition in mixxx
-        # probably should make this an option in the MPRIS2
-        # handler but for now just comment it out
-        # arturl = self.meta.get('mpris:artUrl')
-        # if arturl:
-        #     with urllib.request.urlopen(arturl) as coverart:
-        #         builddata['coverimageraw'] = coverart.read()
-        self.metadata = builddata
-        return self.metadata
 
-    def get_mpris2_services(self):
-        ''' list of all MPRIS2 services '''
+        arturl = self.meta.get('mpris:artUrl')
+        self.arttask = None
+        if arturl and arturl == self.arturl and self.artdata:
+            builddata['coverimageraw'] = self.artdata
+        elif arturl:
+            self.arttask = self._spawn(self._fetch_art(arturl, builddata))
+        self.metadata = builddata
 
-        if not self.dbus_status:
-            return []
+    async def _fetch_art(self, arturl, builddata):
+        ''' download the cover art and attach it to the track it was for '''
+        try:
+            if arturl.startswith('file://'):
+                artpath = pathlib.Path(urllib.parse.unquote(arturl.replace('file://', '')))
+                artdata = await asyncio.to_thread(artpath.read_bytes)
+            else:
+                timeout = aiohttp.ClientTimeout(total=ARTTIMEOUT)
+                async with aiohttp.ClientSession(timeout=timeout) as session:
+                    async with session.get(arturl) as response:
+                        response.raise_for_status()
+                        artdata = await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError, OSError, ValueError) as error:
+            logging.debug('Cannot fetch %s: %s', arturl, error)
+            return
 
-        services = []
-        bus = dbus.SessionBus()
-        for reglist in bus.list_names():
-            if reglist.startswith(MPRIS2_BASE):
-                stripped = reglist.replace(f'{MPRIS2_BASE}.', '')
-                services.append(stripped)
-        return services
+        self.arturl = arturl
+        self.artdata = artdata
+        builddata['coverimageraw'] = artdata
 
-    def find_service(self):
-        ''' try to find our service '''
+    async def getplayingtrack(self):
+        ''' get the currently playing song.  if its cover art is still being
+            fetched, wait for it so that the art is part of the first
+            snapshot of this track that gets published '''
+        if self.arttask and not self.arttask.done():
+            await asyncio.wait({self.arttask}, timeout=ARTTIMEOUT)
+        return self.metadata.copy()
 
+    def get_mpris2_services(self):
+        ''' list of all MPRIS2 services, for callers outside of an event loop '''
         if not self.dbus_status:
-            return False
+            return []
 
-        services = self.get_mpris2_services()
-        for reglist in services:
-            if self.service in reglist:
-                self.service = reglist
-                return True
-        return False
+        async def listservices():
+            handler = MPRIS2Handler()
+            try:
+                return await handler.list_services()
+            finally:
+                handler.close()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as pool:
+            try:
+                return pool.submit(asyncio.run, listservices()).result()
+            except (DBusError, OSError, ValueError) as error:
+                logging.error('Cannot list MPRIS2 services: %s', error)
+                return []
+
+    def close(self):
+        ''' drop the bus connection '''
+        for task in self.tasks:
+            task.cancel()
+        self.arttask = None
+        self._unsubscribe()
+        if self.bus:
+            self.bus.disconnect()
+        self.bus = None
+        self.daemon = None
 
 
 class Plugin(InputPlugin):
@@ -189,7 +299,7 @@ class Plugin(InputPlugin):
         ''' Auto-install for MPRIS2 '''
         return False
 
-    def gethandler(self):
+    async def gethandler(self):
         ''' setup the MPRIS2Handler for this session '''
 
         if not self.mpris2 or not self.dbus_status:
@@ -199,6 +309,7 @@ class Plugin(InputPlugin):
 
         if not sameservice:
             self.service = None
+            self.mpris2.close()
             self.mpris2 = None
             return
 
@@ -207,25 +318,31 @@ class Plugin(InputPlugin):
 
         logging.debug('new service = %s', sameservice)
         self.service = sameservice
-        self.mpris2.resetservice(service=sameservice)
+        await self.mpris2.resetservice(service=sameservice)
         return
 
     async def start(self):
         ''' configure MPRIS2 client '''
-        self.gethandler()
+        await self.gethandler()
 
     async def getplayingtrack(self):
         ''' wrapper to call getplayingtrack '''
-        self.gethandler()
+        await self.gethandler()
 
         if self.mpris2:
-            return self.mpris2.getplayingtrack()
+            return await self.mpris2.getplayingtrack()
         return {}
 
     async def getrandomtrack(self, playlist):
         ''' not supported '''
         return None
 
+    async def stop(self):
+        ''' drop the bus connection '''
+        if self.mpris2:
+            self.mpris2.close()
+        self.service = None
+
     def load_settingsui(self, qwidget):
         ''' populate the combobox '''
         if not self.dbus_status or not self.mpris2:
@@ -261,20 +378,23 @@ def main():
     if not DBUS_STATUS:
         print('No dbus')
         sys.exit(1)
-    mpris2 = MPRIS2Handler()
-
-    if len(sys.argv) == 2:
-        mpris2.resetservice(sys.argv[1])
-        (artist, title, filename) = mpris2.getplayingtrack()
-        print(f'Artist: {artist} | Title: {title} | Filename: {filename}')
-        data = mpris2.getplayingtrack()
-        if 'coverimageraw' in data:
-            print('Got coverart')
-            del data['coverimageraw']
-        print(data)
-    else:
-
-        print(mpris2.get_mpris2_services())
+
+    async def run():
+        mpris2 = MPRIS2Handler()
+        if len(sys.argv) == 2:
+            await mpris2.resetservice(sys.argv[1])
+            data = await mpris2.getplayingtrack()
+            print(f'Artist: {data["artist"]} | Title: {data["title"]} | '
+                  f'Filename: {data["filename"]}')
+            if 'coverimageraw' in data:
+                print('Got coverart')
+                del data['coverimageraw']
+            print(data)
+        else:
+            print(await mpris2.list_services())
+        mpris2.close()
+
+    asyncio.run(run())
 
 
 if __name__ == "__main__":
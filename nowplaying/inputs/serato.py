@@ -12,11 +12,12 @@ import re
 import pathlib
 import random
 import struct
+import threading
 import time
 
 import aiofiles
+import aiohttp
 import lxml.html
-import requests
 
 from watchdog.observers import Observer
 from watchdog.observers.polling import PollingObserver
@@ -31,9 +32,15 @@ from nowplaying.exceptions import PluginVerifyError
 # when in local mode, these are shared variables between threads
 LASTPROCESSED = 0
 PARSEDSESSIONS = []
+# deck -> most recently started played adat, kept up to date as
+# new adats are appended to the session file
+DECKADATS = {}
 
 TIDAL_FORMAT = re.compile('^_(.*).tdl')
 
+# how long to wait for a session file update before re-checking anyway
+LOCALWAIT = 1.0
+
 
 class SeratoCrateReader:
     ''' read a Serato crate (not smart crate) -
@@ -171,6 +178,12 @@ class SeratoSessionReader:
 
         self.sessiondata = []
 
+        # incremental state: which file, how far into it has been decoded
+        self.filename = None
+        self.offset = 0
+        self.mtime_ns = None
+        self.lock = threading.Lock()
+
     def _decode_adat(self, data):
         ret = {}
         #i = 0
@@ -252,6 +265,60 @@ class SeratoSessionReader:
         async with aiofiles.open(filename, 'rb') as sessionfhin:
             self.sessiondata.extend(self._datadecode(await sessionfhin.read()))
 
+    def _decode_chunks(self, data):
+        ''' decode all of the complete top-level chunks in data
+
+            returns the chunks and how many bytes they used; a chunk
+            still being written is left for next time
+        '''
+        ret = []
+        i = 0
+        while i + 8 <= len(data):
+            length = struct.unpack('>I', data[i + 4:i + 8])[0]
+            if i + 8 + length > len(data):
+                break
+            tag = data[i:i + 4].decode('ascii')
+            ret.append((tag, self._datadecode(data[i + 8:i + 8 + length], tag=tag)))
+            i += 8 + length
+        return ret, i
+
+    async def loadnewsessiondata(self, filename):
+        ''' decode only what was appended to filename since the last call
+
+            returns (new adats, reset) where reset means the file shrank,
+            was rewritten, or a different file was given so everything
+            was decoded from scratch
+        '''
+        filename = pathlib.Path(filename)
+        stat = filename.stat()
+        with self.lock:
+            reset = (filename != self.filename or stat.st_size < self.offset
+                     or (stat.st_size == self.offset and stat.st_mtime_ns != self.mtime_ns))
+            offset = 0 if reset else self.offset
+
+        async with aiofiles.open(filename, 'rb') as sessionfhin:
+            await sessionfhin.seek(offset)
+            data = await sessionfhin.read()
+
+        chunks, used = self._decode_chunks(data)
+        newadats = []
+        for tag, value in chunks:
+            if tag == 'oent':
+                newadats.extend(oentdata[1] for oentdata in value if oentdata[0] == 'adat')
+
+        with self.lock:
+            if not reset and offset != self.offset:
+                # another caller already consumed these bytes
+                return [], False
+            if reset:
+                logging.debug('full parse of %s', filename)
+                self.filename = filename
+                self.sessiondata = []
+            self.offset = offset + used
+            self.mtime_ns = stat.st_mtime_ns
+            self.sessiondata.extend(newadats)
+        return newadats, reset
+
     def condense(self):
         ''' shrink to just adats '''
         adatdata = []
@@ -285,6 +352,44 @@ class SeratoSessionReader:
         yield from reversed(self.sessiondata)
 
 
+def parse_liveplaylist(text):
+    ''' pull the artist and title out of a Live Playlists page.
+        returns None if the page has no track in it '''
+
+    tree = lxml.html.fromstring(text)
+    # [\n(spaces)artist - title (tabs)]
+    item = tree.xpath('(//div[@class="playlist-trackname"]/text())[last()]')
+
+    if not item:
+        return None
+
+    # cleanup
+    tdat = str(item)
+    for char in ["['", "']", "[]", "\\n", "\\t", "[\"", "\"]"]:
+        tdat = tdat.replace(char, "")
+    tdat = tdat.strip()
+
+    if not tdat:
+        return {}
+
+    if ' - ' not in tdat:
+        artist = None
+        title = tdat.strip()
+    else:
+        # artist - track
+        #
+        # The only hope we have is to split on ' - ' and hope that the
+        # artist/title doesn't have a similar split.
+        (artist, title) = tdat.split(' - ', 1)
+
+    artist = None if not artist or artist == '.' else artist.strip()
+    title = None if not title or title == '.' else title.strip()
+
+    if not title and not artist:
+        return {}
+    return {'artist': artist, 'title': title}
+
+
 class SeratoHandler():  #pylint: disable=too-many-instance-attributes
     ''' Generic handler to get the currently playing track.
 
@@ -304,15 +409,21 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
             seratodir=None,
             seratourl=None,
             testmode=False):
-        global LASTPROCESSED, PARSEDSESSIONS  #pylint: disable=global-statement
+        global LASTPROCESSED, PARSEDSESSIONS, DECKADATS  #pylint: disable=global-statement
         self.pollingobserver = pollingobserver
         self.tasks = set()
+        self.loop = None
+        self.updated = None
+        self.session = None
+        self.validators = {}
         self.event_handler = None
         self.observer = None
         self.testmode = testmode
         self.decks = {}
         self.playingadat = {}
+        self.sessionreader = SeratoSessionReader()
         PARSEDSESSIONS = []
+        DECKADATS = {}
         LASTPROCESSED = 0
         self.lastfetched = 0
         if seratodir:
@@ -334,6 +445,8 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
 
     async def start(self):
         ''' perform any startup tasks '''
+        self.loop = asyncio.get_running_loop()
+        self.updated = asyncio.Event()
         if self.seratodir and self.mode == 'local':
             await self._setup_watcher()
 
@@ -363,6 +476,20 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
     def process_sessions(self, event):
         ''' handle incoming session file updates '''
         logging.debug('processing %s', event)
+        if self.loop and self.loop.is_running():
+            # called from the watchdog thread: hand the work to the
+            # loop that is waiting on it
+            try:
+                if asyncio.get_running_loop() == self.loop:
+                    task = self.loop.create_task(self._async_process_sessions())
+                    self.tasks.add(task)
+                    task.add_done_callback(self.tasks.discard)
+                    return
+            except RuntimeError:
+                pass
+            asyncio.run_coroutine_threadsafe(self._async_process_sessions(), self.loop)
+            return
+
         try:
             loop = asyncio.get_running_loop()
             logging.debug('got a running loop')
@@ -377,7 +504,7 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
 
     async def _async_process_sessions(self):
         ''' read and process all of the relevant session files '''
-        global LASTPROCESSED, PARSEDSESSIONS  #pylint: disable=global-statement
+        global LASTPROCESSED, PARSEDSESSIONS, DECKADATS  #pylint: disable=global-statement
 
         if self.mode == 'remote':
             return
@@ -403,15 +530,52 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
                 logging.debug('%s is too old', sessionlist[-1].name)
                 return
 
-        session = SeratoSessionReader()
-        await session.loadsessionfile(sessionlist[-1])
-        session.condense()
+        newadats, reset = await self.sessionreader.loadnewsessiondata(sessionlist[-1])
+        if not newadats and not reset:
+            logging.debug('nothing new in %s', sessionlist[-1].name)
+            return
 
-        sessiondata = list(session.getadat())
+        # computedecks may be reading DECKADATS from another thread,
+        # so build a new one rather than modify it in place
+        deckadats = {} if reset else copy.copy(DECKADATS)
+        for adat in newadats:
+            if not adat.get('deck') or not adat.get('played'):
+                # broken record or wasn't played
+                continue
+            if adat['deck'] in deckadats and adat.get('starttime') <= deckadats[adat['deck']].get(
+                    'starttime'):
+                # started before the track already on that deck
+                continue
+            deckadats[adat['deck']] = adat
+
+        DECKADATS = deckadats
+        PARSEDSESSIONS = self.sessionreader.sessiondata
         LASTPROCESSED = round(time.time())
-        PARSEDSESSIONS = copy.copy(sessiondata)
-        #logging.debug(PARSEDSESSIONS)
-        logging.debug('finished processing')
+        logging.debug('finished processing %s new adats', len(newadats))
+        self._notify()
+
+    def _notify(self):
+        ''' wake up anything waiting in wait_for_update '''
+        if not self.updated or not self.loop or self.loop.is_closed():
+            return
+        try:
+            if asyncio.get_running_loop() == self.loop:
+                self.updated.set()
+                return
+        except RuntimeError:
+            pass
+        self.loop.call_soon_threadsafe(self.updated.set)
+
+    async def wait_for_update(self, timeout):
+        ''' wait up to timeout seconds for new session data '''
+        if not self.updated:
+            await asyncio.sleep(timeout)
+            return
+        try:
+            await asyncio.wait_for(self.updated.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            return
+        self.updated.clear()
 
     def computedecks(self, deckskiplist=None):
         ''' based upon the session data, figure out what is actually
@@ -422,23 +586,11 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
         if self.mode == 'remote':
             return
 
-        self.decks = {}
-
-        for adat in reversed(PARSEDSESSIONS):
-            if not adat.get('deck'):
-                # broken record
-                continue
-            if deckskiplist and str(adat['deck']) in deckskiplist:
-                # on a deck that is supposed to be ignored
-                continue
-            if not adat.get('played'):
-                # wasn't played, so skip it
-                continue
-            if adat['deck'] in self.decks and adat.get('starttime') < self.decks[adat['deck']].get(
-                    'starttime'):
-                # started after a deck that is already set
-                continue
-            self.decks[adat['deck']] = adat
+        self.decks = {
+            deck: adat
+            for deck, adat in DECKADATS.items()
+            if not deckskiplist or str(deck) not in deckskiplist
+        }
 
     def computeplaying(self):
         ''' set the adat for the playing track based upon the
@@ -523,7 +675,7 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
                 'title'), self.playingadat.get('filename')
         return None, None, None
 
-    def getremoteplayingtrack(self):  # pylint: disable=too-many-return-statements, too-many-branches
+    async def getremoteplayingtrack(self):
         ''' get the currently playing title from Live Playlists '''
 
         if self.mode == 'local':
@@ -534,64 +686,37 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
         # It is hard to believe in 2021, we are still scraping websites
         # and companies don't have APIs for data.
         #
+        if not self.session:
+            self.session = aiohttp.ClientSession()
+
         try:
-            page = requests.get(self.url, timeout=5)
+            async with self.session.get(self.url,
+                                        headers=self.validators,
+                                        timeout=aiohttp.ClientTimeout(total=5)) as response:
+                if response.status == 304:
+                    logging.debug('%s has not changed', self.url)
+                    return
+                if response.status != 200:
+                    return
+                self.validators = {}
+                if etag := response.headers.get('ETag'):
+                    self.validators['If-None-Match'] = etag
+                if lastmodified := response.headers.get('Last-Modified'):
+                    self.validators['If-Modified-Since'] = lastmodified
+                text = await response.text()
         except Exception as error:  # pylint: disable=broad-except
             logging.error("Cannot process %s: %s", self.url, error)
             return
 
-        if not page:
-            return
-
         try:
-            tree = lxml.html.fromstring(page.text)
-            # [\n(spaces)artist - title (tabs)]
-            item = tree.xpath('(//div[@class="playlist-trackname"]/text())[last()]')
+            playing = await asyncio.get_running_loop().run_in_executor(
+                None, parse_liveplaylist, text)
         except Exception as error:  # pylint: disable=broad-except
             logging.error("Cannot process %s: %s", self.url, error)
             return
 
-        if not item:
-            return
-
-        # cleanup
-        tdat = str(item)
-        for char in ["['", "']", "[]", "\\n", "\\t", "[\"", "\"]"]:
-            tdat = tdat.replace(char, "")
-        tdat = tdat.strip()
-
-        if not tdat:
-            self.playingadat = {}
-            return
-
-        if ' - ' not in tdat:
-            artist = None
-            title = tdat.strip()
-        else:
-            # artist - track
-            #
-            # The only hope we have is to split on ' - ' and hope that the
-            # artist/title doesn't have a similar split.
-            (artist, title) = tdat.split(' - ', 1)
-
-        if not artist or artist == '.':
-            artist = None
-        else:
-            artist = artist.strip()
-
-        self.playingadat['artist'] = artist
-
-        if not title or title == '.':
-            title = None
-        else:
-            title = title.strip()
-
-        self.playingadat['title'] = title
-
-        if not title and not artist:
-            self.playingadat = {}
-
-        return
+        if playing is not None:
+            self.playingadat = playing
 
     def _get_tidal_cover(self, filename):
         ''' try to get the cover from tidal '''
@@ -604,13 +729,13 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
                     return fhin.read()
         return None
 
-    def getplayingtrack(self, deckskiplist=None):
+    async def getplayingtrack(self, deckskiplist=None):
         ''' generate a dict of data '''
 
         if self.mode == 'local':
             self.getlocalplayingtrack(deckskiplist=deckskiplist)
         else:
-            self.getremoteplayingtrack()
+            await self.getremoteplayingtrack()
 
         if not self.playingadat:
             return {}
@@ -643,10 +768,11 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
 
     def stop(self):
         ''' stop serato handler '''
-        global LASTPROCESSED, PARSEDSESSIONS  #pylint: disable=global-statement
+        global LASTPROCESSED, PARSEDSESSIONS, DECKADATS  #pylint: disable=global-statement
 
         self.decks = {}
         PARSEDSESSIONS = []
+        DECKADATS = {}
         self.playingadat = {}
         LASTPROCESSED = 0
         self.lastfetched = 0
@@ -655,6 +781,14 @@ class SeratoHandler():  #pylint: disable=too-many-instance-attributes
             self.observer.join()
             self.observer = None
 
+    async def close(self):
+        ''' stop and release the Live Playlists session '''
+        self.stop()
+        if self.session:
+            await self.session.close()
+            self.session = None
+        self.validators = {}
+
     def __del__(self):
         self.stop()
 
@@ -702,7 +836,7 @@ class Plugin(InputPlugin):  #pylint: disable=too-many-instance-attributes
             self.local = stilllocal
             self.url = stillurl
             if self.serato:
-                self.serato.stop()
+                await self.serato.close()
             self.serato = SeratoHandler(pollingobserver=usepoll,
                                         seratourl=self.url,
                                         testmode=self.testmode)
@@ -748,19 +882,24 @@ class Plugin(InputPlugin):  #pylint: disable=too-many-instance-attributes
         ''' wrapper to call getplayingtrack '''
         await self.gethandler()
 
-        # get poll interval and then poll
-        if self.local:
-            interval = 1
+        # local mode wakes up as soon as the session file changes;
+        # remote mode has nothing to watch so just poll
+        if self.local and self.serato:
+            await self.serato.wait_for_update(LOCALWAIT)
+        elif self.local:
+            await asyncio.sleep(LOCALWAIT)
         else:
-            interval = self.config.cparser.value('settings/interval', type=float)
-
-        time.sleep(interval)
+            try:
+                interval = self.config.cparser.value('serato/interval', type=float)
+            except (TypeError, ValueError):
+                interval = 10.0
+            await asyncio.sleep(interval)
 
         if self.serato:
             deckskip = self.config.cparser.value('serato/deckskip')
             if deckskip and not isinstance(deckskip, list):
                 deckskip = list(deckskip)
-            return self.serato.getplayingtrack(deckskiplist=deckskip)
+            return await self.serato.getplayingtrack(deckskiplist=deckskip)
         return {}
 
     async def getrandomtrack(self, playlist):
@@ -831,7 +970,7 @@ class Plugin(InputPlugin):  #pylint: disable=too-many-instance-attributes
     async def stop(self):
         ''' stop the handler '''
         if self.serato:
-            self.serato.stop()
+            await self.serato.close()
 
     def on_serato_lib_button(self):
         ''' lib button clicked action'''
@@ -1,11 +1,14 @@
 #!/usr/bin/env python3
 ''' Traktor-specific support '''
 
+import asyncio
 import os
 import pathlib
 import logging
 import logging.config
 import sqlite3
+import threading
+import typing as t
 import xml.etree.ElementTree
 
 import aiosqlite  # pylint: disable=import-error
@@ -22,72 +25,220 @@ logging.config.dictConfig({
 
 from nowplaying.db import LISTFIELDS
 from nowplaying.exceptions import PluginVerifyError
+import nowplaying.utils
 from .icecast import Plugin as IcecastPlugin
 
 METADATALIST = ['artist', 'title', 'album', 'key', 'filename', 'bpm']
 
 PLAYLIST = ['name', 'filename']
 
+# columns that only exist to make lookups and refreshes fast
+SONGSEXTRA = ['location', 'normartist', 'normtitle']
+
+SONGSLIST = METADATALIST + SONGSEXTRA
+
+# bump whenever the tables change so old dbs get rebuilt
+SCHEMAVERSION = 2
+
+BATCHSIZE = 1000
+
+INDEXDEFS = {
+    'songs_artist_title': 'songs (artist, title)',
+    'songs_normalized': 'songs (normartist, normtitle)',
+    'songs_filename': 'songs (filename)',
+    'playlists_name': 'playlists (name)',
+}
+
 
 class Traktor:
     ''' data from the traktor collections.nml file '''
 
+    # shared so the plugin and the settings UI never import at the same time
+    lock = threading.RLock()
+
     def __init__(self, config=None):
         self.databasefile = pathlib.Path(
             QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0]).joinpath(
                 'traktor', 'traktor.db')
         self.database = None
         self.config = config
+        self.refreshtask: t.Optional[asyncio.Task] = None
 
     def initdb(self):
         ''' initialize the db '''
         if not self.databasefile.exists():
             self.rewrite_db()
+        else:
+            self.refresh()
 
     @staticmethod
-    def _write_playlist(sqlcursor, traktortree):
-        ''' take the collections XML and save the playlists off '''
-        for subnode in traktortree.iterfind('PLAYLISTS/NODE/SUBNODES'):
-            for node in subnode:
-                playlist = node.get('NAME')
-                for tracks in node:
-                    for keys in tracks:
-                        for primarykey in keys:
-                            filepathcomps = primarykey.attrib['KEY'].split('/:')
-                            filename = str(pathlib.Path('/').joinpath(*filepathcomps[1:]))
-                            sql = 'INSERT INTO playlists (name,filename) VALUES (?,?)'
-                            datatuple = playlist, filename
-                            sqlcursor.execute(sql, datatuple)
+    def _keyfilename(key):
+        ''' convert a PRIMARYKEY KEY (VOLUME/:DIR/:FILE) into a filename '''
+        filepathcomps = key.split('/:')
+        return str(pathlib.Path('/').joinpath(*filepathcomps[1:]))
 
     @staticmethod
-    def _write_filelist(sqlcursor, traktortree):
-        ''' take the Traktor collections file and put it into
-            a sql database for faster mapping in real-time'''
-        for node in traktortree.iterfind('COLLECTION/ENTRY'):
-            metadata = {
-                'artist': node.get('ARTIST'),
-                'title': node.get('TITLE'),
+    def _song(node):
+        ''' convert a COLLECTION/ENTRY into a row for songs '''
+        metadata = {
+            'artist': node.get('ARTIST'),
+            'title': node.get('TITLE'),
+        }
+        for subnode in node:
+            if subnode.tag == 'ALBUM':
+                metadata['album'] = subnode.get('TITLE')
+            elif subnode.tag == 'INFO':
+                metadata['key'] = subnode.get('KEY')
+            elif subnode.tag == 'LOCATION':
+                volume = subnode.get('VOLUME') or ''
+                directory = subnode.get('DIR') or ''
+                filename = subnode.get('FILE') or ''
+                metadata['filename'] = ''
+                if len(volume) > 1 and volume[0].isalpha() and volume[1] == ':':
+                    metadata['filename'] = volume
+                metadata['filename'] += directory.replace('/:', '/') + filename
+                # same layout as the playlists' PRIMARYKEY
+                metadata['location'] = volume + directory + filename
+            elif subnode.tag == 'TEMPO':
+                metadata['bpm'] = subnode.get('BPM')
+        if not metadata.get('location'):
+            metadata['location'] = f'{metadata["artist"]}/:{metadata["title"]}'
+        metadata['normartist'] = nowplaying.utils.normalize(metadata['artist'])
+        metadata['normtitle'] = nowplaying.utils.normalize(metadata['title'])
+        return tuple(metadata.get(column) for column in SONGSLIST)
+
+    @staticmethod
+    def _iter_collection(collectionsfile):
+        ''' stream ('songs', row) and ('playlists', row) out of collection.nml
+
+            iterparse + clear() keeps memory flat no matter how big the
+            collection is '''
+        path = []
+        playlist = None
+        for event, elem in xml.etree.ElementTree.iterparse(collectionsfile,
+                                                           events=('start', 'end')):
+            if event == 'start':
+                path.append(elem.tag)
+                if elem.tag == 'NODE' and elem.get('TYPE') == 'PLAYLIST':
+                    playlist = elem.get('NAME')
+                continue
+
+            path.pop()
+            if elem.tag == 'ENTRY':
+                if path[-1:] == ['COLLECTION']:
+                    yield 'songs', Traktor._song(elem)
+                elem.clear()
+            elif elem.tag == 'PRIMARYKEY' and playlist and 'PLAYLISTS' in path:
+                if key := elem.get('KEY'):
+                    yield 'playlists', (playlist, Traktor._keyfilename(key))
+            elif elem.tag == 'NODE':
+                if elem.get('TYPE') == 'PLAYLIST':
+                    playlist = None
+                elem.clear()
+
+    @staticmethod
+    def _create_tables(cursor):
+        ''' create the tables and indexes '''
+        sql = 'CREATE TABLE IF NOT EXISTS songs ('
+        sql += ' TEXT, '.join(METADATALIST + ['normartist', 'normtitle']) + ' TEXT, '
+        sql += 'location TEXT UNIQUE, '
+        sql += 'id INTEGER PRIMARY KEY AUTOINCREMENT)'
+        cursor.execute(sql)
+        sql = 'CREATE TABLE IF NOT EXISTS playlists ('
+        sql += ' TEXT, '.join(PLAYLIST) + ' TEXT, '
+        sql += 'id INTEGER PRIMARY KEY AUTOINCREMENT)'
+        cursor.execute(sql)
+        cursor.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        for name, definition in INDEXDEFS.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+        cursor.execute(f'PRAGMA user_version = {SCHEMAVERSION}')
+
+    def _connect(self):
+        ''' connection used for writing '''
+        connection = sqlite3.connect(self.databasefile, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def _dbstate(self):
+        ''' return (schema version, identity of the last imported collection) '''
+        if not self.databasefile.exists():
+            return None, None
+        try:
+            connection = sqlite3.connect(self.databasefile)
+            try:
+                version = connection.execute('PRAGMA user_version').fetchone()[0]
+                row = connection.execute('SELECT value FROM meta WHERE key=?',
+                                         ('collection', )).fetchone()
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            return None, None
+        return version, row[0] if row else None
+
+    def _import(self, collectionsfile, identity):
+        ''' bring songs/playlists in line with collectionsfile in one transaction
+
+            rows are matched up on LOCATION, so unchanged tracks are left
+            alone, changed ones get updated in place and missing ones removed '''
+        columns = ', '.join(SONGSLIST)
+        placeholders = ', '.join('?' * len(SONGSLIST))
+        changed = ' OR '.join(f'songs.{column} IS NOT excluded.{column}'
+                              for column in SONGSLIST)
+        updates = ', '.join(f'{column}=excluded.{column}' for column in SONGSLIST)
+
+        connection = self._connect()
+        try:
+            cursor = connection.cursor()
+            cursor.execute('BEGIN')
+            cursor.execute(f'CREATE TEMP TABLE incoming ({columns})')
+            cursor.execute('DELETE FROM playlists')
+            batches = {'songs': [], 'playlists': []}
+            inserts = {
+                'songs': f'INSERT INTO incoming ({columns}) VALUES ({placeholders})',
+                'playlists': 'INSERT INTO playlists (name, filename) VALUES (?, ?)',
             }
-            for subnode in node:
-                if subnode.tag == 'ALBUM':
-                    metadata['album'] = subnode.get('TITLE')
-                elif subnode.tag == 'INFO':
-                    metadata['key'] = subnode.get('KEY')
-                elif subnode.tag == 'LOCATION':
-                    volume = subnode.get('VOLUME')
-                    metadata['filename'] = ''
-                    if volume[0].isalpha() and volume[1] == ':':
-                        metadata['filename'] = volume
-
-                    metadata['filename'] += subnode.get('DIR').replace('/:',
-                                                                       '/') + subnode.get('FILE')
-                elif subnode.tag == 'TEMPO':
-                    metadata['bpm'] = subnode.get('BPM')
-            sql = 'INSERT INTO songs ('
-            sql += ', '.join(metadata.keys()) + ') VALUES ('
-            sql += '?,' * (len(metadata.keys()) - 1) + '?)'
-            datatuple = tuple(list(metadata.values()))
-            sqlcursor.execute(sql, datatuple)
+            for table, row in self._iter_collection(collectionsfile):
+                batch = batches[table]
+                batch.append(row)
+                if len(batch) >= BATCHSIZE:
+                    cursor.executemany(inserts[table], batch)
+                    batch.clear()
+            for table, batch in batches.items():
+                if batch:
+                    cursor.executemany(inserts[table], batch)
+
+            cursor.execute(f'INSERT INTO songs ({columns}) SELECT {columns} FROM incoming '
+                           f'WHERE true ON CONFLICT(location) DO UPDATE SET {updates} '
+                           f'WHERE {changed}')
+            cursor.execute(
+                'DELETE FROM songs WHERE location NOT IN (SELECT location FROM incoming)')
+            cursor.execute('DROP TABLE incoming')
+            cursor.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)',
+                           ('collection', identity))
+            cursor.execute('COMMIT')
+        except (sqlite3.Error, xml.etree.ElementTree.ParseError) as error:
+            logging.error('Failed to import %s: %s', collectionsfile, error)
+            if connection.in_transaction:
+                connection.rollback()
+        finally:
+            connection.close()
+
+    def refresh(self, collectionsfile=None):
+        ''' re-import collectionsfile if it changed since the last import '''
+        if not collectionsfile and self.config:
+            collectionsfile = self.config.cparser.value('traktor/collections')
+        if not collectionsfile or not pathlib.Path(collectionsfile).exists():
+            return
+
+        identity = nowplaying.utils.file_identity(collectionsfile)
+        with self.lock:
+            version, imported = self._dbstate()
+            if version != SCHEMAVERSION:
+                self.rewrite_db(collectionsfile=collectionsfile)
+            elif imported != identity:
+                logging.debug('%s changed, refreshing', collectionsfile)
+                self._import(collectionsfile, identity)
 
     def rewrite_db(self, collectionsfile=None):
         ''' erase and update the old db '''
@@ -98,31 +249,30 @@ class Traktor:
             logging.error('collection.nml (%s) does not exist', collectionsfile)
             return
 
-        self.databasefile.parent.mkdir(parents=True, exist_ok=True)
-        if self.databasefile.exists():
-            self.databasefile.unlink()
+        with self.lock:
+            self.databasefile.parent.mkdir(parents=True, exist_ok=True)
+            for suffix in ('', '-wal', '-shm'):
+                pathlib.Path(f'{self.databasefile}{suffix}').unlink(missing_ok=True)
 
-        with sqlite3.connect(self.databasefile) as connection:
-            cursor = connection.cursor()
-            sql = 'CREATE TABLE IF NOT EXISTS songs ('
-            sql += ' TEXT, '.join(METADATALIST) + ' TEXT, '
-            sql += 'id INTEGER PRIMARY KEY AUTOINCREMENT)'
-            cursor.execute(sql)
-            connection.commit()
-            sql = 'CREATE TABLE IF NOT EXISTS playlists ('
-            sql += ' TEXT, '.join(PLAYLIST) + ' TEXT, '
-            sql += 'id INTEGER PRIMARY KEY AUTOINCREMENT)'
-            cursor.execute(sql)
-            connection.commit()
-
-            traktor = xml.etree.ElementTree.parse(collectionsfile).getroot()
-            self._write_filelist(cursor, traktor)
-            connection.commit()
-            self._write_playlist(cursor, traktor)
-            connection.commit()
+            connection = self._connect()
+            try:
+                self._create_tables(connection.cursor())
+            finally:
+                connection.close()
+            self._import(collectionsfile, nowplaying.utils.file_identity(collectionsfile))
+
+    def start_refresh(self):
+        ''' re-import in the background if collection.nml changed.  until
+            that commits, lookups keep getting answered from the db as it is '''
+        if self.refreshtask and not self.refreshtask.done():
+            return
+        self.refreshtask = asyncio.create_task(asyncio.to_thread(self.refresh))
 
     async def lookup(self, artist=None, title=None):
         ''' lookup the metadata '''
+        self.start_refresh()
+        if not self.databasefile.exists():
+            return None
         async with aiosqlite.connect(self.databasefile) as connection:
             connection.row_factory = sqlite3.Row
             cursor = await connection.cursor()
@@ -132,10 +282,18 @@ class Traktor:
                         artist,
                         title,
                     ))
+                row = await cursor.fetchone()
+                if not row:
+                    await cursor.execute(
+                        '''SELECT * FROM songs WHERE normartist=? AND normtitle=?
+                           ORDER BY id DESC LIMIT 1''', (
+                            nowplaying.utils.normalize(artist),
+                            nowplaying.utils.normalize(title),
+                        ))
+                    row = await cursor.fetchone()
             except sqlite3.OperationalError:
                 return None
 
-            row = await cursor.fetchone()
             if not row:
                 return None
 
@@ -147,6 +305,9 @@ class Traktor:
 
     async def getrandomtrack(self, playlist):
         ''' return the contents of a playlist '''
+        self.start_refresh()
+        if not self.databasefile.exists():
+            return None
         async with aiosqlite.connect(self.databasefile) as connection:
             connection.row_factory = sqlite3.Row
             cursor = await connection.cursor()
@@ -278,3 +439,13 @@ class Plugin(IcecastPlugin):
         ''' any initialization before actual polling starts '''
         port = self.config.cparser.value('traktor/port', type=int, defaultValue=8000)
         await self.start_port(port)
+        if not self.extradb:
+            self.extradb = Traktor(config=self.config)
+        self.extradb.start_refresh()
+
+    async def stop(self):
+        ''' stopping either the entire program or just this
+            input '''
+        await super().stop()
+        if self.extradb and self.extradb.refreshtask:
+            await self.extradb.refreshtask
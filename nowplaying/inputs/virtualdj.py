@@ -1,10 +1,17 @@
 #!/usr/bin/env python3
 ''' Virtual DJ support '''
 
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
 import logging
 import os
 import pathlib
+import random
 import sqlite3
+import threading
+import typing as t
 
 import aiosqlite
 
@@ -12,14 +19,24 @@ from PySide6.QtCore import QStandardPaths  # pylint: disable=no-name-in-module
 from PySide6.QtWidgets import QFileDialog  # pylint: disable=no-name-in-module
 
 from nowplaying.exceptions import PluginVerifyError
+import nowplaying.utils
 from .m3u import Plugin as M3UPlugin
 
-PLAYLIST = ['name', 'filename']
+PLAYLIST = ['name', 'filename', 'source']
+
+# bump whenever the tables change so old dbs get rebuilt
+SCHEMAVERSION = 2
+
+# checking paths is I/O bound (often network drives), not CPU bound
+VERIFYWORKERS = 8
 
 
 class Plugin(M3UPlugin):
     ''' handler for NowPlaying '''
 
+    # shared so the settings UI and the running plugin never index at the same time
+    dblock = threading.Lock()
+
     def __init__(self, config=None, m3udir=None, qsettings=None):
         super().__init__(config=config, m3udir=m3udir, qsettings=qsettings)
         self.displayname = "VirtualDJ"
@@ -27,22 +44,77 @@ class Plugin(M3UPlugin):
             QStandardPaths.standardLocations(QStandardPaths.CacheLocation)[0]).joinpath(
                 'virtualdj', 'virtualdj.db')
         self.database = None
+        self.refreshtask: t.Optional[asyncio.Task] = None
+        # set by stop() so a refresh in progress gives up between playlists
+        self.stopevent = threading.Event()
 
     def initdb(self):
         ''' initialize the db '''
         if not self.databasefile.exists():
             self.rewrite_db()
+        else:
+            self.refresh_db()
 
-    @staticmethod
-    def _write_playlist(sqlcursor, playlist, filelist):
-        ''' take the collections XML and save the playlists off '''
-        sql = 'INSERT INTO playlists (name,filename) VALUES (?,?)'
-        for filename in filelist:
-            datatuple = playlist, filename
-            sqlcursor.execute(sql, datatuple)
+    def _create_tables(self):
+        ''' create the tables and indexes '''
+        self.databasefile.parent.mkdir(parents=True, exist_ok=True)
+        with sqlite3.connect(self.databasefile) as connection:
+            cursor = connection.cursor()
+            sql = 'CREATE TABLE IF NOT EXISTS playlists ('
+            sql += ' TEXT, '.join(PLAYLIST) + ' TEXT, '
+            sql += 'id INTEGER PRIMARY KEY AUTOINCREMENT)'
+            cursor.execute(sql)
+            cursor.execute('CREATE TABLE IF NOT EXISTS playlistfiles '
+                           '(source TEXT PRIMARY KEY, identity TEXT)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS playlists_name ON playlists (name)')
+            cursor.execute('CREATE INDEX IF NOT EXISTS playlists_source ON playlists (source)')
+            cursor.execute(f'PRAGMA user_version = {SCHEMAVERSION}')
+            connection.commit()
 
-    def rewrite_db(self, playlistdir=None):
-        ''' erase and update the old db '''
+    def _schemaversion(self):
+        ''' version of the tables currently on disk '''
+        if not self.databasefile.exists():
+            return None
+        try:
+            with contextlib.closing(sqlite3.connect(self.databasefile)) as connection:
+                return connection.execute('PRAGMA user_version').fetchone()[0]
+        except sqlite3.Error:
+            return None
+
+    @staticmethod
+    def _playlist_lines(filepath):
+        ''' the non-blank lines of a playlist, still undecoded '''
+        with open(filepath, 'rb') as m3ufh:
+            return [line for line in (rawline.rstrip() for rawline in m3ufh) if line]
+
+    def _read_playlists(self, filepaths):
+        ''' read the given playlists, checking the entries in parallel.
+            returns None if stopped part way through '''
+        contents = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=VERIFYWORKERS,
+                                                   thread_name_prefix='vdjverify') as pool:
+            for filepath in filepaths:
+                if self.stopevent.is_set():
+                    pool.shutdown(cancel_futures=True)
+                    return None
+                logging.debug('Reading %s', filepath)
+                try:
+                    lines = self._playlist_lines(filepath)
+                except OSError as error:
+                    logging.error('Cannot read %s: %s', filepath, error)
+                    continue
+                contents[filepath] = pool.map(functools.partial(self._verify_file, filepath),
+                                              lines)
+            playlists = {}
+            for filepath, results in contents.items():
+                if self.stopevent.is_set():
+                    pool.shutdown(cancel_futures=True)
+                    return None
+                playlists[filepath] = [audiofile for audiofile in results if audiofile]
+            return playlists
+
+    def refresh_db(self, playlistdir=None):
+        ''' re-read only the playlists that were added, changed, or removed '''
         if not playlistdir:
             playlistdir = self.config.cparser.value('virtualdj/playlists')
 
@@ -55,23 +127,52 @@ class Plugin(M3UPlugin):
             logging.error('playlistdir (%s) does not exist', playlistdir)
             return
 
-        self.databasefile.parent.mkdir(parents=True, exist_ok=True)
-        if self.databasefile.exists():
-            self.databasefile.unlink()
-
-        with sqlite3.connect(self.databasefile) as connection:
-            cursor = connection.cursor()
-            sql = 'CREATE TABLE IF NOT EXISTS playlists ('
-            sql += ' TEXT, '.join(PLAYLIST) + ' TEXT, '
-            sql += 'id INTEGER PRIMARY KEY AUTOINCREMENT)'
-            cursor.execute(sql)
-            connection.commit()
+        with self.dblock:
+            if self._schemaversion() != SCHEMAVERSION:
+                for suffix in ('', '-wal', '-shm'):
+                    pathlib.Path(f'{self.databasefile}{suffix}').unlink(missing_ok=True)
+            self._create_tables()
+
+            identities = {
+                str(filepath): nowplaying.utils.file_identity(filepath)
+                for filepath in playlistdirpath.rglob('*.m3u')
+            }
+            with contextlib.closing(sqlite3.connect(self.databasefile)) as connection:
+                known = dict(connection.execute('SELECT source, identity FROM playlistfiles'))
+            changed = [
+                source for source, identity in identities.items() if known.get(source) != identity
+            ]
+            removed = [source for source in known if source not in identities]
+            if not changed and not removed:
+                return
+
+            if (contents := self._read_playlists(changed)) is None:
+                # nothing written, so the next refresh picks these up again
+                logging.debug('VDJ playlist refresh stopped')
+                return
+            with contextlib.closing(sqlite3.connect(self.databasefile)) as connection:
+                with connection:
+                    cursor = connection.cursor()
+                    cursor.executemany('DELETE FROM playlists WHERE source=?',
+                                       [(source, ) for source in changed + removed])
+                    cursor.executemany('DELETE FROM playlistfiles WHERE source=?',
+                                       [(source, ) for source in removed])
+                    for source, filelist in contents.items():
+                        name = pathlib.Path(source).stem
+                        cursor.executemany(
+                            'INSERT INTO playlists (name, filename, source) VALUES (?,?,?)',
+                            [(name, filename, source) for filename in filelist])
+                    cursor.executemany(
+                        'INSERT OR REPLACE INTO playlistfiles (source, identity) VALUES (?,?)',
+                        [(source, identities[source]) for source in contents])
+            logging.debug('VDJ playlists: %s re-read, %s removed', len(contents), len(removed))
 
-            for filepath in list(playlistdirpath.rglob('*.m3u')):
-                logging.debug('Reading %s', filepath)
-                content = self._read_full_file(filepath)
-                self._write_playlist(cursor, filepath.stem, content)
-            connection.commit()
+    def rewrite_db(self, playlistdir=None):
+        ''' erase and update the old db '''
+        with self.dblock:
+            for suffix in ('', '-wal', '-shm'):
+                pathlib.Path(f'{self.databasefile}{suffix}').unlink(missing_ok=True)
+        self.refresh_db(playlistdir=playlistdir)
 
     def install(self):
         ''' locate Virtual DJ '''
@@ -87,6 +188,11 @@ class Plugin(M3UPlugin):
     async def start(self):
         ''' setup the watcher to run in a separate thread '''
         await self.setup_watcher('virtualdj/history')
+        if not self.refreshtask:
+            # bring the playlists up to date once in the background;
+            # after that, the settings UI button re-reads them
+            self.stopevent.clear()
+            self.refreshtask = asyncio.create_task(asyncio.to_thread(self.initdb))
 
     async def getplayingtrack(self):
         ''' wrapper to call getplayingtrack '''
@@ -97,13 +203,22 @@ class Plugin(M3UPlugin):
 
     async def getrandomtrack(self, playlist):
         ''' return the contents of a playlist '''
+        if not self.databasefile.exists():
+            return None
         async with aiosqlite.connect(self.databasefile) as connection:
             connection.row_factory = sqlite3.Row
             cursor = await connection.cursor()
             try:
+                # both queries are answered from the playlists_name index
+                await cursor.execute('''SELECT COUNT(*) FROM playlists WHERE name=?''',
+                                     (playlist, ))
+                count = (await cursor.fetchone())[0]
+                if not count:
+                    logging.debug('no match')
+                    return None
                 await cursor.execute(
-                    '''SELECT filename FROM playlists WHERE name=? ORDER BY random() LIMIT 1''',
-                    (playlist, ))
+                    '''SELECT filename FROM playlists WHERE name=? LIMIT 1 OFFSET ?''',
+                    (playlist, random.randrange(count)))
             except sqlite3.OperationalError as error:
                 logging.error(error)
                 return None
@@ -117,6 +232,10 @@ class Plugin(M3UPlugin):
     async def stop(self):
         ''' stop the m3u plugin '''
         self._reset_meta()
+        if self.refreshtask:
+            self.stopevent.set()
+            await self.refreshtask
+            self.refreshtask = None
         if self.observer:
             self.observer.stop()
             self.observer.join()
@@ -131,7 +250,11 @@ class Plugin(M3UPlugin):
 
     def on_playlist_reread_button(self):
         ''' user clicked re-read collections '''
-        self.rewrite_db(playlistdir=self.qwidget.playlistdir_lineedit.text())
+        self.stopevent.clear()
+        threading.Thread(target=self.refresh_db,
+                         kwargs={'playlistdir': self.qwidget.playlistdir_lineedit.text()},
+                         name='vdjplaylists',
+                         daemon=True).start()
 
     def on_playlistdir_button(self):
         ''' filename button clicked action'''
@@ -5,7 +5,9 @@ import asyncio
 import copy
 import concurrent.futures
 import contextlib
+import io
 import logging
+import mmap
 import re
 import os
 import string
@@ -16,19 +18,62 @@ import typing as t
 import nltk
 import url_normalize
 
+import nowplaying.apicache
 import nowplaying.config
 import nowplaying.hostmeta
+import nowplaying.imagecache
 import nowplaying.musicbrainz
 import nowplaying.utils
 from nowplaying.vendor import tinytag
 
 import nowplaying.vendor.audio_metadata
 from nowplaying.vendor.audio_metadata.formats.mp4_tags import MP4FreeformDecoders
+from nowplaying.vendor.audio_metadata.tbm_utils import DataReader
+
+# how long, in seconds, to wait for the artistextras plugins
+# before publishing what we have
+ARTISTEXTRASDEADLINE = 5.0
 
 NOTE_RE = re.compile('N(?i:ote):')
 YOUTUBE_MATCH_RE = re.compile('^https?://[www.]*youtube.com/watch.v=')
 
 
+class MMapRaw(io.RawIOBase):
+    ''' raw reader on top of an mmap so that the tag parsers only
+        pull in the parts of the file they actually read '''
+
+    def __init__(self, filemap: mmap.mmap, name: str):
+        super().__init__()
+        self.filemap = filemap
+        self.name = name
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        data = self.filemap.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        self.filemap.seek(offset, whence)
+        return self.filemap.tell()
+
+    def tell(self) -> int:
+        return self.filemap.tell()
+
+
+def _embedded_prefix(metadata: dict) -> t.Optional[str]:
+    ''' embedded covers are keyed on the file they came from, since
+        different albums can share a name '''
+    if not metadata.get('filename'):
+        return None
+    return nowplaying.utils.file_identity(metadata['filename'])
+
+
 def _date_calc(datedata: dict) -> t.Optional[str]:
     if datedata.get('originalyear') and datedata.get(
             'date') and datedata['originalyear'] in datedata['date']:
@@ -59,12 +104,19 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
     def __init__(self, config: 'nowplaying.config.ConfigFile' = None):
         self.metadata: dict[str, t.Any] = {}
         self.imagecache = None
+        self.apicache: t.Optional[nowplaying.apicache.APICache] = None
+        self.extraspool: t.Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.localpool: t.Optional[concurrent.futures.ThreadPoolExecutor] = None
+        self.latefutures: list[tuple[str, asyncio.Future]] = []
         if config:
             self.config = config
         else:
             self.config = nowplaying.config.ConfigFile()
 
         self.extraslist = self._sortextras()
+        # one helper for the life of this object so that its lookups
+        # are shared between tracks
+        self.musicbrainz = nowplaying.musicbrainz.MusicBrainzHelper(config=self.config)
         #logging.debug("%s %s", type(self.extraslist), self.extraslist)
 
     def _sortextras(self) -> dict[int, list[str]]:
@@ -83,24 +135,14 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
         else:
             self.metadata = {}
         self.imagecache = imagecache
+        self.latefutures = []
 
         if 'artistfanarturls' not in self.metadata:
             self.metadata['artistfanarturls'] = []
 
-        if self.metadata.get('coverimageraw') and self.imagecache and self.metadata.get('album'):
-            logging.debug("Placing provided front cover")
-            self.imagecache.put_db_cachekey(identifier=self.metadata['album'],
-                                            srclocation=f"{self.metadata['album']}_provided_0",
-                                            imagetype="front_cover",
-                                            content=self.metadata['coverimageraw'])
-
-        try:
-            for processor in 'hostmeta', 'audio_metadata', 'tinytag', 'image2png':
-                logging.debug('running %s', processor)
-                func = getattr(self, f'_process_{processor}')
-                func()
-        except Exception:  #pylint: disable=broad-except
-            logging.exception('Ignoring sub-metaproc failure.')
+        # file parsing and image conversion are CPU bound, so keep them
+        # off of the event loop
+        await asyncio.get_running_loop().run_in_executor(self._localpool(), self._process_local)
 
         await self._process_plugins(skipplugins)
 
@@ -123,6 +165,31 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
         self._fix_duration()
         return self.metadata
 
+    def _localpool(self) -> concurrent.futures.ThreadPoolExecutor:
+        # separate from extraspool so that slow artist extras from the
+        # last track never hold up this one
+        if not self.localpool:
+            self.localpool = concurrent.futures.ThreadPoolExecutor(max_workers=2,
+                                                                   thread_name_prefix='localmeta')
+        return self.localpool
+
+    def _process_local(self):
+        ''' everything that only needs the local file and the image cache '''
+        if self.metadata.get('coverimageraw') and self.imagecache and self.metadata.get('album'):
+            logging.debug("Placing provided front cover")
+            self.imagecache.put_db_cachekey(identifier=self.metadata['album'],
+                                            srclocation=f"{self.metadata['album']}_provided_0",
+                                            imagetype="front_cover",
+                                            content=self.metadata['coverimageraw'])
+
+        try:
+            for processor in 'hostmeta', 'tags', 'image2png':
+                logging.debug('running %s', processor)
+                func = getattr(self, f'_process_{processor}')
+                func()
+        except Exception:  #pylint: disable=broad-except
+            logging.exception('Ignoring sub-metaproc failure.')
+
     def _fix_dates(self):
         ''' take care of year / date cleanup '''
         if not self.metadata:
@@ -197,22 +264,25 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
         for key, value in hostmeta.items():
             self.metadata[key] = value
 
-    def _process_audio_metadata(self):
-        try:
-            self.metadata = AudioMetadataRunner(
-                config=self.config, imagecache=self.imagecache).process(metadata=self.metadata)
-        except Exception as err:  # pylint: disable=broad-except
-            logging.exception("AudioMetadata crashed: %s", err)
+    def _process_tags(self):
+        ''' fill in from the file's own tags '''
+        if not self.metadata.get('filename'):
+            return
 
-    def _process_tinytag(self):
-        try:
-            tempdata = TinyTagRunner(imagecache=self.imagecache).process(
-                metadata=copy.copy(self.metadata))
-            self.metadata = recognition_replacement(config=self.config,
-                                                    metadata=self.metadata,
-                                                    addmeta=tempdata)
-        except Exception as err:  # pylint: disable=broad-except
-            logging.exception("TinyTag crashed: %s", err)
+        if not self.apicache:
+            self.apicache = nowplaying.apicache.APICache()
+        tags = TagReader(config=self.config, imagecache=self.imagecache,
+                         apicache=self.apicache).get(self.metadata['filename'])
+        if not tags:
+            return
+
+        # dates in the tags always win, everything else only fills in
+        # blanks unless recognition/replace* says otherwise
+        if tags.get('date'):
+            self.metadata['date'] = tags['date']
+        self.metadata = recognition_replacement(config=self.config,
+                                                metadata=self.metadata,
+                                                addmeta=tags)
 
     def _process_image2png(self):
         # always convert to png
@@ -229,8 +299,7 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
         if not self.metadata:
             return None
 
-        musicbrainz = nowplaying.musicbrainz.MusicBrainzHelper(config=self.config)
-        addmeta = musicbrainz.recognize(copy.copy(self.metadata))
+        addmeta = self.musicbrainz.recognize(copy.copy(self.metadata))
         self.metadata = recognition_replacement(config=self.config,
                                                 metadata=self.metadata,
                                                 addmeta=addmeta)
@@ -251,8 +320,7 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
 
         logging.debug('Attempting musicbrainz fallback')
 
-        musicbrainz = nowplaying.musicbrainz.MusicBrainzHelper(config=self.config)
-        addmeta = musicbrainz.lastditcheffort(copy.copy(self.metadata))
+        addmeta = self.musicbrainz.lastditcheffort(copy.copy(self.metadata))
         self.metadata = recognition_replacement(config=self.config,
                                                 metadata=self.metadata,
                                                 addmeta=addmeta)
@@ -261,7 +329,7 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
         if (not addmeta or not addmeta.get('album')) and ' - ' in self.metadata['title']:
             if comments := self.metadata.get('comments'):
                 if YOUTUBE_MATCH_RE.match(comments):
-                    self._mb_youtube_fallback(musicbrainz)
+                    self._mb_youtube_fallback(self.musicbrainz)
 
     def _mb_youtube_fallback(self, musicbrainz):
         if not self.metadata:
@@ -291,8 +359,12 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
             provider = any(meta not in self.metadata for meta in metalist)
             if provider:
                 try:
-                    if addmeta := self.config.pluginobjs['recognition'][plugin].recognize(
-                            metadata=self.metadata):
+                    # recognition is fingerprinting and web lookups with their
+                    # own retry sleeps, so keep it off of the event loop
+                    if addmeta := await asyncio.get_running_loop().run_in_executor(
+                            self._localpool(),
+                            self.config.pluginobjs['recognition'][plugin].recognize,
+                            self.metadata):
                         self.metadata = recognition_replacement(config=self.config,
                                                                 metadata=self.metadata,
                                                                 addmeta=addmeta)
@@ -313,35 +385,68 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
                 type=bool) and not self.config.cparser.value('control/beam', type=bool):
             await self._artist_extras()
 
+    def _extras_deadline(self) -> float:
+        try:
+            return self.config.cparser.value('artistextras/deadline',
+                                             type=float,
+                                             defaultValue=ARTISTEXTRASDEADLINE)
+        except (TypeError, ValueError):
+            return ARTISTEXTRASDEADLINE
+
+    def _merge_extras(self, metadata: dict, futures: list[tuple[str, asyncio.Future]]) -> dict:
+        ''' merge finished plugin results in priority order '''
+        for plugin, future in futures:
+            if not future.done() or future.cancelled():
+                continue
+            if error := future.exception():
+                logging.error('%s threw exception %s', plugin, error, exc_info=error)
+                continue
+            if addmeta := future.result():
+                metadata = extras_replacement(config=self.config,
+                                              metadata=metadata,
+                                              addmeta=addmeta)
+        return metadata
+
     async def _artist_extras(self):
-        tasks: list[tuple[str, asyncio.Future]] = []
-        with concurrent.futures.ThreadPoolExecutor(max_workers=3,
-                                                   thread_name_prefix='artistextras') as pool:
-            for _, plugins in self.extraslist.items():
-                for plugin in plugins:
-                    try:
-                        loop = asyncio.get_running_loop()
-                        tasks.append([
-                            plugin,
-                            loop.run_in_executor(
-                                pool, self.config.pluginobjs['artistextras'][plugin].download,
-                                self.metadata, self.imagecache)
-                        ])
-
-                    except Exception as error:  # pylint: disable=broad-except
-                        logging.error('%s threw exception %s', plugin, error, exc_info=True)
-
-            await asyncio.sleep(5)
-            for taskinfo in tasks:
-                with contextlib.suppress(Exception):
-                    if not taskinfo[1].cancel():
-                        addmeta = await taskinfo[1].result()
-                        if addmeta:
-                            self.metadata = recognition_replacement(config=self.config,
-                                                                    metadata=self.metadata,
-                                                                    addmeta=addmeta)
-                    else:
-                        logging.debug("cancelling, timeout: %s", taskinfo[0])
+        ''' run the artistextras plugins in parallel, returning as soon as they
+            all finish or the deadline passes.  Anything still running is kept in
+            self.latefutures for late_artist_extras '''
+        if not self.extraspool:
+            self.extraspool = concurrent.futures.ThreadPoolExecutor(
+                max_workers=max(3, sum(len(plugins) for plugins in self.extraslist.values())),
+                thread_name_prefix='artistextras')
+
+        loop = asyncio.get_running_loop()
+        futures: list[tuple[str, asyncio.Future]] = []
+        for _, plugins in self.extraslist.items():
+            for plugin in plugins:
+                try:
+                    # each plugin gets its own copy: a plugin that misses the
+                    # deadline keeps running after self.metadata is published
+                    futures.append((plugin,
+                                    loop.run_in_executor(
+                                        self.extraspool,
+                                        self.config.pluginobjs['artistextras'][plugin].download,
+                                        copy.deepcopy(self.metadata), self.imagecache)))
+                except Exception as error:  # pylint: disable=broad-except
+                    logging.error('%s threw exception %s', plugin, error, exc_info=True)
+
+        if not futures:
+            return
+
+        _, pending = await asyncio.wait([future for _, future in futures],
+                                        timeout=self._extras_deadline())
+        self.metadata = self._merge_extras(self.metadata, futures)
+        self.latefutures = [(plugin, future) for plugin, future in futures if future in pending]
+        for plugin, _ in self.latefutures:
+            logging.debug('%s missed the deadline; will deliver late', plugin)
+
+    async def late_artist_extras(self, latefutures: list[tuple[str, asyncio.Future]]) -> dict:
+        ''' wait for plugins that missed the deadline and return what they found '''
+        if not latefutures:
+            return {}
+        await asyncio.wait([future for _, future in latefutures])
+        return self._merge_extras({}, latefutures)
 
     def _generate_short_bio(self):
         if not self.metadata:
@@ -363,6 +468,133 @@ class MetadataProcessors:  # pylint: disable=too-few-public-methods
             self.metadata['artistshortbio'] = ' '.join(tokens[:-1])
 
 
+class TagReader:
+    ''' read a local file's tags with both tag parsers, opening it once.
+
+        results are cached by file identity (path, size, mtime) along with
+        the imagecache content key of the file's cover, so an unchanged
+        file never gets parsed twice '''
+
+    def __init__(self,
+                 config: 'nowplaying.config.ConfigFile' = None,
+                 imagecache: "nowplaying.imagecache.ImageCache" = None,
+                 apicache: t.Optional[nowplaying.apicache.APICache] = None):
+        self.config = config
+        self.imagecache = imagecache
+        self.apicache = apicache
+
+    def get(self, filename: str) -> t.Optional[dict]:
+        ''' tags for filename, from the cache if the file has not changed '''
+        key = nowplaying.utils.file_identity(filename)
+        if key and self.apicache and (cached := self.apicache.get('tags', key)):
+            entry = cached[0]
+            tags = copy.copy(entry['tags'])
+            if not entry['cover']:
+                return tags
+            # the imagecache may have evicted the cover, in which case
+            # read the file again
+            if self.imagecache and (cover := self.imagecache.find_content(entry['cover'])):
+                tags['coverimageraw'] = cover
+                return tags
+
+        if (tags := self.read(filename)) is None:
+            return None
+
+        if key and self.apicache:
+            contentkey = None
+            if tags.get('coverimageraw') and self.imagecache:
+                contentkey = self.imagecache.contentkey(tags['coverimageraw'])
+                if not self.imagecache.find_content(contentkey):
+                    contentkey = None
+            if contentkey or not tags.get('coverimageraw'):
+                self.apicache.put('tags', key, {
+                    'tags': {
+                        tag: value
+                        for tag, value in tags.items() if tag not in ['coverimageraw', 'filename']
+                    },
+                    'cover': contentkey
+                })
+        return tags
+
+    def read(self, filename: str) -> t.Optional[dict]:
+        ''' parse the file's tags '''
+        try:
+            with open(filename, 'rb') as filehandle, mmap.mmap(
+                    filehandle.fileno(), 0, access=mmap.ACCESS_READ) as filemap:
+                return self._read_tags({'filename': filename}, filemap)
+        except (OSError, ValueError) as error:
+            logging.error('Cannot read %s: %s', filename, error)
+        return None
+
+    def _read_tags(self, metadata: dict, filemap: mmap.mmap) -> dict:
+        amrunner = AudioMetadataRunner(config=self.config, imagecache=self.imagecache)
+        try:
+            metadata = amrunner.process(metadata=metadata, filemap=filemap)
+        except Exception as err:  # pylint: disable=broad-except
+            logging.exception("AudioMetadata crashed: %s", err)
+
+        ttrunner = TinyTagRunner(imagecache=self.imagecache)
+        try:
+            tempdata = ttrunner.process(metadata=copy.copy(metadata), filemap=filemap)
+            metadata = recognition_replacement(config=self.config,
+                                               metadata=metadata,
+                                               addmeta=tempdata)
+        except Exception as err:  # pylint: disable=broad-except
+            logging.exception("TinyTag crashed: %s", err)
+
+        # pictures are the bulk of most tags, so only deal with them
+        # if this file's embedded cover isn't already known
+        if self._cached_cover(metadata):
+            return metadata
+
+        try:
+            if amrunner.pictures:
+                metadata = amrunner.images(metadata)
+            else:
+                metadata = ttrunner.images(metadata, filemap)
+        except Exception as err:  # pylint: disable=broad-except
+            logging.exception("Cover extraction crashed: %s", err)
+        return metadata
+
+    def _cover(self, srclocation: str) -> t.Optional[bytes]:
+        if not self.imagecache or not (data := self.imagecache.find_srclocation(srclocation)):
+            return None
+        return self.imagecache.cache.get(data['cachekey'])
+
+    def _cached_cover(self, metadata: dict) -> t.Optional[str]:
+        ''' find the embedded cover from an earlier read of this exact file,
+            placing it in metadata if there isn't one already '''
+        if not self.imagecache or not (prefix := _embedded_prefix(metadata)):
+            return None
+
+        for srclocation in [f"{prefix}_audiofile_am0", f"{prefix}_audiofile_tt0"]:
+            if cover := self._cover(srclocation):
+                if not metadata.get('coverimageraw'):
+                    metadata['coverimageraw'] = cover
+                return srclocation
+        return None
+
+
+def warm_tag_cache(config: 'nowplaying.config.ConfigFile',
+                   paths: t.Iterable[str],
+                   imagecache: "nowplaying.imagecache.ImageCache" = None,
+                   workers: t.Optional[int] = None) -> int:
+    ''' read the tags of every audio file in paths (files, directories, or
+        m3u playlists) into the tag cache. returns how many files were read '''
+    apicache = nowplaying.apicache.APICache()
+    todo = [
+        filename for filename in nowplaying.utils.audio_files(paths)
+        if (key := nowplaying.utils.file_identity(filename)) and not apicache.get('tags', key)
+    ]
+    reader = TagReader(config=config, imagecache=imagecache, apicache=apicache)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers or
+                                               nowplaying.utils.idle_workers(),
+                                               thread_name_prefix='tagcache') as pool:
+        count = sum(1 for tags in pool.map(reader.get, todo) if tags is not None)
+    apicache.close()
+    return count
+
+
 class TinyTagRunner:  # pylint: disable=too-few-public-methods
     ''' tinytag manager '''
 
@@ -383,24 +615,46 @@ class TinyTagRunner:  # pylint: disable=too-few-public-methods
                 datedata[datetype] = extra[datetype]
         return _date_calc(datedata)
 
-    def process(self, metadata) -> dict:  # pylint: disable=too-many-branches
-        ''' given a chunk of metadata, try to fill in more '''
+    def process(self, metadata, filemap: t.Optional[mmap.mmap] = None) -> dict:
+        ''' given a chunk of metadata, try to fill in more.
+
+            if filemap is given, read from it instead of opening the file
+            and leave the pictures for images() '''
         self.metadata = metadata
 
         if not metadata or not metadata.get('filename'):
             return metadata
 
         try:
-            tag = tinytag.TinyTag.get(self.metadata['filename'], image=True)
+            tag = tinytag.TinyTag.get(self.metadata['filename'],
+                                      image=filemap is None,
+                                      file_obj=filemap)
         except tinytag.tinytag.TinyTagException as error:
             logging.error('tinytag could not process %s: %s', self.metadata['filename'], error)
             return metadata
 
         if tag:
             self._got_tag(tag)
+            if filemap is None:
+                self._images(tag.images)
 
         return self.metadata
 
+    def images(self, metadata, filemap: mmap.mmap) -> dict:
+        ''' pull just the pictures out of the file '''
+        self.metadata = metadata
+        try:
+            tag = tinytag.TinyTag.get(self.metadata['filename'],
+                                      duration=False,
+                                      image=True,
+                                      file_obj=filemap)
+        except tinytag.tinytag.TinyTagException as error:
+            logging.error('tinytag could not process %s: %s', self.metadata['filename'], error)
+            return metadata
+        if tag:
+            self._images(tag.images)
+        return self.metadata
+
     def _ufid(self, extra):
         if ufid := extra.get('ufid'):
             if isinstance(ufid, str):
@@ -484,19 +738,18 @@ class TinyTagRunner:  # pylint: disable=too-few-public-methods
         #logging.debug(tag)
         #logging.debug(tag.extra)
 
-        self._images(tag.images)
-
     def _images(self, images):
 
         if 'coverimageraw' not in self.metadata and images.front_cover:
             self.metadata['coverimageraw'] = images.front_cover[0].data
 
-        if images.front_cover and self.metadata.get("album") and self.imagecache:
+        if images.front_cover and self.metadata.get("album") and self.imagecache and (
+                prefix := _embedded_prefix(self.metadata)):
             for index, cover in enumerate(images.front_cover):
                 logging.debug("Placing audiofile_tt%s front cover", index)
                 self.imagecache.put_db_cachekey(
                     identifier=self.metadata['album'],
-                    srclocation=f"{self.metadata['album']}_audiofile_tt{index}",
+                    srclocation=f"{prefix}_audiofile_tt{index}",
                     imagetype="front_cover",
                     content=cover.data)
 
@@ -509,9 +762,13 @@ class AudioMetadataRunner:  # pylint: disable=too-few-public-methods
         self.metadata = {}
         self.config = config
         self.datedata = {}
+        self.pictures: list[nowplaying.vendor.audio_metadata.Picture] = []
 
-    def process(self, metadata):
-        ''' process it '''
+    def process(self, metadata, filemap: t.Optional[mmap.mmap] = None):
+        ''' process it
+
+            if filemap is given, read from it instead of opening the file
+            and leave the pictures for images() '''
 
         if not metadata:
             return metadata
@@ -520,7 +777,16 @@ class AudioMetadataRunner:  # pylint: disable=too-few-public-methods
             return metadata
 
         self.metadata = metadata
-        self._process_audio_metadata()
+        self._process_audio_metadata(filemap)
+        if filemap is None and self.pictures and 'coverimageraw' not in self.metadata:
+            self._images(self.pictures)
+        return self.metadata
+
+    def images(self, metadata) -> dict:
+        ''' place the pictures found by process() '''
+        self.metadata = metadata
+        if self.pictures:
+            self._images(self.pictures)
         return self.metadata
 
     def _images(self, images: list[nowplaying.vendor.audio_metadata.Picture]):
@@ -528,7 +794,8 @@ class AudioMetadataRunner:  # pylint: disable=too-few-public-methods
         if 'coverimageraw' not in self.metadata:
             self.metadata['coverimageraw'] = images[0].data
 
-        if self.metadata.get("album") and self.imagecache:
+        if self.metadata.get("album") and self.imagecache and (prefix :=
+                                                               _embedded_prefix(self.metadata)):
             for index, pic in enumerate(images):
                 logging.debug("%s", type(pic))
                 if isinstance(
@@ -538,14 +805,14 @@ class AudioMetadataRunner:  # pylint: disable=too-few-public-methods
                     logging.debug("Placing audiofile_am%s MP4 front cover", index)
                     self.imagecache.put_db_cachekey(
                         identifier=self.metadata['album'],
-                        srclocation=f"{self.metadata['album']}_audiofile_am{index}",
+                        srclocation=f"{prefix}_audiofile_am{index}",
                         imagetype="front_cover",
                         content=pic.data)
                 elif getattr(pic, "type") and pic.type == 3:
                     logging.debug("Placing audiofile_am%s %s front cover", index, type(pic))
                     self.imagecache.put_db_cachekey(
                         identifier=self.metadata['album'],
-                        srclocation=f"{self.metadata['album']}_audiofile_am{index}",
+                        srclocation=f"{prefix}_audiofile_am{index}",
                         imagetype="front_cover",
                         content=pic.data)
                 else:
@@ -695,12 +962,24 @@ class AudioMetadataRunner:  # pylint: disable=too-few-public-methods
                     for tag in tags[src]:
                         self.metadata[dest].append(str(tag))
 
-    def _process_audio_metadata(self):  # pylint: disable=too-many-branches
+    def _load(self, filemap: mmap.mmap):
+        ''' audio_metadata.load() but without copying the whole file into memory '''
+        data = DataReader(MMapRaw(filemap, self.metadata['filename']))
+        if not (parser_cls := nowplaying.vendor.audio_metadata.determine_format(data)):
+            raise nowplaying.vendor.audio_metadata.UnsupportedFormat(
+                "Supported format signature not found.")
+        data.seek(0, os.SEEK_SET)
+        return parser_cls.parse(data)
+
+    def _process_audio_metadata(self, filemap: t.Optional[mmap.mmap] = None):  # pylint: disable=too-many-branches
         if not self.metadata or not self.metadata.get('filename'):
             return
 
         try:
-            base = nowplaying.vendor.audio_metadata.load(self.metadata['filename'])
+            if filemap is not None:
+                base = self._load(filemap)
+            else:
+                base = nowplaying.vendor.audio_metadata.load(self.metadata['filename'])
         except Exception as error:  # pylint: disable=broad-except
             logging.error('audio_metadata could not process %s: %s', self.metadata['filename'],
                           error)
@@ -739,8 +1018,7 @@ class AudioMetadataRunner:  # pylint: disable=too-few-public-methods
         if 'bitrate' not in self.metadata and getattr(base, 'streaminfo'):
             self.metadata['bitrate'] = base.streaminfo['bitrate']
 
-        if getattr(base, 'pictures') and 'coverimageraw' not in self.metadata:
-            self._images(base.pictures)
+        self.pictures = getattr(base, 'pictures') or []
 
         self.metadata['date'] = _date_calc(self.datedata)
 
@@ -767,6 +1045,19 @@ def recognition_replacement(config: 'nowplaying.config.ConfigFile' = None,
     return metadata
 
 
+def extras_replacement(config: 'nowplaying.config.ConfigFile' = None,
+                       metadata=None,
+                       addmeta=None) -> dict:
+    ''' recognition_replacement for artistextras results, keeping the
+        artistfanarturls found by every plugin '''
+    fanart = list(addmeta.get('artistfanarturls') or []) if addmeta else []
+    metadata = recognition_replacement(config=config, metadata=metadata, addmeta=addmeta)
+    if fanart:
+        metadata['artistfanarturls'] = list(
+            dict.fromkeys((metadata.get('artistfanarturls') or []) + fanart))
+    return metadata
+
+
 def main():
     ''' entry point as a standalone app'''
     logging.basicConfig(
@@ -777,6 +1068,11 @@ def main():
     logging.captureWarnings(True)
     bundledir = os.path.abspath(os.path.dirname(__file__))
     config = nowplaying.config.ConfigFile(bundledir=bundledir)
+    if sys.argv[1] == '--warmtags':
+        imagecache = nowplaying.imagecache.ImageCache(
+            sizelimit=config.cparser.value('artistextras/cachesize', type=int))
+        print(f'read {warm_tag_cache(config, sys.argv[2:], imagecache=imagecache)} files')
+        return
     testmeta = {'filename': sys.argv[1]}
     myclass = MetadataProcessors(config=config)
     testdata = asyncio.run(myclass.getmoremetadata(metadata=testmeta))
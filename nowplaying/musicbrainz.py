@@ -10,9 +10,11 @@ import logging.handlers
 import os
 import re
 import sys
+import typing as t
 
 from nowplaying.vendor import musicbrainzngs
 
+import nowplaying.apicache
 import nowplaying.bootstrap
 import nowplaying.config
 from nowplaying.utils import normalize_text, normalize, artist_name_variations
@@ -27,6 +29,16 @@ musicbrainzngs.musicbrainz._timeout = 30  # pylint: disable=protected-access
 musicbrainzngs.set_rate_limit(limit_or_interval=.5)
 
 
+def _fetch(func, *args, **kwargs):
+    ''' call musicbrainzngs, turning a 404 into {} so it can be cached '''
+    try:
+        return func(*args, **kwargs)
+    except musicbrainzngs.ResponseError as error:
+        if getattr(error.cause, 'code', None) == 404:
+            return {}
+        raise
+
+
 @functools.lru_cache(maxsize=128, typed=False)
 def _verify_artist_name(artistname, artistcredit):
     logging.debug('called verify_artist_name: %s vs %s', artistname, artistcredit)
@@ -52,6 +64,17 @@ class MusicBrainzHelper():
             self.config = nowplaying.config.ConfigFile()
 
         self.emailaddressset = False
+        self.apicache: t.Optional[nowplaying.apicache.APICache] = None
+
+    def _cached(self, key, func, *args, **kwargs):
+        ''' call musicbrainzngs func through the API cache.  something
+            MusicBrainz does not have raises LookupError '''
+        if not self.apicache:
+            self.apicache = nowplaying.apicache.APICache()
+        data = self.apicache.fetch('musicbrainz', key, _fetch, func, *args, **kwargs)
+        if not data:
+            raise LookupError(f'MusicBrainz does not have {key}')
+        return data
 
     def _setemail(self):
         ''' make sure the musicbrainz fetch has an email address set
@@ -297,13 +320,18 @@ class MusicBrainzHelper():
 
         for isrc in isrclist:
             with contextlib.suppress(Exception):
-                mbdata = musicbrainzngs.get_recordings_by_isrc(isrc,
-                                                               includes=['releases'],
-                                                               release_status=['official'])
+                mbdata = self._cached(f'isrc:{isrc}:official',
+                                      musicbrainzngs.get_recordings_by_isrc,
+                                      isrc,
+                                      includes=['releases'],
+                                      release_status=['official'])
         if not mbdata:
             for isrc in isrclist:
                 try:
-                    mbdata = musicbrainzngs.get_recordings_by_isrc(isrc, includes=['releases'])
+                    mbdata = self._cached(f'isrc:{isrc}',
+                                          musicbrainzngs.get_recordings_by_isrc,
+                                          isrc,
+                                          includes=['releases'])
                 except Exception as error:  # pylint: disable=broad-except
                     logging.info('musicbrainz cannot find ISRC %s: %s', isrc, error)
 
@@ -315,7 +343,6 @@ class MusicBrainzHelper():
                                reverse=True)
         return self.recordingid(recordinglist[0]['id'])
 
-    @functools.lru_cache(maxsize=128, typed=False)
     def recordingid(self, recordingid):  # pylint: disable=too-many-branches, too-many-return-statements, too-many-statements
         ''' lookup the musicbrainz information based upon recording id '''
         if not self.config.cparser.value('musicbrainz/enabled',
@@ -347,7 +374,9 @@ class MusicBrainzHelper():
             self._setemail()
 
             try:
-                mbdata = musicbrainzngs.browse_releases(
+                mbdata = self._cached(
+                    f'releases:{recordingid}:official',
+                    musicbrainzngs.browse_releases,
                     recording=recordingid,
                     includes=['artist-credits', 'labels', 'release-groups', 'release-group-rels'],
                     release_status=['official'])
@@ -357,12 +386,13 @@ class MusicBrainzHelper():
 
             if 'release-count' not in mbdata or mbdata['release-count'] == 0:
                 try:
-                    mbdata = musicbrainzngs.browse_releases(recording=recordingid,
-                                                            includes=[
-                                                                'artist-credits', 'labels',
-                                                                'release-groups',
-                                                                'release-group-rels'
-                                                            ])
+                    mbdata = self._cached(f'releases:{recordingid}',
+                                          musicbrainzngs.browse_releases,
+                                          recording=recordingid,
+                                          includes=[
+                                              'artist-credits', 'labels', 'release-groups',
+                                              'release-group-rels'
+                                          ])
                 except Exception as error:  # pylint: disable=broad-except
                     logging.error('MusicBrainz threw an error: %s', error)
                     return None
@@ -389,8 +419,10 @@ class MusicBrainzHelper():
         newdata = {'musicbrainzrecordingid': recordingid}
         try:
             logging.debug('looking up recording id %s', recordingid)
-            mbdata = musicbrainzngs.get_recording_by_id(
-                recordingid, includes=['artists', 'genres', 'release-group-rels'])
+            mbdata = self._cached(f'recording:{recordingid}',
+                                  musicbrainzngs.get_recording_by_id,
+                                  recordingid,
+                                  includes=['artists', 'genres', 'release-group-rels'])
         except Exception as error:  # pylint: disable=broad-except
             logging.error('MusicBrainz does not know recording id %s: %s', recordingid, error)
             return None
@@ -438,14 +470,17 @@ class MusicBrainzHelper():
         if 'cover-art-archive' in release and 'artwork' in release['cover-art-archive'] and release[
                 'cover-art-archive']['artwork'] == 'true':
             try:
-                newdata['coverimageraw'] = musicbrainzngs.get_image_front(release['id'])
+                newdata['coverimageraw'] = self._cached(f"front:{release['id']}",
+                                                        musicbrainzngs.get_image_front,
+                                                        release['id'])
             except Exception as error:  # pylint: disable=broad-except
                 logging.error('Failed to get release cover art: %s', error)
 
         if not newdata.get('coverimageraw'):
             try:
-                newdata['coverimageraw'] = musicbrainzngs.get_release_group_image_front(
-                    release['release-group']['id'])
+                newdata['coverimageraw'] = self._cached(
+                    f"groupfront:{release['release-group']['id']}",
+                    musicbrainzngs.get_release_group_image_front, release['release-group']['id'])
             except Exception as error:  # pylint: disable=broad-except
                 logging.error('Failed to get release group cover art: %s', error)
 
@@ -475,7 +510,10 @@ class MusicBrainzHelper():
             if self.config.cparser.value('acoustidmb/musicbrainz', type=bool):
                 sitelist.append(f'https://musicbrainz.org/artist/{artistid}')
             try:
-                webdata = musicbrainzngs.get_artist_by_id(artistid, includes=['url-rels'])
+                webdata = self._cached(f'artist:{artistid}',
+                                       musicbrainzngs.get_artist_by_id,
+                                       artistid,
+                                       includes=['url-rels'])
             except Exception as error:  # pylint: disable=broad-except
                 logging.error('MusicBrainz does not know artistid id %s: %s', artistid, error)
                 return None
@@ -22,6 +22,7 @@ import nowplaying.bootstrap
 import nowplaying.config
 import nowplaying.db
 import nowplaying.frozen
+import nowplaying.trackbus
 import nowplaying.utils
 
 
@@ -134,10 +135,11 @@ class DiscordSupport:
         }
 
         metadb = nowplaying.db.MetadataDB()
-        watcher = metadb.watcher()
-        watcher.start()
+        trackbus = nowplaying.trackbus.TrackSubscriber('discordbot', blobs=False)
+        await trackbus.start()
 
-        mytime = 0
+        # -1 so that whatever is already in the metadb gets sent at startup
+        lastseq = -1
 
         while not self.stopevent.is_set():
             if not self.config.cparser.value('discord/enabled', type=bool):
@@ -148,17 +150,17 @@ class DiscordSupport:
             # discord will lock out if updates more than every 15 seconds
             await asyncio.sleep(20)
 
-            if mytime < watcher.updatetime:
+            if lastseq < trackbus.seq:
                 template = self.config.cparser.value('discord/template')
                 if not template:
                     continue
 
-                metadata = await metadb.read_last_meta_async()
+                metadata = trackbus.latest() or await metadb.read_last_meta_async(blobs=False)
                 if not metadata:
                     continue
 
                 templatehandler = nowplaying.utils.TemplateHandler(filename=template)
-                mytime = watcher.updatetime
+                lastseq = trackbus.seq
                 templateout = templatehandler.generate(metadata)
                 for mode, func in client.items():
                     if self.client.get(mode):
@@ -169,7 +171,7 @@ class DiscordSupport:
                             for line in traceback.format_exc().splitlines():
                                 logging.error(line)
                             del self.client[mode]
-        watcher.stop()
+        await trackbus.stop()
         if self.client.get('bot'):  # pylint: disable=consider-using-dict-items
             await self.client['bot'].close()
 
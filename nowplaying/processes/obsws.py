@@ -21,6 +21,7 @@ import nowplaying.bootstrap
 import nowplaying.config
 import nowplaying.db
 import nowplaying.frozen
+import nowplaying.trackbus
 import nowplaying.utils
 
 
@@ -38,21 +39,23 @@ class OBSWebSocketHandler:  #pylint: disable=too-many-instance-attributes
         self.obswsport = None
         self.obswssecret = None
         self.obswshost = None
-        self.watcher = None
-        self.start()
+        self.trackbus = None
+        self.metadata = None
         asyncio.run(self.webclient())
 
-    def start(self):
-        ''' run our thread '''
+    async def start(self):
+        ''' subscribe to the track bus '''
 
-        if self.config.cparser.value('obsws/enabled', type=bool) and not self.watcher:
-            self.watcher = self.metadb.watcher()
-            self.watcher.start(customhandler=self.process_update)
-            self.process_update(None)
+        if self.config.cparser.value('obsws/enabled', type=bool) and not self.trackbus:
+            self.trackbus = nowplaying.trackbus.TrackSubscriber('obsws', blobs=False)
+            self.trackbus.add_callback(self.process_update)
+            await self.trackbus.start()
+            await self.process_update(await self.metadb.read_last_meta_async(blobs=False))
 
     async def webclient(self):
         ''' run the web client '''
 
+        await self.start()
         lasttext = None
         while not self.stopevent.is_set():
             if not self.updateevent.is_set():
@@ -95,19 +98,22 @@ class OBSWebSocketHandler:  #pylint: disable=too-many-instance-attributes
 
         self.stopevent.clear()
         self.updateevent.clear()
+        if self.trackbus:
+            await self.trackbus.stop()
         if self.client:
             await self.client.disconnect()
 
-    def process_update(self, event):  # pylint: disable=unused-argument
-        ''' watcher picked up an update, so execute on it '''
+    async def process_update(self, metadata):
+        ''' track bus delivered an update, so execute on it '''
+        if metadata:
+            self.metadata = metadata
         self.text = self.generate_text()
         if self.text:
             self.updateevent.set()
 
     def generate_text(self, clear=False):
         ''' convert template '''
-        metadata = self.metadb.read_last_meta()
-        if not metadata:
+        if not (metadata := self.metadata):
             return None
 
         template = self.config.cparser.value('obsws/template')
@@ -166,8 +172,6 @@ class OBSWebSocketHandler:  #pylint: disable=too-many-instance-attributes
         logging.debug('OBSWS asked to stop')
         self.stopevent.set()
         self.updateevent.set()
-        if self.watcher:
-            self.watcher.stop()
 
     def __del__(self):
         logging.debug('Stopping OBSWS')
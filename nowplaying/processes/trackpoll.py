@@ -3,6 +3,7 @@
 
 import asyncio
 import contextlib
+import copy
 import multiprocessing
 import logging
 import os
@@ -22,6 +23,7 @@ import nowplaying.metadata
 import nowplaying.pluginimporter
 import nowplaying.trackrequests
 import nowplaying.textoutput
+import nowplaying.trackbus
 import nowplaying.utils
 
 COREMETA = ['artist', 'filename', 'title']
@@ -57,6 +59,11 @@ class TrackPoll():  # pylint: disable=too-many-instance-attributes
         self.imagecache: nowplaying.imagecache.ImageCache = None
         self.icprocess = None
         self.trackrequests = None
+        self.trackbus = nowplaying.trackbus.TrackPublisher()
+        self.metadb = None
+        # held while currentmeta is switched, written, or republished so the
+        # late artist extras can never interleave with a new track
+        self.publishlock = asyncio.Lock()
         if not self.config.cparser.value('control/beam', type=bool):
             self._setup_imagecache()
             self.trackrequests = nowplaying.trackrequests.Requests(config=self.config,
@@ -299,51 +306,96 @@ class TrackPoll():  # pylint: disable=too-many-instance-attributes
         if self._ismetaempty(nextmeta) or self._ismetasame(nextmeta) or self._isignored(nextmeta):
             return
 
-        # fill in the blanks and make it live
-        oldmeta = self.currentmeta
-        try:
-            self.currentmeta = await self._fillinmetadata(nextmeta)
-        except Exception as err:  # pylint: disable=broad-except
-            logging.exception('Ignoring the %s crash and just keep going!', err)
-            await asyncio.sleep(5)
-            self.currentmeta = nextmeta
-
-        logging.info('Potential new track: %s / %s', self.currentmeta['artist'],
-                     self.currentmeta['title'])
-
-        if await self.checkskip(nextmeta):
-            logging.info('Skipping %s / %s', self.currentmeta['artist'], self.currentmeta['title'])
-            return
-
-        # try to interleave downloads in-between the delay
-        await self._half_delay_write()
-        await self._process_imagecache()
-        self._start_artistfanartpool()
-        await self._half_delay_write()
-        await self._process_imagecache()
-        self._start_artistfanartpool()
-        await asyncio.sleep(0.5)
-
-        # checkagain
-        nextcheck = await self.input.getplayingtrack()
-        if not self._ismetaempty(nextcheck) and not self._ismetasame(nextcheck):
-            logging.info('Track changed during delay, skipping')
-            self.currentmeta = oldmeta
+        async with self.publishlock:
+            # fill in the blanks and make it live
+            oldmeta = self.currentmeta
+            try:
+                self.currentmeta = await self._fillinmetadata(nextmeta)
+            except Exception as err:  # pylint: disable=broad-except
+                logging.exception('Ignoring the %s crash and just keep going!', err)
+                await asyncio.sleep(5)
+                self.currentmeta = nextmeta
+            latefutures = self.metadataprocessors.latefutures
+
+            logging.info('Potential new track: %s / %s', self.currentmeta['artist'],
+                         self.currentmeta['title'])
+
+            if await self.checkskip(nextmeta):
+                logging.info('Skipping %s / %s', self.currentmeta['artist'],
+                             self.currentmeta['title'])
+                return
+
+            # try to interleave downloads in-between the delay
+            await self._half_delay_write()
+            await self._process_imagecache()
+            self._start_artistfanartpool()
+            await self._half_delay_write()
+            await self._process_imagecache()
+            self._start_artistfanartpool()
+            await asyncio.sleep(0.5)
+
+            # checkagain
+            nextcheck = await self.input.getplayingtrack()
+            if not self._ismetaempty(nextcheck) and not self._ismetasame(nextcheck):
+                logging.info('Track changed during delay, skipping')
+                self.currentmeta = oldmeta
+                return
+
+            if self.config.cparser.value(
+                    'settings/requests',
+                    type=bool) and not self.config.cparser.value('control/beam', type=bool):
+                if data := await self.trackrequests.get_request(self.currentmeta):
+                    self.currentmeta.update(data)
+
+            self._start_artistfanartpool()
+            self._artfallbacks()
+
+            if not self.testmode:
+                if not self.metadb:
+                    # kept for the life of the process so the previoustrack
+                    # window is cached instead of re-read on every track
+                    self.metadb = nowplaying.db.MetadataDB()
+                if dbid := await self.metadb.write_to_metadb(metadata=self.currentmeta):
+                    record = await self.metadb.make_record_async(self.currentmeta, dbid)
+                    await self.trackbus.publish(record)
+                    self._start_late_artistextras(dbid, latefutures)
+            self._write_to_text()
+
+    def _start_late_artistextras(self, dbid, latefutures):
+        if not latefutures:
             return
+        task = self.loop.create_task(
+            self._late_artistextras(self.currentmeta, dbid, latefutures))
+        task.add_done_callback(self.tasks.remove)
+        self.tasks.add(task)
 
-        if self.config.cparser.value(
-                'settings/requests',
-                type=bool) and not self.config.cparser.value('control/beam', type=bool):
-            if data := await self.trackrequests.get_request(self.currentmeta):
-                self.currentmeta.update(data)
-
-        self._start_artistfanartpool()
-        self._artfallbacks()
-
-        if not self.testmode:
-            metadb = nowplaying.db.MetadataDB()
-            await metadb.write_to_metadb(metadata=self.currentmeta)
-        self._write_to_text()
+    async def _late_artistextras(self, metadata, dbid, latefutures):
+        ''' publish what the artistextras plugins that missed the deadline found '''
+        addmeta = await self.metadataprocessors.late_artist_extras(latefutures)
+        async with self.publishlock:
+            if self.currentmeta is not metadata or self.stopevent.is_set():
+                logging.debug('track changed before the late artist extras arrived')
+                return
+
+            # plugins only ever saw copies, so this is what was published
+            before = copy.deepcopy(self.currentmeta)
+            self.currentmeta = nowplaying.metadata.extras_replacement(
+                config=self.config, metadata=self.currentmeta, addmeta=addmeta)
+            self._start_artistfanartpool()
+            await self._process_imagecache()
+            self._artfallbacks()
+            if self.currentmeta == before:
+                logging.debug('late artist extras did not add anything')
+                return
+
+            logging.debug('publishing late artist extras for %s', self.currentmeta.get('artist'))
+            revision = await self.metadb.update_in_metadb(dbid, metadata=self.currentmeta)
+            if revision is not None:
+                record = await self.metadb.make_record_async(self.currentmeta,
+                                                             dbid,
+                                                             revision=revision)
+                await self.trackbus.publish(record)
+            self._write_to_text()
 
     def _artfallbacks(self):
         if self.config.cparser.value(
@@ -395,11 +447,16 @@ class TrackPoll():  # pylint: disable=too-many-instance-attributes
         self.imagecache = nowplaying.imagecache.ImageCache(sizelimit=sizelimit,
                                                            stopevent=self.stopevent)
         self.config.cparser.setValue('artistextras/cachedbfile', self.imagecache.databasefile)
+        hostlimits = {
+            domain: self.config.cparser.value(f'artistextras/connections/{provider}', type=int)
+            for provider, domain in nowplaying.imagecache.PROVIDERHOSTS.items()
+        }
         self.icprocess = multiprocessing.Process(target=self.imagecache.queue_process,
                                                  name='ICProcess',
                                                  args=(
                                                      self.config.logpath,
                                                      workers,
+                                                     hostlimits,
                                                  ))
         self.icprocess.start()
 
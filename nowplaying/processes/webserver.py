@@ -4,6 +4,9 @@
 import asyncio
 import base64
 import contextlib
+import copy
+import datetime
+import json
 import logging
 import logging.config
 import os
@@ -15,6 +18,7 @@ import sys
 import threading
 import time
 import traceback
+import typing as t
 import weakref
 
 import requests
@@ -41,9 +45,13 @@ import nowplaying.db
 import nowplaying.frozen
 import nowplaying.hostmeta
 import nowplaying.imagecache
+import nowplaying.trackbus
 import nowplaying.trackrequests
 import nowplaying.utils
 
+HISTORYLIMIT = 25
+HISTORYMAXLIMIT = 500
+
 INDEXREFRESH = \
     '<!doctype html><html lang="en">' \
     '<head><meta http-equiv="refresh" content="5" ></head>' \
@@ -53,7 +61,100 @@ CONFIG_KEY = web.AppKey('config', nowplaying.config.ConfigFile)
 METADB_KEY = web.AppKey("metadb", nowplaying.db.MetadataDB)
 WS_KEY = web.AppKey("websockets", weakref.WeakSet)
 IC_KEY = web.AppKey("imagecache", nowplaying.imagecache.ImageCache)
-WATCHER_KEY = web.AppKey("watcher", nowplaying.db.DBWatcher)
+TRACKBUS_KEY = web.AppKey("trackbus", nowplaying.trackbus.TrackSubscriber)
+
+
+class WSStreamBroadcaster:
+    ''' serialize each new track once and push it to every /wsstream client
+
+        each client gets a single slot queue: a client that is still busy
+        sending an older frame only ever gets the newest one next
+    '''
+
+    def __init__(self, trackbus: nowplaying.trackbus.TrackSubscriber, encoder):
+        self.trackbus = trackbus
+        self.encoder = encoder
+        self.clients: set[asyncio.Queue] = set()
+        self.seq = 0
+        self.frame = None
+
+    def subscribe(self) -> asyncio.Queue:
+        ''' register a client, primed with the current frame '''
+        client = asyncio.Queue(maxsize=1)
+        if self.frame:
+            client.put_nowait(self.frame)
+        self.clients.add(client)
+        return client
+
+    def unsubscribe(self, client: asyncio.Queue):
+        ''' drop a client '''
+        self.clients.discard(client)
+
+    def publish(self, frame: str):
+        ''' hand frame to every client, replacing anything unsent '''
+        self.frame = frame
+        for client in self.clients:
+            if client.full():
+                client.get_nowait()
+            client.put_nowait(frame)
+
+    async def run(self, stopevent):
+        ''' wait on the track bus and publish every new track '''
+        while not stopevent.is_set():
+            if not await self.trackbus.wait_for_update(self.seq, timeout=1):
+                continue
+            self.seq = self.trackbus.seq
+            if metadata := self.trackbus.latest():
+                try:
+                    self.publish(self.encoder(metadata))
+                except Exception as error:  #pylint: disable=broad-except
+                    logging.error('wsstream broadcaster exception: %s', error)
+
+
+WSSTREAM_KEY = web.AppKey("wsstream", WSStreamBroadcaster)
+
+
+def trackversion(metadata: dict) -> t.Optional[tuple[int, int]]:
+    ''' (dbid, dbrevision) of a track.  late artist extras keep the dbid but
+        bump the revision, so caches of the track's contents key on both '''
+    if (dbid := metadata.get('dbid')) is None:
+        return None
+    return dbid, metadata.get('dbrevision') or 0
+
+
+class PayloadCache:
+    ''' fully serialized JSON variants of the current track, built once per
+        (dbid, dbrevision)
+
+        a new track or a late update evicts everything built for the previous one
+    '''
+
+    def __init__(self, builders: dict[str, t.Callable[[dict], dict]]):
+        self.builders = builders
+        self.version = None
+        self.payloads: dict[str, str] = {}
+
+    def fill(self, metadata: dict) -> dict[str, str]:
+        ''' every variant of metadata, serializing them if it is a new track '''
+        version = trackversion(metadata)
+        if version is not None and version == self.version:
+            return self.payloads
+
+        payloads = {
+            variant: json.dumps(builder(copy.copy(metadata)))
+            for variant, builder in self.builders.items()
+        }
+        if version is not None:
+            self.version = version
+            self.payloads = payloads
+        return payloads
+
+    def payload(self, metadata: dict, variant: str) -> str:
+        ''' a single serialized variant of metadata '''
+        return self.fill(metadata)[variant]
+
+
+PAYLOAD_KEY = web.AppKey("payloads", PayloadCache)
 
 
 class WebHandler():  # pylint: disable=too-many-public-methods
@@ -62,6 +163,8 @@ class WebHandler():  # pylint: disable=too-many-public-methods
     def __init__(self, bundledir=None, config=None, stopevent=None, testmode=False):
         threading.current_thread().name = 'WebServer'
         self.tasks = set()
+        # ((dbid, dbrevision), when this process first saw it) for Last-Modified
+        self.lastmodified = (None, None)
         self.testmode = testmode
         if not config:
             config = nowplaying.config.ConfigFile(bundledir=bundledir, testmode=testmode)
@@ -111,6 +214,13 @@ class WebHandler():  # pylint: disable=too-many-public-methods
             await asyncio.sleep(.5)
         await self.forced_stop()
 
+    @staticmethod
+    async def _get_metadata(request, blobs=True):
+        ''' latest track from the bus, falling back to the metadb until the first publish '''
+        if metadata := request.app[TRACKBUS_KEY].latest():
+            return metadata
+        return await request.app[METADB_KEY].read_last_meta_async(blobs=blobs)
+
     @staticmethod
     def _base64ifier(metadata):
         ''' replace all the binary data with base64 data '''
@@ -121,6 +231,7 @@ class WebHandler():  # pylint: disable=too-many-public-methods
                 del metadata[key]
         if metadata.get('dbid'):
             del metadata['dbid']
+        metadata.pop('dbrevision', None)
         return metadata
 
     def _transparentifier(self, metadata):
@@ -130,6 +241,15 @@ class WebHandler():  # pylint: disable=too-many-public-methods
                 metadata[key] = nowplaying.utils.TRANSPARENT_PNG_BIN
         return self._base64ifier(metadata)
 
+    @staticmethod
+    def _noimagesifier(metadata):
+        ''' remove all the binary data '''
+        for key in nowplaying.db.METADATABLOBLIST:
+            metadata.pop(key, None)
+        metadata.pop('dbid', None)
+        metadata.pop('dbrevision', None)
+        return metadata
+
     async def index_htm_handler(self, request):
         ''' handle web output '''
         return await self._metacheck_htm_handler(request, 'weboutput/htmltemplate')
@@ -161,13 +281,12 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         ''' handle web output '''
         return await self._metacheck_htm_handler(request, 'weboutput/requestertemplate')
 
-    @staticmethod
-    async def _htm_handler(request, template, metadata=None):  # pylint: disable=unused-argument
+    async def _htm_handler(self, request, template, metadata=None):  # pylint: disable=unused-argument
         ''' handle static html files'''
         htmloutput = INDEXREFRESH
         try:
             if not metadata:
-                metadata = await request.app[METADB_KEY].read_last_meta_async()
+                metadata = await self._get_metadata(request, blobs=False)
             if not metadata:
                 metadata = nowplaying.hostmeta.gethostmeta()
                 metadata['httpport'] = request.app[CONFIG_KEY].cparser.value('weboutput/httpport',
@@ -186,7 +305,7 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         source = os.path.basename(template)
         htmloutput = ""
         request.app[CONFIG_KEY].get()
-        metadata = await request.app[METADB_KEY].read_last_meta_async()
+        metadata = await self._get_metadata(request, blobs=False)
         lastid = await self.getlastid(request, source)
         once = request.app[CONFIG_KEY].cparser.value('weboutput/once', type=bool)
         #once = False
@@ -228,10 +347,9 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         await cursor.close()
         return lastid
 
-    @staticmethod
-    async def indextxt_handler(request):
+    async def indextxt_handler(self, request):
         ''' handle static index.txt '''
-        metadata = await request.app[METADB_KEY].read_last_meta_async()
+        metadata = await self._get_metadata(request, blobs=False)
         txtoutput = ""
         if metadata:
             request.app[CONFIG_KEY].get()
@@ -250,20 +368,57 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         return web.FileResponse(path=request.app[CONFIG_KEY].iconfile)
 
     @staticmethod
-    async def _image_handler(imgtype, request):
+    def _not_modified(request, etag, lastmodified):
+        ''' check If-None-Match (or, without it, If-Modified-Since) against our validators '''
+        if request.if_none_match:
+            return any(check.value in (etag, '*') for check in request.if_none_match)
+        return bool(request.if_modified_since and request.if_modified_since >= lastmodified)
+
+    def _last_modified(self, version):
+        ''' when this webserver first saw this version of the track '''
+        if self.lastmodified[0] != version:
+            self.lastmodified = (version,
+                                 datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0))
+        return self.lastmodified[1]
+
+    @staticmethod
+    def _set_validators(response, etag, lastmodified):
+        ''' mark a response as cacheable but always revalidated '''
+        response.etag = etag
+        response.last_modified = lastmodified
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
+
+    async def _image_handler(self, imgtype, request):
         ''' handle an image '''
 
         # rather than return an error, just send a transparent PNG
         # this makes the client code significantly easier
         image = nowplaying.utils.TRANSPARENT_PNG_BIN
+        etag = None
+        lastmodified = None
         try:
-            metadata = await request.app[METADB_KEY].read_last_meta_async()
-            if metadata and metadata.get(imgtype):
-                image = metadata[imgtype]
+            metadata = await self._get_metadata(request, blobs=False)
+            if metadata and metadata.get('dbid'):
+                imagehash = metadata.get(nowplaying.db.BLOBHASHKEYS[imgtype])
+                etag = f'{metadata["dbid"]}-{imagehash or "none"}'
+                lastmodified = self._last_modified(trackversion(metadata))
+                if self._not_modified(request, etag, lastmodified):
+                    return self._set_validators(web.Response(status=304), etag, lastmodified)
+                if imagehash:
+                    if blob := metadata.get(imgtype) or await request.app[
+                            METADB_KEY].read_blob_async(imagehash):
+                        image = blob
+                    else:
+                        etag = None
         except Exception:  # pylint: disable=broad-except
+            etag = None
             for line in traceback.format_exc().splitlines():
                 logging.error(line)
-        return web.Response(content_type='image/png', body=image)
+        response = web.Response(content_type='image/png', body=image)
+        if etag:
+            self._set_validators(response, etag, lastmodified)
+        return response
 
     async def cover_handler(self, request):
         ''' handle cover image '''
@@ -283,15 +438,40 @@ class WebHandler():  # pylint: disable=too-many-public-methods
 
     async def api_v1_last_handler(self, request):
         ''' v1/last just returns the metadata'''
-        data = {}
-        if metadata := await request.app[METADB_KEY].read_last_meta_async():
+        variant = 'plain'
+        if request.query.get('images', '').lower() in ['0', 'false', 'no']:
+            variant = 'noimages'
+        data = '{}'
+        etag = None
+        lastmodified = None
+        if metadata := await self._get_metadata(request):
             try:
-                del metadata['dbid']
-                data = self._base64ifier(metadata)
+                if metadata.get('dbid'):
+                    dbid, revision = trackversion(metadata)
+                    etag = f'{dbid}.{revision}-{variant}'
+                    lastmodified = self._last_modified((dbid, revision))
+                    if self._not_modified(request, etag, lastmodified):
+                        return self._set_validators(web.Response(status=304), etag, lastmodified)
+                data = request.app[PAYLOAD_KEY].payload(metadata, variant)
             except Exception:  # pylint: disable=broad-except
+                etag = None
                 for line in traceback.format_exc().splitlines():
                     logging.debug(line)
-        return web.json_response(data)
+        response = web.Response(text=data, content_type='application/json')
+        if etag:
+            self._set_validators(response, etag, lastmodified)
+        return response
+
+    @staticmethod
+    async def api_v1_history_handler(request):
+        ''' v1/history pages through everything played, newest first '''
+        try:
+            before = int(request.query.get('before', 0)) or None
+            limit = min(max(int(request.query.get('limit', HISTORYLIMIT)), 1), HISTORYMAXLIMIT)
+        except ValueError:
+            return web.json_response({'error': 'before and limit must be integers'}, status=400)
+        return web.json_response(await request.app[METADB_KEY].read_history_async(before=before,
+                                                                                  limit=limit))
 
     async def websocket_gifwords_streamer(self, request):
         ''' handle continually streamed updates '''
@@ -339,7 +519,7 @@ class WebHandler():  # pylint: disable=too-many-public-methods
 
         try:
             while not self.stopevent.is_set() and not endloop and not websocket.closed:
-                metadata = await request.app[METADB_KEY].read_last_meta_async()
+                metadata = await self._get_metadata(request)
                 if not metadata or not metadata.get('artist'):
                     await asyncio.sleep(5)
                     continue
@@ -378,25 +558,19 @@ class WebHandler():  # pylint: disable=too-many-public-methods
 
     async def websocket_lastjson_handler(self, request, websocket):
         ''' handle singular websocket request '''
-        metadata = await request.app[METADB_KEY].read_last_meta_async()
-        del metadata['dbid']
-        if not websocket.closed:
-            await websocket.send_json(self._base64ifier(metadata))
-
-    async def _wss_do_update(self, websocket, database):
-        # early launch can be a bit weird so
-        # pause a bit
-        await asyncio.sleep(1)
-        metadata = None
-        while not metadata and not websocket.closed:
-            if self.stopevent.is_set():
-                return time.time()
-            metadata = await database.read_last_meta_async()
+        metadata = await self._get_metadata(request)
+        if metadata and not websocket.closed:
+            await websocket.send_str(request.app[PAYLOAD_KEY].payload(metadata, 'plain'))
+
+    async def _wsstream_fallback(self, websocket, request, client):
+        ''' nothing published yet, so wait for the metadb to have something '''
+        while client.empty() and not websocket.closed and not self.stopevent.is_set():
+            if metadata := await self._get_metadata(request):
+                if client.empty():
+                    await websocket.send_str(request.app[PAYLOAD_KEY].payload(
+                        metadata, 'transparent'))
+                return
             await asyncio.sleep(1)
-        del metadata['dbid']
-        if not websocket.closed:
-            await websocket.send_json(self._transparentifier(metadata))
-        return time.time()
 
     async def websocket_streamer(self, request):
         ''' handle continually streamed updates '''
@@ -404,20 +578,22 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         websocket = web.WebSocketResponse()
         await websocket.prepare(request)
         request.app[WS_KEY].add(websocket)
+        client = request.app[WSSTREAM_KEY].subscribe()
 
         try:
-            mytime = await self._wss_do_update(websocket, request.app[METADB_KEY])
+            await self._wsstream_fallback(websocket, request, client)
             while not self.stopevent.is_set() and not websocket.closed:
-                while mytime > request.app[WATCHER_KEY].updatetime and not self.stopevent.is_set():
-                    await asyncio.sleep(1)
-
-                mytime = await self._wss_do_update(websocket, request.app[METADB_KEY])
-                await asyncio.sleep(1)
+                try:
+                    frame = await asyncio.wait_for(client.get(), timeout=1)
+                except asyncio.TimeoutError:
+                    continue
+                await websocket.send_str(frame)
             if not websocket.closed:
                 await websocket.send_json({'last': True})
         except Exception as error:  #pylint: disable=broad-except
             logging.error('websocket streamer exception: %s', error)
         finally:
+            request.app[WSSTREAM_KEY].unsubscribe(client)
             await websocket.close()
             request.app[WS_KEY].discard(websocket)
         return websocket
@@ -465,6 +641,7 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         app.add_routes([
             web.get('/', self.index_htm_handler),
             web.get('/v1/last', self.api_v1_last_handler),
+            web.get('/v1/history', self.api_v1_history_handler),
             web.get('/cover.png', self.cover_handler),
             web.get('/artistfanart.htm', self.artistfanartlaunch_htm_handler),
             web.get('/artistbanner.png', self.artistbanner_handler),
@@ -512,8 +689,18 @@ class WebHandler():  # pylint: disable=too-many-public-methods
         app[METADB_KEY] = nowplaying.db.MetadataDB()
         if not self.testmode:
             app[IC_KEY] = nowplaying.imagecache.ImageCache()
-        app[WATCHER_KEY] = app[METADB_KEY].watcher()
-        app[WATCHER_KEY].start()
+        app[TRACKBUS_KEY] = nowplaying.trackbus.TrackSubscriber('webserver')
+        await app[TRACKBUS_KEY].start()
+        app[PAYLOAD_KEY] = PayloadCache({
+            'plain': self._base64ifier,
+            'transparent': self._transparentifier,
+            'noimages': self._noimagesifier,
+        })
+        app[WSSTREAM_KEY] = WSStreamBroadcaster(
+            app[TRACKBUS_KEY], lambda metadata: app[PAYLOAD_KEY].payload(metadata, 'transparent'))
+        task = asyncio.create_task(app[WSSTREAM_KEY].run(self.stopevent))
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
         app['statedb'] = await aiosqlite.connect(self.databasefile)
         app['statedb'].row_factory = aiosqlite.Row
         cursor = await app['statedb'].cursor()
@@ -533,7 +720,7 @@ class WebHandler():  # pylint: disable=too-many-public-methods
     async def on_cleanup(app):
         ''' cleanup the app '''
         await app['statedb'].close()
-        app[WATCHER_KEY].stop()
+        await app[TRACKBUS_KEY].stop()
 
     async def stop_server(self, request):
         ''' stop our server '''
@@ -2,13 +2,18 @@
 # pylint: disable=invalid-name
 ''' Use acoustid w/help from musicbrainz to recognize the file '''
 
+import concurrent.futures
+import contextlib
 import copy
+import hashlib
+import itertools
 import json
 import os
 import pathlib
 import subprocess
 import sys
 import time
+import typing as t
 
 import logging
 import logging.config
@@ -19,6 +24,7 @@ from PySide6.QtWidgets import QFileDialog  # pylint: disable=no-name-in-module
 
 import acoustid
 
+import nowplaying.apicache
 import nowplaying.bootstrap
 import nowplaying.config
 from nowplaying.recognition import RecognitionPlugin
@@ -27,6 +33,12 @@ import nowplaying.musicbrainz
 import nowplaying.utils
 
 
+def _fpcalc_worker(fpcalcexe: str, filename: str) -> tuple[str, t.Optional[dict]]:
+    ''' run fpcalc in a pre-fingerprinting process '''
+    os.environ['FPCALC'] = fpcalcexe
+    return filename, Plugin._fpcalc(filename)  # pylint: disable=protected-access
+
+
 class Plugin(RecognitionPlugin):
     ''' handler for acoustidmb '''
 
@@ -35,8 +47,35 @@ class Plugin(RecognitionPlugin):
         self.musicbrainz = nowplaying.musicbrainz.MusicBrainzHelper(self.config)
         self.acoustidmd = {}
         self.fpcalcexe = None
+        self.apicache: t.Optional[nowplaying.apicache.APICache] = None
         self.displayname = "AcoustID/MusicBrainz"
 
+    def _cache(self) -> nowplaying.apicache.APICache:
+        if not self.apicache:
+            self.apicache = nowplaying.apicache.APICache()
+        return self.apicache
+
+    def _fingerprint(self, filename):
+        ''' fpcalc data for filename, cached by path, size, and mtime '''
+        if not (key := nowplaying.utils.file_identity(filename)):
+            logging.error('Cannot read %s', filename)
+            return None
+        # the key changes with the file, so a cached fingerprint never needs a refresh
+        if cached := self._cache().get('fpcalc', key):
+            return cached[0]
+        if not self._configure_fpcalc(fpcalcexe=self.config.cparser.value('acoustidmb/fpcalcexe')):
+            logging.error('fpcalc is not configured')
+            return None
+        data = self._fpcalc(filename)
+        self._cache().put('fpcalc', key, data)
+        return data
+
+    def _lookup(self, apikey, fingerprint, duration):
+        ''' acoustid results for a fingerprint, cached '''
+        key = hashlib.sha256(f'{duration}:{fingerprint}'.encode('utf-8')).hexdigest()
+        return self._cache().fetch('acoustid', key, self._fetch_from_acoustid, apikey, fingerprint,
+                                   duration)
+
     @staticmethod
     def _fpcalc(filename):
         ''' run fpcalc against the given filename '''
@@ -285,12 +324,7 @@ class Plugin(RecognitionPlugin):
                     logging.warning('No filename in metadata')
                     return None
 
-                if not self._configure_fpcalc(
-                        fpcalcexe=self.config.cparser.value('acoustidmb/fpcalcexe')):
-                    logging.error('fpcalc is not configured')
-                    return None
-
-                data = self._fpcalc(metadata['filename'])
+                data = self._fingerprint(metadata['filename'])
             else:
                 data = {
                     'fingerprint': metadata['fpcalcfingerprint'],
@@ -307,7 +341,7 @@ class Plugin(RecognitionPlugin):
                 return None
 
             apikey = self.config.cparser.value('acoustidmb/acoustidapikey')
-            results = self._fetch_from_acoustid(
+            results = self._lookup(
                 apikey,
                 data['fingerprint'],
                 data['duration'],
@@ -335,6 +369,38 @@ class Plugin(RecognitionPlugin):
             self.acoustidmd.update(musicbrainzlookup)
         return self.acoustidmd
 
+    def prefingerprint(self, paths, workers=None, lookup=True) -> int:
+        ''' fingerprint every audio file in paths (files, directories, or m3u
+            playlists) ahead of time so that playing them later does not need
+            fpcalc.  with lookup, also fill the acoustid and musicbrainz caches.
+            returns how many files were fingerprinted '''
+
+        if not self._configure_fpcalc(fpcalcexe=self.config.cparser.value('acoustidmb/fpcalcexe')):
+            logging.error('fpcalc is not configured')
+            return 0
+
+        todo = [
+            filename for filename in nowplaying.utils.audio_files(paths)
+            if (key := nowplaying.utils.file_identity(filename))
+            and not self._cache().get('fpcalc', key)
+        ]
+        if not todo:
+            return 0
+
+        workers = workers or nowplaying.utils.idle_workers()
+        logging.info('Pre-fingerprinting %s files with %s processes', len(todo), workers)
+        count = 0
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            for filename, data in pool.map(_fpcalc_worker, itertools.repeat(self.fpcalcexe), todo):
+                if not data or not (key := nowplaying.utils.file_identity(filename)):
+                    continue
+                self._cache().put('fpcalc', key, data)
+                count += 1
+                if lookup and self.config.cparser.value('acoustidmb/enabled', type=bool):
+                    with contextlib.suppress(Exception):
+                        self.recognize({'filename': filename})
+        return count
+
     def providerinfo(self):
         ''' return list of what is provided by this recognition system '''
         return self.musicbrainz.providerinfo()
@@ -444,15 +510,22 @@ class Plugin(RecognitionPlugin):
 
 
 def main():
-    ''' integration test '''
-    filename = sys.argv[1]
+    ''' integration test
 
+        with --prefingerprint, fingerprint the given directories/playlists/files instead
+    '''
     bundledir = os.path.abspath(os.path.dirname(__file__))
     logging.basicConfig(level=logging.DEBUG)
     nowplaying.bootstrap.set_qt_names()
     # need to make sure config is initialized with something
     nowplaying.config.ConfigFile(bundledir=bundledir)
     plugin = Plugin()
+
+    if sys.argv[1] == '--prefingerprint':
+        print(f'fingerprinted {plugin.prefingerprint(sys.argv[2:])} files')
+        return
+
+    filename = sys.argv[1]
     metadata = plugin.recognize({'filename': filename})
     if not metadata:
         print('No information')
@@ -81,13 +81,27 @@ class Tray:  # pylint: disable=too-many-instance-attributes
 
         # Start the track notify handler
         metadb = nowplaying.db.MetadataDB()
+        self.metadbfiles = metadb.watchfiles()
         self.watcher = QFileSystemWatcher()
-        self.watcher.addPath(str(metadb.databasefile))
+        # the -wal file comes and goes, so watch the directory
+        # to pick it back up
+        self.watcher.addPath(str(metadb.databasefile.parent))
+        self.watcher.directoryChanged.connect(self._watch_metadb)
         self.watcher.fileChanged.connect(self.tracknotify)
+        self._watch_metadb()
 
         self.requestswindow = None
         self._configure_twitchrequests()
 
+    def _watch_metadb(self, path=None):  # pylint: disable=unused-argument
+        ''' (re-)add any metadb files that exist but are not watched '''
+        watched = self.watcher.files()
+        if missing := [
+                str(metadbfile) for metadbfile in self.metadbfiles
+                if str(metadbfile) not in watched and metadbfile.exists()
+        ]:
+            self.watcher.addPaths(missing)
+
     def _configure_beamstatus(self, beam):
         self.config.cparser.setValue('control/beam', beam)
         # these will get filled in by their various subsystems as required
@@ -189,7 +203,7 @@ class Tray:  # pylint: disable=too-many-instance-attributes
         self.config.get()
         if self.config.notif:
             metadb = nowplaying.db.MetadataDB()
-            metadata = metadb.read_last_meta()
+            metadata = metadb.read_last_meta(blobs=False)
             if not metadata:
                 return
 
@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+''' current track publish/subscribe bus
+
+TrackPoll publishes every new track exactly once.  Output processes
+(webserver, twitchbot, discordbot, obsws, beamsender) run a subscriber
+that receives the finished record over a localhost socket instead of
+watching the metadb file and re-reading it themselves.
+
+Each subscriber listens on an ephemeral localhost port and registers
+itself by dropping a port file into the bus directory.  The publisher
+encodes a record once and pushes the same bytes to every registered
+subscriber concurrently.  Subscribers that only need text register
+as such and never receive any image data.
+
+'''
+
+import asyncio
+import contextlib
+import copy
+import json
+import logging
+import os
+import pathlib
+import struct
+import time
+import typing as t
+
+import nowplaying.db
+
+HEADER = struct.Struct('!I')
+PORTSUFFIX = '.port'
+TEXTONLYSUFFIX = f'.text{PORTSUFFIX}'
+DELIVERYTIMEOUT = 2.0
+
+
+def bus_directory() -> pathlib.Path:
+    ''' location of the subscriber registrations '''
+    return nowplaying.db.MetadataDB.init_db_var(databasefile=None).parent.joinpath('trackbus')
+
+
+def encode_record(seq: int, metadata: dict) -> bytes:
+    ''' serialize a record: length + json header, then raw blobs '''
+    textdata = {}
+    blobs = []
+    for key, value in metadata.items():
+        if isinstance(value, (bytes, bytearray, memoryview)):
+            blobs.append((key, bytes(value)))
+        else:
+            textdata[key] = value
+    header = json.dumps({
+        'seq': seq,
+        'metadata': textdata,
+        'blobs': [[key, len(value)] for key, value in blobs],
+    },
+                        default=str).encode('utf-8')
+    return b''.join([HEADER.pack(len(header)), header] + [value for _, value in blobs])
+
+
+async def decode_record(reader: asyncio.StreamReader) -> tuple[int, dict]:
+    ''' read a record written by encode_record '''
+    (length, ) = HEADER.unpack(await reader.readexactly(HEADER.size))
+    header = json.loads(await reader.readexactly(length))
+    metadata = header['metadata']
+    for key, size in header['blobs']:
+        metadata[key] = await reader.readexactly(size)
+    return header['seq'], metadata
+
+
+class TrackPublisher:
+    ''' push new tracks to every registered subscriber '''
+
+    def __init__(self, busdir: t.Optional[pathlib.Path] = None):
+        self.busdir = busdir or bus_directory()
+        # seeded from the clock so that a restarted TrackPoll
+        # never hands out a number a subscriber has already seen
+        self.seq = time.time_ns()
+
+    async def _deliver(self, portfile: pathlib.Path, payload: bytes):
+        try:
+            port = int(portfile.read_text(encoding='utf-8'))
+            _, writer = await asyncio.wait_for(asyncio.open_connection('127.0.0.1', port),
+                                               timeout=DELIVERYTIMEOUT)
+        except (OSError, ValueError, asyncio.TimeoutError) as error:
+            logging.debug('Removing stale subscriber %s: %s', portfile.name, error)
+            with contextlib.suppress(OSError):
+                portfile.unlink()
+            return
+
+        try:
+            writer.write(payload)
+            await asyncio.wait_for(writer.drain(), timeout=DELIVERYTIMEOUT)
+        except (OSError, asyncio.TimeoutError) as error:
+            logging.error('Failed to deliver track to %s: %s', portfile.name, error)
+        finally:
+            writer.close()
+            with contextlib.suppress(OSError):
+                await writer.wait_closed()
+
+    async def publish(self, metadata: dict) -> int:
+        ''' send metadata to all subscribers, returning its sequence number '''
+        self.seq = max(self.seq + 1, time.time_ns())
+        if not self.busdir.exists():
+            return self.seq
+
+        portfiles = list(self.busdir.glob(f'*{PORTSUFFIX}'))
+        logging.debug('Publishing track %s to %s subscriber(s)', self.seq, len(portfiles))
+        payloads = {}
+        deliveries = []
+        for portfile in portfiles:
+            textonly = portfile.name.endswith(TEXTONLYSUFFIX)
+            if textonly not in payloads:
+                if textonly:
+                    payloads[textonly] = encode_record(self.seq, {
+                        key: value
+                        for key, value in metadata.items()
+                        if key not in nowplaying.db.METADATABLOBLIST
+                    })
+                else:
+                    payloads[textonly] = encode_record(self.seq, metadata)
+            deliveries.append(self._deliver(portfile, payloads[textonly]))
+        await asyncio.gather(*deliveries)
+        return self.seq
+
+
+class TrackSubscriber:
+    ''' receive tracks from the publisher '''
+
+    def __init__(self, name: str, busdir: t.Optional[pathlib.Path] = None, blobs: bool = True):
+        self.name = name
+        self.busdir = busdir or bus_directory()
+        self.blobs = blobs
+        self.seq = 0
+        self.metadata = None
+        self.callbacks = []
+        self.server = None
+        self.portfile = None
+        self.tasks = set()
+        self._condition = None
+
+    def add_callback(self, callback: t.Callable[[dict], t.Awaitable[None]]):
+        ''' coroutine to run with a copy of every new track '''
+        self.callbacks.append(callback)
+
+    async def start(self):
+        ''' listen and register with the bus '''
+        self._condition = asyncio.Condition()
+        self.server = await asyncio.start_server(self._handle_connection, host='127.0.0.1', port=0)
+        port = self.server.sockets[0].getsockname()[1]
+        self.busdir.mkdir(parents=True, exist_ok=True)
+        suffix = PORTSUFFIX if self.blobs else TEXTONLYSUFFIX
+        self.portfile = self.busdir.joinpath(f'{self.name}-{os.getpid()}{suffix}')
+        tmpfile = self.busdir.joinpath(f'{self.name}-{os.getpid()}.tmp')
+        tmpfile.write_text(str(port), encoding='utf-8')
+        os.replace(tmpfile, self.portfile)
+        logging.debug('%s subscribed to the track bus on port %s', self.name, port)
+
+    async def stop(self):
+        ''' unregister and stop listening '''
+        if self.portfile:
+            with contextlib.suppress(OSError):
+                self.portfile.unlink()
+            self.portfile = None
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        for task in list(self.tasks):
+            task.cancel()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader,
+                                 writer: asyncio.StreamWriter):
+        try:
+            seq, metadata = await decode_record(reader)
+        except (asyncio.IncompleteReadError, ValueError, KeyError) as error:
+            logging.error('%s received a bad track record: %s', self.name, error)
+            return
+        finally:
+            writer.close()
+
+        if seq <= self.seq:
+            logging.debug('%s ignoring out of date track %s', self.name, seq)
+            return
+
+        self.seq = seq
+        self.metadata = metadata
+        async with self._condition:
+            self._condition.notify_all()
+
+        for callback in self.callbacks:
+            task = asyncio.create_task(callback(self.latest()))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    def latest(self) -> t.Optional[dict]:
+        ''' copy of the most recent track, if any '''
+        if not self.metadata:
+            return None
+        return copy.copy(self.metadata)
+
+    async def wait_for_update(self, seq: int = 0, timeout: t.Optional[float] = None) -> bool:
+        ''' wait for a track newer than seq; False on timeout '''
+        if self.seq > seq:
+            return True
+        try:
+            async with self._condition:
+                await asyncio.wait_for(self._condition.wait_for(lambda: self.seq > seq),
+                                       timeout=timeout)
+        except asyncio.TimeoutError:
+            return False
+        return True
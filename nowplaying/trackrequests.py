@@ -611,7 +611,7 @@ class Requests:  #pylint: disable=too-many-instance-attributes, too-many-public-
         ''' twofer request '''
 
         metadb = nowplaying.db.MetadataDB()
-        metadata = await metadb.read_last_meta_async()
+        metadata = await metadb.read_last_meta_async(blobs=False)
         if not metadata:
             logging.debug('Twofer: No currently playing track? skipping')
             return {}
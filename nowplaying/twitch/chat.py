@@ -29,11 +29,17 @@ import nowplaying.config
 import nowplaying.db
 from nowplaying.exceptions import PluginVerifyError
 import nowplaying.metadata
+import nowplaying.trackbus
 import nowplaying.trackrequests
+import nowplaying.utils
 
 LASTANNOUNCED = {'artist': None, 'title': None}
 SPLITMESSAGETEXT = '****SPLITMESSSAGEHERE****'
 
+# bytecode keys do not include environment options, so the chat
+# environment (trim_blocks, etc) must not share TemplateHandler's cache
+CHATBYTECODECACHE = jinja2.FileSystemBytecodeCache(pattern='__jinja2_twitchchat_%s.cache')
+
 # needs to match ui file
 # missing premium, hype-train, artist-badge
 TWITCHBOT_CHECKBOXES = [
@@ -49,7 +55,7 @@ class TwitchChat:  #pylint: disable=too-many-instance-attributes
                  stopevent: asyncio.Event = None):
         self.config = config
         self.stopevent = stopevent
-        self.watcher = None
+        self.trackbus = None
         self.requests = nowplaying.trackrequests.Requests(config=config, stopevent=stopevent)
         self.metadb = nowplaying.db.MetadataDB()
         self.templatedir = pathlib.Path(
@@ -316,18 +322,26 @@ class TwitchChat:  #pylint: disable=too-many-instance-attributes
         ''' set up the environment '''
         return jinja2.Environment(loader=jinja2.FileSystemLoader(directory),
                                   finalize=self._finalize,
-                                  trim_blocks=True)
+                                  trim_blocks=True,
+                                  bytecode_cache=CHATBYTECODECACHE)
 
     async def _setup_timer(self):
-        ''' need to watch the metadata db to know to send announcement '''
-        self.watcher = self.metadb.watcher()
-        self.watcher.start(customhandler=self._announce_track)
+        ''' subscribe to the track bus to know when to send announcement '''
+        self.trackbus = nowplaying.trackbus.TrackSubscriber('twitchbot', blobs=False)
+        self.trackbus.add_callback(self._async_announce_track)
+        await self.trackbus.start()
         await self._async_announce_track()
         while not self.stopevent.is_set():
             await asyncio.sleep(1)
 
-        logging.debug('watcher stop event received')
-        self.watcher.stop()
+        logging.debug('track bus stop event received')
+        await self.trackbus.stop()
+
+    async def _get_metadata(self):
+        ''' latest track from the bus, falling back to the metadb until the first publish '''
+        if self.trackbus and (metadata := self.trackbus.latest()):
+            return metadata
+        return await self.metadb.read_last_meta_async(blobs=False)
 
     async def _delay_write(self):
         ''' handle the twitch chat delay '''
@@ -340,23 +354,7 @@ class TwitchChat:  #pylint: disable=too-many-instance-attributes
         logging.debug('got delay of %s', delay)
         await asyncio.sleep(delay)
 
-    def _announce_track(self, event):  #pylint: disable=unused-argument
-        logging.debug('watcher event called')
-        try:
-            try:
-                loop = asyncio.get_running_loop()
-                task = loop.create_task(self._async_announce_track())
-                self.tasks.add(task)
-                task.add_done_callback(self.tasks.discard)
-            except Exception:  # pylint: disable=broad-except
-                loop = asyncio.new_event_loop()
-                loop.run_until_complete(self._async_announce_track())
-        except Exception:  # pylint: disable=broad-except
-            for line in traceback.format_exc().splitlines():
-                logging.error(line)
-            logging.error('watcher failed')
-
-    async def _async_announce_track(self):
+    async def _async_announce_track(self, metadata=None):
         ''' announce new tracks '''
         global LASTANNOUNCED  # pylint: disable=global-statement, global-variable-not-assigned
 
@@ -381,7 +379,8 @@ class TwitchChat:  #pylint: disable=too-many-instance-attributes
                 self.anndir = anntemplpath.parent
                 self.jinja2ann = self.setup_jinja2(self.anndir)
 
-            metadata = await self.metadb.read_last_meta_async()
+            if not metadata:
+                metadata = await self._get_metadata()
 
             if not metadata:
                 logging.debug('No metadata to announce')
@@ -419,7 +418,7 @@ class TwitchChat:  #pylint: disable=too-many-instance-attributes
         if not self.chat:
             logging.debug('Twitch chat is not configured?!?')
             return
-        metadata = await self.metadb.read_last_meta_async() or {}
+        metadata = await self._get_metadata() or {}
         if 'coverimageraw' in metadata:
             del metadata['coverimageraw']
         metadata['cmdtarget'] = None
@@ -472,8 +471,8 @@ class TwitchChat:  #pylint: disable=too-many-instance-attributes
 
     async def stop(self):
         ''' stop the twitch chat support '''
-        if self.watcher:
-            self.watcher.stop()
+        if self.trackbus:
+            await self.trackbus.stop()
         if self.chat:
             self.chat.stop()
         self.chat = None
@@ -4,10 +4,13 @@
 from html.parser import HTMLParser
 
 import base64
+import collections
 import copy
 import io
 import logging
+import math
 import os
+import pathlib
 import re
 import time
 import traceback
@@ -25,6 +28,11 @@ STRIPRELIST = [
     re.compile(r' \[(?i:{0})\]'.format('|'.join(STRIPWORDLIST))),  #pylint: disable=consider-using-f-string
 ]
 
+AUDIOEXTENSIONS = {
+    '.aac', '.aif', '.aiff', '.alac', '.flac', '.m4a', '.mp3', '.mp4', '.ogg', '.opus', '.wav',
+    '.wma'
+}
+
 TRANSPARENT_PNG = 'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC'\
                   '1HAwCAAAAC0lEQVR42mNkYAAAAAYAAjCB0C8AAAA'\
                   'ASUVORK5CYII='
@@ -59,30 +67,27 @@ class HTMLFilter(HTMLParser):
         logging.debug('HTMLFilter: %s', message)
 
 
-class TemplateHandler():  # pylint: disable=too-few-public-methods
-    ''' Set up a template  '''
-
-    def __init__(self, filename=None):
-        self.envdir = envdir = None
-        self.template = None
-        self.filename = filename
-
-        if not self.filename:
-            return
-
-        if os.path.exists(self.filename):
-            envdir = os.path.dirname(self.filename)
-        else:
-            logging.error('%s does not exist!', self.filename)
-            return
-
-        if not self.envdir or self.envdir != envdir:
-            self.envdir = envdir
-            self.env = self.setup_jinja2(self.envdir)
-
-        basename = os.path.basename(self.filename)
-
-        self.template = self.env.get_template(basename)
+class TemplateRegistry:
+    ''' process-wide cache of compiled templates and their rendered output
+
+        compiled templates are keyed by path and mtime so an edited template
+        is picked up on its next use; jinja2 bytecode is also cached on disk
+        so other processes skip compiling.  renders of track metadata are
+        memoized per (template, dbid, scalar values); callers that add
+        per-call strings or numbers (command user, etc) get their own entry.
+        lists and blobs are not part of the key since they are fixed for a
+        given dbid.
+    '''
+
+    def __init__(self,
+                 bytecodecache: t.Optional[jinja2.BytecodeCache] = None,
+                 rendercachesize: int = 64):
+        self.bytecodecache = bytecodecache or jinja2.FileSystemBytecodeCache()
+        self.rendercachesize = rendercachesize
+        self.environments: dict[str, jinja2.Environment] = {}
+        self.templates: dict[str, tuple[int, jinja2.Template]] = {}
+        self.renders: collections.OrderedDict[tuple[str, int, t.Any, tuple],
+                                              str] = collections.OrderedDict()
 
     @staticmethod
     def _finalize(variable):
@@ -95,7 +100,68 @@ class TemplateHandler():  # pylint: disable=too-few-public-methods
         ''' set up the environment '''
         return jinja2.Environment(loader=jinja2.FileSystemLoader(directory),
                                   finalize=self._finalize,
-                                  autoescape=jinja2.select_autoescape(['htm', 'html', 'xml']))
+                                  autoescape=jinja2.select_autoescape(['htm', 'html', 'xml']),
+                                  bytecode_cache=self.bytecodecache)
+
+    def get_template(self, filename) -> t.Optional[tuple[int, jinja2.Template]]:
+        ''' (mtime, compiled template) for filename, compiling it only if it changed '''
+        try:
+            mtime = os.stat(filename).st_mtime_ns
+        except OSError:
+            return None
+
+        if (cached := self.templates.get(filename)) and cached[0] == mtime:
+            return cached
+
+        envdir = os.path.dirname(filename)
+        if envdir not in self.environments:
+            self.environments[envdir] = self.setup_jinja2(envdir)
+        template = self.environments[envdir].get_template(os.path.basename(filename))
+        self.templates[filename] = (mtime, template)
+        return self.templates[filename]
+
+    def render(self, filename, template: tuple[int, jinja2.Template], metadatadict=None) -> str:
+        ''' render, reusing the output if this track was already rendered '''
+        mtime, j2template = template
+        if not metadatadict:
+            return j2template.render()
+
+        if (dbid := metadatadict.get('dbid')) is None:
+            return j2template.render(**metadatadict)
+
+        scalars = tuple(
+            sorted((name, value) for name, value in metadatadict.items()
+                   if value is None or isinstance(value, (str, int, float, bool))))
+        key = (filename, mtime, dbid, scalars)
+        if key in self.renders:
+            self.renders.move_to_end(key)
+            return self.renders[key]
+
+        self.renders[key] = j2template.render(**metadatadict)
+        while len(self.renders) > self.rendercachesize:
+            self.renders.popitem(last=False)
+        return self.renders[key]
+
+
+TEMPLATES = TemplateRegistry()
+
+
+class TemplateHandler():  # pylint: disable=too-few-public-methods
+    ''' Set up a template  '''
+
+    def __init__(self, filename=None, registry: t.Optional[TemplateRegistry] = None):
+        self.template = None
+        self.filename = filename
+        self.registry = registry or TEMPLATES
+
+        if not self.filename:
+            return
+
+        if not os.path.exists(self.filename):
+            logging.error('%s does not exist!', self.filename)
+            return
+
+        self.template = self.registry.get_template(self.filename)
 
     def generate(self, metadatadict=None):
         ''' get the generated template '''
@@ -103,18 +169,57 @@ class TemplateHandler():  # pylint: disable=too-few-public-methods
 
         rendertext = 'Template has syntax errors'
         try:
-            if not self.filename or not os.path.exists(self.filename) or not self.template:
+            # re-checked every time so that long-lived handlers see edits
+            if not self.filename or not (template := self.registry.get_template(self.filename)):
                 return " No template found; check Now Playing settings."
-            if metadatadict:
-                rendertext = self.template.render(**metadatadict)
-            else:
-                rendertext = self.template.render()
+            self.template = template
+            rendertext = self.registry.render(self.filename, self.template, metadatadict)
         except Exception:  # pylint: disable=broad-except
             for line in traceback.format_exc().splitlines():
                 logging.error(line)
         return rendertext
 
 
+def file_identity(filename: str) -> t.Optional[str]:
+    ''' cache key for a local file; changes whenever the file does '''
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return None
+    return f'{os.path.abspath(filename)}:{stat.st_size}:{stat.st_mtime_ns}'
+
+
+def audio_files(paths: t.Iterable[str]) -> t.Iterator[str]:
+    ''' audio files in paths, which may be files, directories, or m3u playlists '''
+    for path in paths:
+        path = pathlib.Path(path)
+        if path.is_dir():
+            for filename in sorted(path.rglob('*')):
+                if filename.suffix.lower() in AUDIOEXTENSIONS and filename.is_file():
+                    yield str(filename)
+        elif path.suffix.lower() in ['.m3u', '.m3u8']:
+            with open(path, encoding='utf-8', errors='replace') as playlistfh:
+                for line in playlistfh:
+                    line = line.strip()
+                    if not line or line.startswith('#'):
+                        continue
+                    entry = path.parent.joinpath(line)
+                    if entry.is_file():
+                        yield str(entry)
+        elif path.is_file():
+            yield str(path)
+
+
+def idle_workers() -> int:
+    ''' how many cores are not currently busy '''
+    cpus = os.cpu_count() or 1
+    try:
+        return max(1, cpus - math.ceil(os.getloadavg()[0]))
+    except (AttributeError, OSError):
+        # no load average on Windows
+        return max(1, cpus // 2)
+
+
 def image2png(rawdata):
     ''' convert an image to png '''
 
@@ -2,18 +2,25 @@
 ''' test acoustid '''
 
 import os
+import pathlib
+import shutil
+import sys
 
 import pytest
 
 import nowplaying.recognition.acoustidmb  # pylint: disable=import-error
 
-if not os.environ.get('ACOUSTID_TEST_APIKEY'):
-    pytest.skip("skipping, ACOUSTID_TEST_APIKEY is not set", allow_module_level=True)
+FAKEFPCALC = '''#!/bin/sh
+echo run >> "{countfile}"
+echo '{{"duration": 120.5, "fingerprint": "AQAAfake"}}'
+'''
 
 
 @pytest.fixture
 def getacoustidmbplugin(bootstrap):
     ''' automated integration test '''
+    if not os.environ.get('ACOUSTID_TEST_APIKEY'):
+        pytest.skip("skipping, ACOUSTID_TEST_APIKEY is not set")
     config = bootstrap
     config.cparser.setValue('acoustidmb/enabled', True)
     config.cparser.setValue('musicbrainz/enabled', True)
@@ -48,3 +55,58 @@ def test_15ghosts2_fullytagged(getacoustidmbplugin, getroot):  # pylint: disable
     assert metadata['musicbrainzartistid'] == ['b7ffd2af-418f-4be2-bdd1-22f8b48613da']
     assert metadata['musicbrainzrecordingid'] == '2d7f08e1-be1c-4b86-b725-6e675b7b6de0'
     assert metadata['title'] == '15 Ghosts II'
+
+
+@pytest.fixture
+def fakefpcalc(bootstrap, monkeypatch, tmp_path):
+    ''' plugin with an fpcalc that counts how often it runs '''
+    if sys.platform == 'win32':
+        pytest.skip('fake fpcalc is a shell script')
+    config = bootstrap
+    countfile = tmp_path.joinpath('count')
+    countfile.touch()
+    fpcalc = tmp_path.joinpath('fpcalc')
+    fpcalc.write_text(FAKEFPCALC.format(countfile=countfile))
+    fpcalc.chmod(0o755)
+    monkeypatch.delenv('FPCALC', raising=False)
+    config.cparser.setValue('acoustidmb/fpcalcexe', str(fpcalc))
+    plugin = nowplaying.recognition.acoustidmb.Plugin(config=config)
+    plugin._configure_fpcalc(fpcalcexe=str(fpcalc))  # pylint: disable=protected-access
+    yield plugin, countfile
+    plugin._cache().close()  # pylint: disable=protected-access
+
+
+def test_fingerprint_cached(fakefpcalc, getroot, tmp_path):  # pylint: disable=redefined-outer-name
+    ''' the second fingerprint of an unchanged file comes from the cache '''
+    plugin, countfile = fakefpcalc
+    filename = tmp_path.joinpath('15_Ghosts_II_64kb_orig.mp3')
+    shutil.copyfile(pathlib.Path(getroot, 'tests', 'audio', '15_Ghosts_II_64kb_orig.mp3'), filename)
+
+    data = plugin._fingerprint(str(filename))  # pylint: disable=protected-access
+    assert data == {'duration': 120.5, 'fingerprint': 'AQAAfake'}
+    assert plugin._fingerprint(str(filename)) == data  # pylint: disable=protected-access
+    assert len(countfile.read_text().splitlines()) == 1
+
+    # a changed file gets fingerprinted again
+    os.utime(filename, ns=(0, 0))
+    plugin._fingerprint(str(filename))  # pylint: disable=protected-access
+    assert len(countfile.read_text().splitlines()) == 2
+
+
+def test_prefingerprint(fakefpcalc, getroot, tmp_path):  # pylint: disable=redefined-outer-name
+    ''' pre-fingerprinting a directory fills the cache '''
+    plugin, countfile = fakefpcalc
+    musicdir = tmp_path.joinpath('music')
+    musicdir.mkdir()
+    for name in ['15_Ghosts_II_64kb_orig.mp3', '15_Ghosts_II_64kb_füllytâgged.mp3']:
+        shutil.copyfile(pathlib.Path(getroot, 'tests', 'audio', name), musicdir.joinpath(name))
+    musicdir.joinpath('notes.txt').write_text('not audio')
+
+    assert plugin.prefingerprint([str(musicdir)], workers=2, lookup=False) == 2
+    assert len(countfile.read_text().splitlines()) == 2
+
+    # everything is cached, so neither a second pass nor recognition runs fpcalc
+    assert plugin.prefingerprint([str(musicdir)], workers=2, lookup=False) == 0
+    for filename in musicdir.glob('*.mp3'):
+        assert plugin._fingerprint(str(filename))  # pylint: disable=protected-access
+    assert len(countfile.read_text().splitlines()) == 2
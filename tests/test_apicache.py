@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+''' test apicache '''
+
+import threading
+import time
+
+import pytest
+
+import nowplaying.apicache  # pylint: disable=import-error
+import nowplaying.artistextras.wikimedia  # pylint: disable=import-error
+
+
+class Counter:  # pylint: disable=too-few-public-methods
+    ''' a fetch function that counts its calls '''
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+        self.called = threading.Event()
+
+    def __call__(self, *args):
+        self.calls += 1
+        self.called.set()
+        return self.value
+
+
+@pytest.fixture
+def apicache(bootstrap):
+    ''' an empty cache '''
+    cache = nowplaying.apicache.APICache(cachedir=bootstrap.testdir.joinpath('apicache'))
+    yield cache
+    cache.close()
+
+
+def test_apicache_hit(apicache):  # pylint: disable=redefined-outer-name
+    ''' a repeat lookup never calls the fetch function again '''
+    fetch = Counter({'bio': 'words'})
+    assert apicache.fetch('theaudiodb', 'name:artist', fetch, 'a') == {'bio': 'words'}
+    assert apicache.fetch('theaudiodb', 'name:artist', fetch, 'a') == {'bio': 'words'}
+    assert fetch.calls == 1
+
+    # different provider, different entry
+    assert apicache.fetch('fanarttv', 'name:artist', fetch, 'a') == {'bio': 'words'}
+    assert fetch.calls == 2
+
+
+def test_apicache_negative(apicache):  # pylint: disable=redefined-outer-name
+    ''' not found is cached, failures are not '''
+    notfound = Counter({})
+    assert apicache.fetch('discogs', 'artist:1', notfound) == {}
+    assert apicache.fetch('discogs', 'artist:1', notfound) == {}
+    assert notfound.calls == 1
+    assert apicache.get('discogs', 'artist:1') == ({}, True)
+
+    failed = Counter(None)
+    assert apicache.fetch('discogs', 'artist:2', failed) is None
+    assert apicache.fetch('discogs', 'artist:2', failed) is None
+    assert failed.calls == 2
+    assert apicache.get('discogs', 'artist:2') is None
+
+
+def test_apicache_stale(bootstrap):
+    ''' stale entries are served while they refresh in the background '''
+    apicache = nowplaying.apicache.APICache(cachedir=bootstrap.testdir.joinpath('apicache'),
+                                            ttls={'wikimedia': 1})
+    apicache.put('wikimedia', 'Q1:en', {'extext': 'old'})
+    assert apicache.get('wikimedia', 'Q1:en') == ({'extext': 'old'}, True)
+    time.sleep(1.1)
+    assert apicache.get('wikimedia', 'Q1:en') == ({'extext': 'old'}, False)
+
+    fetch = Counter({'extext': 'new'})
+    assert apicache.fetch('wikimedia', 'Q1:en', fetch) == {'extext': 'old'}
+    assert fetch.called.wait(5)
+    for _ in range(50):
+        if apicache.get('wikimedia', 'Q1:en')[1]:
+            break
+        time.sleep(0.1)
+    assert apicache.fetch('wikimedia', 'Q1:en', fetch) == {'extext': 'new'}
+    assert fetch.calls == 1
+    apicache.close()
+
+
+def test_apicache_wikimedia(bootstrap):
+    ''' a cached artist is enriched without going to the network '''
+    config = bootstrap
+    for key in ['bio', 'enabled', 'fanart', 'thumbnails', 'websites']:
+        config.cparser.setValue(f'wikimedia/{key}', True)
+    plugin = config.pluginobjs['artistextras']['nowplaying.artistextras.wikimedia']
+    plugin.apicache = nowplaying.apicache.APICache(cachedir=config.testdir.joinpath('apicache'))
+    plugin.apicache.put(
+        'wikimedia', 'Q11647:en', {
+            'extext': 'Nine Inch Nails is an industrial rock band.',
+            'description': 'American band',
+            'claims': {
+                'P434': ['b7ffd2af-418f-4be2-bdd1-22f8b48613da'],
+                'P1953': ['3857']
+            },
+            'images': [{
+                'kind': 'query-thumbnail',
+                'url': 'https://example.com/thumb.jpg'
+            }],
+        })
+
+    data = plugin.download({
+        'artist': 'Nine Inch Nails',
+        'artistwebsites': ['https://www.wikidata.org/wiki/Q11647'],
+        'imagecacheartist': 'nineinchnails'
+    })
+    assert data['artistlongbio'] == 'Nine Inch Nails is an industrial rock band.'
+    assert data['musicbrainzartistid'] == ['b7ffd2af-418f-4be2-bdd1-22f8b48613da']
+    assert data['artistwebsites'] == ['https://discogs.com/artist/3857']
+    plugin.apicache.close()
+
+
+def test_apicache_wikimedia_missing(bootstrap, monkeypatch):
+    ''' an entity wikidata does not have is negatively cached '''
+    config = bootstrap
+    plugin = config.pluginobjs['artistextras']['nowplaying.artistextras.wikimedia']
+    plugin.apicache = nowplaying.apicache.APICache(cachedir=config.testdir.joinpath('apicache'))
+    calls = []
+
+    class MissingPage:  # pylint: disable=too-few-public-methods
+        ''' a wptools page for an entity that does not exist '''
+
+        def __init__(self, **kwargs):
+            calls.append(kwargs)
+
+        def get(self):  # pylint: disable=no-self-use
+            ''' wptools raises LookupError for a missing entity '''
+            raise LookupError('Q0')
+
+    monkeypatch.setattr(nowplaying.artistextras.wikimedia.wptools, 'page', MissingPage)
+    assert plugin._page_data('Q0', 'en') == {}  # pylint: disable=protected-access
+    assert plugin._page_data('Q0', 'en') == {}  # pylint: disable=protected-access
+    assert len(calls) == 1
+    assert plugin.apicache.get('wikimedia', 'Q0:en') == ({}, True)
+    plugin.apicache.close()
@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 ''' test metadata DB '''
 
+import logging
+import time
+
 import pytest
 
 import nowplaying.db  # pylint: disable=import-error
@@ -105,6 +108,7 @@ async def test_data_db1(bootstrap):  # pylint: disable=unused-argument
     readdata = metadb.read_last_meta()
 
     expected['dbid'] = 1
+    expected['dbrevision'] = 0
     results(expected, readdata)
 
 
@@ -183,12 +187,45 @@ async def test_data_db2(bootstrap):  # pylint: disable=unused-argument
         'title': 'Lakini\'s Juice',
         'track': None,
         'track_total': None,
-        'dbid': 1
+        'dbid': 1,
+        'dbrevision': 0
     }
+    for key in ['artistlogoraw', 'artistthumbnailraw', 'coverimageraw']:
+        expected[nowplaying.db.BLOBHASHKEYS[key]] = nowplaying.db.blobhash(expected[key])
 
     results(expected, readdata)
 
 
+@pytest.mark.asyncio
+async def test_data_noblobs(bootstrap):  # pylint: disable=unused-argument
+    ''' text-only reads skip the images but still know about them '''
+    metadb = nowplaying.db.MetadataDB(initialize=True)
+
+    cover = b'\x89PNG\r\n\x1a\nnotreally'
+    await metadb.write_to_metadb(metadata={
+        'artist': 'a1',
+        'title': 't1',
+        'coverimageraw': cover,
+        'artistthumbnailraw': cover,
+    })
+
+    for readdata in [
+            metadb.read_last_meta(blobs=False),
+            await metadb.read_last_meta_async(blobs=False)
+    ]:
+        assert readdata['artist'] == 'a1'
+        assert 'coverimageraw' not in readdata
+        assert readdata['coverimagehash'] == nowplaying.db.blobhash(cover)
+        assert readdata['artistthumbnailhash'] == readdata['coverimagehash']
+        assert 'artistlogohash' not in readdata
+        assert await metadb.read_blob_async(readdata['coverimagehash']) == cover
+
+    readdata = await metadb.read_last_meta_async()
+    assert readdata['coverimageraw'] == cover
+    assert readdata['artistthumbnailraw'] == cover
+    assert not await metadb.read_blob_async('missing')
+
+
 @pytest.mark.asyncio
 async def test_data_dbid(bootstrap):  # pylint: disable=unused-argument
     ''' make sure dbid increments '''
@@ -227,6 +264,135 @@ async def test_data_previoustrack(bootstrap):  # pylint: disable=unused-argument
     assert readdata['previoustrack'][1] == {'artist': 'a2', 'title': 't2'}
 
 
+@pytest.mark.asyncio
+async def test_data_previoustrack_limit(bootstrap):  # pylint: disable=unused-argument
+    ''' previoustrack only holds the most recent tracks '''
+    metadb = nowplaying.db.MetadataDB(initialize=True, previoustracklimit=3)
+
+    for counter in range(5):
+        await metadb.write_to_metadb(metadata={'artist': f'a{counter}', 'title': f't{counter}'})
+
+    readdata = await metadb.read_last_meta_async()
+    assert readdata['previoustrack'] == [
+        {'artist': 'a4', 'title': 't4'},
+        {'artist': 'a3', 'title': 't3'},
+        {'artist': 'a2', 'title': 't2'},
+    ]
+
+    # a cached instance only picks up the new rows
+    dbid = await metadb.write_to_metadb(metadata={'artist': 'a5', 'title': 't5'})
+    previoustrack = await metadb.make_previoustracklist_async(lastid=dbid)
+    assert previoustrack[0] == {'artist': 'a5', 'title': 't5'}
+    assert len(previoustrack) == 3
+    assert list(metadb.history) == [4, 5, 6]
+
+    # a second instance without a cache agrees
+    metadb2 = nowplaying.db.MetadataDB(previoustracklimit=3)
+    assert metadb2.read_last_meta()['previoustrack'] == previoustrack
+
+
+def test_data_previoustrack_config(bootstrap):
+    ''' every MetadataDB honors settings/previoustracks '''
+    config = bootstrap
+    config.cparser.setValue('settings/previoustracks', 4)
+    config.cparser.sync()
+    assert nowplaying.db.MetadataDB(initialize=True).previoustracklimit == 4
+    assert nowplaying.db.MetadataDB(previoustracklimit=2).previoustracklimit == 2
+
+
+@pytest.mark.asyncio
+async def test_data_previoustrack_reset(bootstrap):  # pylint: disable=unused-argument
+    ''' the history cache is dropped when the db is recreated '''
+    metadb = nowplaying.db.MetadataDB(initialize=True)
+    for counter in range(3):
+        await metadb.write_to_metadb(metadata={'artist': f'a{counter}', 'title': f't{counter}'})
+    assert len(metadb.make_previoustracklist()) == 3
+
+    metadb2 = nowplaying.db.MetadataDB(initialize=True)
+    dbid = await metadb2.write_to_metadb(metadata={'artist': 'b0', 'title': 'u0'})
+    assert metadb.make_previoustracklist(lastid=dbid) == [{'artist': 'b0', 'title': 'u0'}]
+
+
+@pytest.mark.asyncio
+async def test_read_history(bootstrap):  # pylint: disable=unused-argument
+    ''' page through the full history '''
+    metadb = nowplaying.db.MetadataDB(initialize=True, previoustracklimit=2)
+
+    assert metadb.read_history() == []
+    for counter in range(5):
+        await metadb.write_to_metadb(metadata={'artist': f'a{counter}', 'title': f't{counter}'})
+
+    history = metadb.read_history()
+    assert len(history) == 5
+    assert history[0] == {'dbid': 5, 'artist': 'a4', 'title': 't4'}
+
+    page = await metadb.read_history_async(limit=2)
+    assert [track['dbid'] for track in page] == [5, 4]
+    page = await metadb.read_history_async(before=page[-1]['dbid'], limit=2)
+    assert [track['dbid'] for track in page] == [3, 2]
+    page = await metadb.read_history_async(before=page[-1]['dbid'], limit=2)
+    assert [track['dbid'] for track in page] == [1]
+
+
+@pytest.mark.asyncio
+async def test_update_in_metadb(bootstrap):  # pylint: disable=unused-argument
+    ''' a late update keeps its dbid and bumps its revision '''
+    metadb = nowplaying.db.MetadataDB(initialize=True)
+
+    await metadb.write_to_metadb(metadata={'artist': 'a0', 'title': 't0'})
+    dbid = await metadb.write_to_metadb(metadata={'artist': 'a1', 'title': 't1'})
+    assert (await metadb.read_last_meta_async())['dbrevision'] == 0
+
+    revision = await metadb.update_in_metadb(dbid,
+                                             metadata={
+                                                 'artist': 'a1',
+                                                 'title': 't1',
+                                                 'artistshortbio': 'late',
+                                                 'artistlogoraw': b'logo',
+                                             })
+    assert revision == 1
+    readdata = await metadb.read_last_meta_async()
+    assert readdata['dbid'] == dbid
+    assert readdata['dbrevision'] == revision
+    assert readdata['artistshortbio'] == 'late'
+    assert readdata['artistlogoraw'] == b'logo'
+    assert [track['dbid'] for track in metadb.read_history()] == [dbid, 1]
+    record = await metadb.make_record_async(readdata, dbid, revision=revision)
+    assert record['dbrevision'] == revision
+    assert record['previoustrack'] == [{
+        'artist': 'a1',
+        'title': 't1'
+    }, {
+        'artist': 'a0',
+        'title': 't0'
+    }]
+    assert await metadb.update_in_metadb(dbid + 1, metadata={'artist': 'a', 'title': 't'}) is None
+
+
+@pytest.mark.asyncio
+async def test_make_record_matches_read(bootstrap):  # pylint: disable=unused-argument
+    ''' a published record should be identical to reading it back '''
+    metadb = nowplaying.db.MetadataDB(initialize=True)
+
+    metadata = {
+        'album': 'Secret Samadhi',
+        'artist': 'LĪVE',
+        'artistlogoraw': b"Rawr! I'm an image!",
+        'bpm': 91,
+        'deck': 1,
+        'comments': '',
+        'title': 'Lakini\'s Juice',
+        'genres': ['trip-hop', 'electronic', 'country'],
+        'fetchedartist': 'LĪVE',
+    }
+
+    dbid = await metadb.write_to_metadb(metadata=metadata)
+    assert dbid == 1
+    record = await metadb.make_record_async(metadata, dbid)
+    readdata = await metadb.read_last_meta_async()
+    assert record == readdata
+
+
 ## NOTE: these don't check content, just make sure
 ## there are no crashes
 
@@ -268,3 +434,57 @@ async def test_missingartist_setlist(bootstrap):  # pylint: disable=unused-argum
 
     await metadb.write_to_metadb(metadata=expected)
     nowplaying.db.create_setlist(config, databasefile=metadb.databasefile)
+
+
+@pytest.mark.asyncio
+async def test_persistent_connection(bootstrap):  # pylint: disable=unused-argument
+    ''' connections are reused and replaced when the DB is recreated '''
+    metadb = nowplaying.db.MetadataDB(initialize=True)
+    metadata = {'artist': 'a', 'title': 't', 'genres': ['x', 'y']}
+    original = dict(metadata)
+
+    await metadb.write_to_metadb(metadata=metadata)
+    assert metadata == original
+    connection = await metadb._aconnect()  # pylint: disable=protected-access
+    assert connection is await metadb._aconnect()  # pylint: disable=protected-access
+    assert metadb.read_last_meta()['title'] == 't'
+    assert metadb.watchfiles()[1].exists()
+
+    metadb2 = nowplaying.db.MetadataDB(initialize=True)
+    await metadb2.write_to_metadb(metadata={'artist': 'b', 'title': 'u'})
+    assert connection is not await metadb._aconnect()  # pylint: disable=protected-access
+    assert (await metadb.read_last_meta_async())['title'] == 'u'
+    assert metadb.read_last_meta()['title'] == 'u'
+    await metadb.close_async()
+
+
+@pytest.mark.asyncio
+async def test_metadb_benchmark(bootstrap):  # pylint: disable=unused-argument
+    ''' reads/writes per second over the persistent connection
+
+        the pre-WAL write path (deepcopy + per-call INSERT SQL against the
+        old inline-blob schema) no longer exists to compare against, so
+        this only reports the current numbers.  run with
+        -o log_cli=true --log-cli-level=INFO to see them
+    '''
+    metadb = nowplaying.db.MetadataDB(initialize=True)
+    metadata = {
+        'artist': 'benchmark',
+        'genres': ['trip-hop', 'electronic'],
+        'coverimageraw': nowplaying.utils.TRANSPARENT_PNG_BIN * 1000,
+    }
+    iterations = 100
+
+    start = time.perf_counter()
+    for counter in range(iterations):
+        assert await metadb.write_to_metadb(metadata=metadata | {'title': f'{counter}'})
+    writetime = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(iterations):
+        assert (await metadb.read_last_meta_async())['coverimageraw']
+    readtime = time.perf_counter() - start
+
+    logging.info('metadb writes/sec: %.0f, reads/sec: %.0f', iterations / writetime,
+                 iterations / readtime)
+    await metadb.close_async()
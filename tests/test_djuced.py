@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+''' test djuced '''
+
+import sqlite3
+
+import pytest
+
+import nowplaying.inputs.djuced  # pylint: disable=import-error
+
+
+@pytest.fixture
+def djuced_bootstrap(bootstrap, getroot, tmp_path):
+    ''' bootstrap test with a small DJUCED.db '''
+    config = bootstrap
+    cover = getroot.joinpath('tests', 'images', '1x1.jpg').read_bytes()
+    with sqlite3.connect(tmp_path.joinpath('DJUCED.db')) as connection:
+        connection.execute('CREATE TABLE tracks (album TEXT, artist TEXT, title TEXT, '
+                           'comment TEXT, coverimage BLOB, bpm REAL, tracknumber INTEGER, '
+                           'length REAL, absolutepath TEXT, last_played INTEGER)')
+        connection.execute('INSERT INTO tracks VALUES (?,?,?,?,?,?,?,?,?,?)',
+                           ('Album', 'Artist', 'Title', 'comment', cover, 120.0, 1, 180.0,
+                            '/music/track.mp3', 0))
+        connection.execute('CREATE TABLE playlist2 (name TEXT, type INTEGER, data TEXT)')
+        connection.execute('INSERT INTO playlist2 VALUES (?,?,?)',
+                           ('videos', 3, '/music/track.mp3'))
+    with open(tmp_path.joinpath('playing.txt'), 'w', encoding='utf-8') as playingfh:
+        playingfh.write('Title | 1 | Artist | Album\n')
+    config.cparser.setValue('djuced/directory', str(tmp_path))
+    nowplaying.inputs.djuced.Plugin.decktracker = {}
+    yield config
+
+
+@pytest.mark.asyncio
+async def test_djuced_db(djuced_bootstrap, tmp_path):  # pylint: disable=redefined-outer-name
+    ''' lookups use one read-only connection and are remembered '''
+    config = djuced_bootstrap
+    plugin = nowplaying.inputs.djuced.Plugin(config=config)
+    plugin.djuceddir = str(tmp_path)
+    deck = plugin._read_playingtxt()  # pylint: disable=protected-access
+    assert deck == '1'
+
+    await plugin._get_metadata(deck)  # pylint: disable=protected-access
+    metadata = await plugin.getplayingtrack()
+    assert metadata['artist'] == 'Artist'
+    assert metadata['filename'] == '/music/track.mp3'
+    assert metadata['coverimageraw'].startswith(b'\x89PNG')
+    connection = plugin.connection
+
+    with pytest.raises(sqlite3.OperationalError):
+        connection.execute('DELETE FROM tracks')
+
+    # remembered while DJUCED.db stays the same
+    plugin.lookups[('Album', 'Artist', 'Title')]['comment'] = 'remembered'
+    metadata = await plugin._try_db(deck)  # pylint: disable=protected-access
+    assert metadata['comment'] == 'remembered'
+
+    # and forgotten once DJUCED writes to it
+    with sqlite3.connect(tmp_path.joinpath('DJUCED.db')) as writer:
+        writer.execute('UPDATE tracks SET comment=?', ('changed', ))
+    metadata = await plugin._try_db(deck)  # pylint: disable=protected-access
+    assert metadata['comment'] == 'changed'
+    assert plugin.connection is connection
+
+    assert await plugin.getrandomtrack('videos') == '/music/track.mp3'
+    await plugin.stop()
+    assert not plugin.connection
+    assert not plugin.lookups
@@ -1,13 +1,16 @@
 #!/usr/bin/env python3
 ''' test metadata DB '''
 
-#import asyncio
+import asyncio
 import logging
 import multiprocessing
+import pathlib
 import sqlite3
 import sys
 import time
 
+import aiohttp
+import aiohttp.web
 import pytest
 import pytest_asyncio
 import requests
@@ -109,7 +112,7 @@ async def test_randomimage(get_imagecache):  # pylint: disable=redefined-outer-n
 
     imagedict = {'srclocation': TEST_URLS[0], 'identifier': 'Gary Numan', 'imagetype': 'fanart'}
 
-    imagecache.image_dl(imagedict)
+    await imagecache.image_dl(imagedict)
 
     data_find = imagecache.find_srclocation(TEST_URLS[0])
     assert data_find['identifier'] == 'garynuman'
@@ -147,3 +150,164 @@ async def test_randomfailure(get_imagecache):  # pylint: disable=redefined-outer
 
     image = imagecache.random_image_fetch(identifier='Gary Numan', imagetype='fanart')
     assert not image
+
+
+def test_duplicate_content(bootstrap, getroot, monkeypatch):
+    ''' identical images are only converted and stored once '''
+    config = bootstrap
+    imagecache = nowplaying.imagecache.ImageCache(cachedir=config.testdir.joinpath('imagecache'))
+    with open(pathlib.Path(getroot, 'tests', 'images', '1x1.jpg'), 'rb') as imagefh:
+        content = imagefh.read()
+
+    conversions = []
+    realimage2png = nowplaying.utils.image2png
+
+    def countimage2png(rawdata):
+        conversions.append(rawdata)
+        return realimage2png(rawdata)
+
+    monkeypatch.setattr(nowplaying.utils, 'image2png', countimage2png)
+    for track in range(3):
+        assert imagecache.put_db_cachekey(identifier='Some Album',
+                                          srclocation=f'Some Album_audiofile_am{track}',
+                                          imagetype='front_cover',
+                                          content=content)
+    assert len(conversions) == 1
+
+    first = imagecache.find_srclocation('Some Album_audiofile_am0')
+    last = imagecache.find_srclocation('Some Album_audiofile_am2')
+    assert first['cachekey'] == last['cachekey']
+    assert imagecache.random_image_fetch(identifier='Some Album', imagetype='front_cover')
+
+
+def test_erase_cachekey_stuck(bootstrap, getroot, monkeypatch):
+    ''' every srclocation sharing a cachekey is requeued once, even if erasing fails '''
+    config = bootstrap
+    imagecache = nowplaying.imagecache.ImageCache(cachedir=config.testdir.joinpath('imagecache'))
+    with open(pathlib.Path(getroot, 'tests', 'images', '1x1.jpg'), 'rb') as imagefh:
+        content = imagefh.read()
+
+    for track in range(3):
+        assert imagecache.put_db_cachekey(identifier='Some Album',
+                                          srclocation=f'Some Album_audiofile_am{track}',
+                                          imagetype='front_cover',
+                                          content=content)
+    cachekey = imagecache.find_srclocation('Some Album_audiofile_am0')['cachekey']
+
+    requeued = []
+    monkeypatch.setattr(imagecache, 'erase_srclocation', lambda srclocation: None)
+    monkeypatch.setattr(imagecache, 'put_db_srclocation',
+                        lambda **kwargs: requeued.append(kwargs['srclocation']))
+    imagecache.erase_cachekey(cachekey)
+    assert sorted(requeued) == [f'Some Album_audiofile_am{track}' for track in range(3)]
+
+
+def test_download_queue(bootstrap):
+    ''' new srclocations go straight to the download queue, current artist's small images first '''
+    config = bootstrap
+    imagecache = nowplaying.imagecache.ImageCache(cachedir=config.testdir.joinpath('imagecache'))
+    imagecache.put_db_srclocation('oldartist', 'https://example.com/old-fanart.jpg', 'artistfanart')
+    imagecache.put_db_srclocation('newartist', 'https://example.com/fanart.jpg', 'artistfanart')
+    imagecache.put_db_srclocation('newartist', 'https://example.com/logo.png', 'artistlogo')
+    # already known, so not queued again
+    imagecache.put_db_srclocation('newartist', 'https://example.com/logo.png', 'artistlogo')
+
+    entries = imagecache._next_dlqueue(timeout=1)  # pylint: disable=protected-access
+    assert len(entries) == 3
+
+    entries.sort(key=lambda entry: imagecache._dl_priority(entry, 'newartist'))  # pylint: disable=protected-access
+    assert [entry['srclocation'] for entry in entries] == [
+        'https://example.com/logo.png', 'https://example.com/fanart.jpg',
+        'https://example.com/old-fanart.jpg'
+    ]
+
+
+
+@pytest.mark.asyncio
+async def test_download_queue_other_instance(bootstrap):
+    ''' rows queued by an ImageCache nobody drains still get downloaded '''
+    config = bootstrap
+    cachedir = config.testdir.joinpath('imagecache')
+    stopevent = multiprocessing.Event()
+    imagecache = nowplaying.imagecache.ImageCache(cachedir=cachedir, stopevent=stopevent)
+    other = nowplaying.imagecache.ImageCache(cachedir=cachedir, stopevent=stopevent)
+    other.put_db_srclocation('artist', 'https://example.com/fanart.jpg', 'artistfanart')
+
+    downloaded = []
+
+    async def image_dl(imagedict, **kwargs):  # pylint: disable=unused-argument
+        downloaded.append(imagedict['srclocation'])
+        imagecache.dlqueue.put(nowplaying.imagecache.STOPMARKER)
+
+    imagecache.image_dl = image_dl
+    await asyncio.wait_for(
+        imagecache._download_queue(1, {}),  # pylint: disable=protected-access
+        timeout=nowplaying.imagecache.DBPOLL * 3)
+    assert downloaded == ['https://example.com/fanart.jpg']
+
+@pytest.mark.asyncio
+async def test_image_dl_retry(bootstrap, getroot):
+    ''' server errors are retried and the result is stored '''
+    config = bootstrap
+    imagecache = nowplaying.imagecache.ImageCache(cachedir=config.testdir.joinpath('imagecache'))
+    with open(pathlib.Path(getroot, 'tests', 'images', '1x1.jpg'), 'rb') as imagefh:
+        content = imagefh.read()
+
+    requests_seen = []
+
+    async def handler(request):
+        requests_seen.append(request.path)
+        if len(requests_seen) == 1:
+            return aiohttp.web.Response(status=503)
+        return aiohttp.web.Response(body=content, content_type='image/jpeg')
+
+    app = aiohttp.web.Application()
+    app.router.add_get('/{name}', handler)
+    runner = aiohttp.web.AppRunner(app)
+    await runner.setup()
+    site = aiohttp.web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = runner.addresses[0][1]
+    srclocation = f'http://127.0.0.1:{port}/image.jpg'
+    try:
+        imagecache.put_db_srclocation('someartist', srclocation, 'artistthumbnail')
+        await imagecache.image_dl({
+            'srclocation': srclocation,
+            'identifier': 'someartist',
+            'imagetype': 'artistthumbnail'
+        })
+    finally:
+        await runner.cleanup()
+
+    assert len(requests_seen) == 2
+    data = imagecache.find_srclocation(srclocation)
+    assert data['cachekey']
+    assert imagecache.cache[data['cachekey']].startswith(b'\211PNG')
+
+
+def test_fetch_benchmark(bootstrap):
+    ''' lookups stay fast on a large cache '''
+    config = bootstrap
+    imagecache = nowplaying.imagecache.ImageCache(cachedir=config.testdir.joinpath('imagecache'))
+
+    rows = 50000
+    with sqlite3.connect(imagecache.databasefile, timeout=30) as connection:
+        connection.executemany(
+            'INSERT INTO identifiersha(srclocation, identifier, cachekey, imagetype)'
+            ' VALUES (?, ?, ?, ?)',
+            ((f'https://example.com/{row}.jpg', f'artist{row % 2500}', f'key{row}' if row % 7 else
+              None, 'artistfanart' if (row // 2500) % 4 else 'artistthumbnail')
+             for row in range(rows)))
+    connection.close()
+
+    lookups = 500
+    start = time.perf_counter()
+    for lookup in range(lookups):
+        row = (lookup * 97) % rows
+        assert imagecache.random_fetch(f'artist{row % 2500}', 'artistfanart')
+        assert imagecache.find_cachekey(f'key{row if row % 7 else row + 1}')
+        assert imagecache.find_srclocation(f'https://example.com/{row}.jpg')
+    elapsed = time.perf_counter() - start
+    # without the indexes, each lookup scans all 50k rows (several ms apiece)
+    logging.info('%s lookups of each kind in %ss, %ss per lookup', lookups, elapsed,
+                 elapsed / (lookups * 3))
@@ -9,6 +9,7 @@ import sys
 import logging
 
 import pytest
+import watchdog.events  # pylint: disable=import-error
 import watchdog.observers.polling  # pylint: disable=import-error
 
 import nowplaying.inputs.m3u  # pylint: disable=import-error
@@ -441,3 +442,53 @@ async def test_m3umixmode(m3u_bootstrap):  # pylint: disable=redefined-outer-nam
     assert plugin.getmixmode() == 'newest'
     await plugin.stop()
     await asyncio.sleep(5)
+
+
+@pytest.mark.asyncio
+async def test_m3utail(m3u_bootstrap):  # pylint: disable=redefined-outer-name
+    ''' only appended, complete lines get read '''
+    config = m3u_bootstrap
+    m3udir = config.cparser.value('m3u/directory')
+    m3ufile = os.path.join(m3udir, 'history.m3u')
+    event = watchdog.events.FileModifiedEvent(m3ufile)
+    plugin = nowplaying.inputs.m3u.Plugin(config=config, m3udir=m3udir)
+
+    def entry(number):
+        return (f'#EXTVDJ:<artist>artist{number}</artist><title>title{number}</title>\r\n'
+                f'netsearch://dz{number}\r\n').encode('utf-8')
+
+    # big enough that the backwards scan needs several blocks
+    with open(m3ufile, 'wb') as m3ufh:
+        m3ufh.write(b''.join(entry(number) for number in range(20000)))
+    plugin._read_track(event)  # pylint: disable=protected-access
+    assert plugin.metadata == {'artist': 'artist19999', 'title': 'title19999'}
+    offset = plugin.tails[m3ufile]['offset']
+    assert offset == os.stat(m3ufile).st_size
+
+    # VirtualDJ is in the middle of writing the next entry
+    with open(m3ufile, 'ab') as m3ufh:
+        m3ufh.write(entry(20000)[:20])
+    plugin._read_track(event)  # pylint: disable=protected-access
+    assert plugin.metadata == {'artist': 'artist19999', 'title': 'title19999'}
+    assert plugin.tails[m3ufile]['offset'] == offset
+
+    with open(m3ufile, 'ab') as m3ufh:
+        m3ufh.write(entry(20000)[20:])
+    plugin._read_track(event)  # pylint: disable=protected-access
+    assert plugin.metadata == {'artist': 'artist20000', 'title': 'title20000'}
+
+    # a new file with the same name starts over
+    with open(m3ufile, 'wb') as m3ufh:
+        m3ufh.write(entry(1) + entry(2))
+    plugin._read_track(event)  # pylint: disable=protected-access
+    assert plugin.metadata == {'artist': 'artist2', 'title': 'title2'}
+
+    # a first look also takes a last line that never got a newline
+    plugin.tails.clear()
+    with open(m3ufile, 'wb') as m3ufh:
+        m3ufh.write(b'#EXTM3U\n/x.mp3')
+    with open(m3ufile, 'rb') as m3ufh:
+        state = plugin._tail(m3ufh, m3ufile, os.stat(m3ufile).st_size)  # pylint: disable=protected-access
+    assert state['trackfile'] == b'/x.mp3'
+    assert state['offset'] == len(b'#EXTM3U\n')
+    await plugin.stop()
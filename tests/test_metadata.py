@@ -1,10 +1,13 @@
 #!/usr/bin/env python3
 ''' test metadata '''
 
+import asyncio
 import os
 import logging
 import multiprocessing
+import shutil
 import sqlite3
+import time
 
 import pytest
 import pytest_asyncio
@@ -720,3 +723,184 @@ async def test_preset_image(get_imagecache, getroot):  #pylint: disable=redefine
             '''SELECT COUNT(cachekey) FROM identifiersha WHERE imagetype="front_cover"''')
         row = cursor.fetchone()[0]
         assert row > 1
+
+
+@pytest.mark.asyncio
+async def test_cached_cover_skips_pictures(get_imagecache, getroot, monkeypatch):  #pylint: disable=redefined-outer-name
+    ''' once a file's embedded cover is cached, pictures are not read again '''
+    config, imagecache = get_imagecache
+    config.cparser.setValue('acoustidmb/enabled', False)
+    config.cparser.setValue('musicbrainz/enabled', False)
+    metadatain = {
+        'filename': os.path.join(getroot, 'tests', 'audio', '15_Ghosts_II_64kb_füllytâgged.mp3')
+    }
+    metadataout = await nowplaying.metadata.MetadataProcessors(config=config).getmoremetadata(
+        metadata=metadatain.copy(), imagecache=imagecache)
+    assert metadataout['coverimageraw']
+    firstcover = metadataout['coverimageraw']
+
+    def nopictures(*args, **kwargs):
+        raise AssertionError('pictures were read again')
+
+    monkeypatch.setattr(nowplaying.metadata.AudioMetadataRunner, 'images', nopictures)
+    monkeypatch.setattr(nowplaying.metadata.TinyTagRunner, 'images', nopictures)
+    metadataout = await nowplaying.metadata.MetadataProcessors(config=config).getmoremetadata(
+        metadata=metadatain.copy(), imagecache=imagecache)
+    assert metadataout['coverimageraw'] == firstcover
+
+
+
+@pytest.mark.asyncio
+async def test_cached_cover_per_file(get_imagecache, getroot, monkeypatch, tmp_path):  #pylint: disable=redefined-outer-name
+    ''' another file from an album with the same name still gets its own cover '''
+    config, imagecache = get_imagecache
+    config.cparser.setValue('acoustidmb/enabled', False)
+    config.cparser.setValue('musicbrainz/enabled', False)
+    original = os.path.join(getroot, 'tests', 'audio', '15_Ghosts_II_64kb_füllytâgged.mp3')
+    other = tmp_path.joinpath('other.mp3')
+    shutil.copyfile(original, other)
+    await nowplaying.metadata.MetadataProcessors(config=config).getmoremetadata(
+        metadata={'filename': original}, imagecache=imagecache)
+
+    pictures = []
+    realimages = nowplaying.metadata.AudioMetadataRunner.images
+
+    def countimages(self, metadata):
+        pictures.append(metadata['filename'])
+        return realimages(self, metadata)
+
+    monkeypatch.setattr(nowplaying.metadata.AudioMetadataRunner, 'images', countimages)
+    metadataout = await nowplaying.metadata.MetadataProcessors(config=config).getmoremetadata(
+        metadata={'filename': str(other)}, imagecache=imagecache)
+    assert pictures == [str(other)]
+    assert metadataout['coverimageraw']
+
+@pytest.mark.asyncio
+async def test_tag_cache(get_imagecache, getroot, monkeypatch, tmp_path):  #pylint: disable=redefined-outer-name
+    ''' warmed files are not parsed again until they change '''
+    config, imagecache = get_imagecache
+    config.cparser.setValue('acoustidmb/enabled', False)
+    config.cparser.setValue('musicbrainz/enabled', False)
+    filename = tmp_path.joinpath('15_Ghosts_II_64kb_füllytâgged.mp3')
+    shutil.copyfile(os.path.join(getroot, 'tests', 'audio', '15_Ghosts_II_64kb_füllytâgged.mp3'),
+                    filename)
+
+    assert nowplaying.metadata.warm_tag_cache(config, [str(tmp_path)],
+                                              imagecache=imagecache,
+                                              workers=2) == 1
+    assert nowplaying.metadata.warm_tag_cache(config, [str(tmp_path)],
+                                              imagecache=imagecache,
+                                              workers=2) == 0
+
+    reads = []
+    realread = nowplaying.metadata.TagReader.read
+
+    def countread(self, filename):
+        reads.append(filename)
+        return realread(self, filename)
+
+    monkeypatch.setattr(nowplaying.metadata.TagReader, 'read', countread)
+    metadataout = await nowplaying.metadata.MetadataProcessors(config=config).getmoremetadata(
+        metadata={'filename': str(filename)}, imagecache=imagecache)
+    assert not reads
+    assert metadataout['artist'] == 'Nine Inch Nails'
+    assert metadataout['title'] == '15 Ghosts II'
+    assert metadataout['coverimageraw']
+
+    os.utime(filename, ns=(0, 0))
+    metadataout = await nowplaying.metadata.MetadataProcessors(config=config).getmoremetadata(
+        metadata={'filename': str(filename)}, imagecache=imagecache)
+    assert reads == [str(filename)]
+    assert metadataout['title'] == '15 Ghosts II'
+
+
+class FakeExtras:  # pylint: disable=too-few-public-methods
+    ''' artistextras plugin that takes its time '''
+
+    def __init__(self, priority, delay, addmeta):
+        self.priority = priority
+        self.delay = delay
+        self.addmeta = addmeta
+
+    def download(self, metadata=None, imagecache=None):  # pylint: disable=unused-argument
+        ''' pretend to download '''
+        time.sleep(self.delay)
+        return self.addmeta
+
+
+@pytest.mark.asyncio
+async def test_artist_extras_deadline(bootstrap):
+    ''' fast plugins do not wait on the deadline; slow ones arrive late '''
+    config = bootstrap
+    config.cparser.setValue('artistextras/deadline', 2.0)
+    config.pluginobjs['artistextras'] = {
+        'low': FakeExtras(1, 0.0, {'artistlongbio': 'low', 'artistwebsites': ['low']}),
+        'high': FakeExtras(10, 0.1, {'artistlongbio': 'high'}),
+    }
+    config.plugins['artistextras'] = list(config.pluginobjs['artistextras'])
+    mdp = nowplaying.metadata.MetadataProcessors(config=config)
+    mdp.metadata = {'artist': 'Nobody'}
+
+    starttime = time.perf_counter()
+    await mdp._artist_extras()  # pylint: disable=protected-access
+    assert time.perf_counter() - starttime < 1.5
+    # extraslist order wins even though it finished last
+    assert mdp.metadata['artistlongbio'] == 'high'
+    assert mdp.metadata['artistwebsites'] == ['low']
+    assert not mdp.latefutures
+
+    config.pluginobjs['artistextras']['slow'] = FakeExtras(5, 3.0, {'artistshortbio': 'slow'})
+    config.plugins['artistextras'].append('slow')
+    mdp = nowplaying.metadata.MetadataProcessors(config=config)
+    mdp.metadata = {'artist': 'Nobody'}
+
+    starttime = time.perf_counter()
+    await mdp._artist_extras()  # pylint: disable=protected-access
+    assert time.perf_counter() - starttime < 2.9
+    assert mdp.metadata['artistlongbio'] == 'high'
+    assert 'artistshortbio' not in mdp.metadata
+    assert [plugin for plugin, _ in mdp.latefutures] == ['slow']
+
+    late = await mdp.late_artist_extras(mdp.latefutures)
+    assert late == {'artistshortbio': 'slow'}
+
+
+class MutatingExtras:  # pylint: disable=too-few-public-methods
+    ''' artistextras plugin that works on the dict it is given, like fanarttv '''
+
+    priority = 1
+
+    def download(self, metadata=None, imagecache=None):  # pylint: disable=unused-argument,no-self-use
+        ''' try name variations, then add fanart to the given metadata '''
+        metadata['artist'] = 'variation'
+        time.sleep(0.5)
+        metadata['artist'] = 'Nobody'
+        metadata['artistfanarturls'].append('https://example.com/late.jpg')
+        return metadata
+
+
+@pytest.mark.asyncio
+async def test_artist_extras_copies(bootstrap):
+    ''' late plugins never change the published metadata behind its back '''
+    config = bootstrap
+    config.cparser.setValue('artistextras/deadline', 0.1)
+    config.pluginobjs['artistextras'] = {'mutating': MutatingExtras()}
+    config.plugins['artistextras'] = ['mutating']
+    mdp = nowplaying.metadata.MetadataProcessors(config=config)
+    mdp.metadata = {'artist': 'Nobody', 'artistfanarturls': ['https://example.com/first.jpg']}
+    published = mdp.metadata
+
+    await mdp._artist_extras()  # pylint: disable=protected-access
+    await asyncio.sleep(0.2)
+    assert published['artist'] == 'Nobody'
+    assert published['artistfanarturls'] == ['https://example.com/first.jpg']
+
+    late = await mdp.late_artist_extras(mdp.latefutures)
+    merged = nowplaying.metadata.extras_replacement(config=config,
+                                                    metadata=dict(published),
+                                                    addmeta=late)
+    assert published['artistfanarturls'] == ['https://example.com/first.jpg']
+    assert merged['artist'] == 'Nobody'
+    assert merged['artistfanarturls'] == [
+        'https://example.com/first.jpg', 'https://example.com/late.jpg'
+    ]
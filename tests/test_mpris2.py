@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+''' test mpris2 '''
+
+import asyncio
+import shutil
+import subprocess
+
+import pytest
+
+import nowplaying.inputs.mpris2  # pylint: disable=import-error
+
+dbus_next = pytest.importorskip('dbus_next')
+
+from dbus_next.aio import MessageBus  # pylint: disable=import-error,wrong-import-position
+from dbus_next.service import ServiceInterface, PropertyAccess, dbus_property  # pylint: disable=import-error,wrong-import-position
+
+SERVICE = 'wnptest'
+
+
+class StubPlayer(ServiceInterface):
+    ''' just enough of org.mpris.MediaPlayer2.Player '''
+
+    def __init__(self, trackmeta):
+        super().__init__('org.mpris.MediaPlayer2.Player')
+        self.trackmeta = trackmeta
+
+    @dbus_property(access=PropertyAccess.READ)
+    def Metadata(self) -> 'a{sv}':  # pylint: disable=invalid-name
+        ''' the current track '''
+        return self.trackmeta
+
+    def settrack(self, trackmeta):
+        ''' switch tracks the way a player would '''
+        self.trackmeta = trackmeta
+        self.emit_properties_changed({'Metadata': trackmeta})
+
+
+def trackmeta(artist, title, arturl=None):
+    ''' build MPRIS2 Metadata '''
+    meta = {
+        'xesam:artist': dbus_next.Variant('as', [artist]),
+        'xesam:title': dbus_next.Variant('s', title),
+    }
+    if arturl:
+        meta['mpris:artUrl'] = dbus_next.Variant('s', arturl)
+    return meta
+
+
+@pytest.fixture
+def dbus_session(monkeypatch):
+    ''' a private session bus '''
+    if not shutil.which('dbus-daemon'):
+        pytest.skip('dbus-daemon is not installed')
+    with subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address'],
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.DEVNULL,
+                          text=True) as daemon:
+        monkeypatch.setenv('DBUS_SESSION_BUS_ADDRESS', daemon.stdout.readline().strip())
+        yield
+        daemon.terminate()
+
+
+async def start_player(meta):
+    ''' put a stand-in player on the bus '''
+    bus = await MessageBus().connect()
+    player = StubPlayer(meta)
+    bus.export('/org/mpris/MediaPlayer2', player)
+    await bus.request_name(f'org.mpris.MediaPlayer2.{SERVICE}')
+    return bus, player
+
+
+async def waitfor(plugin, check):
+    ''' give signals a moment to arrive '''
+    for _ in range(50):
+        metadata = await plugin.getplayingtrack()
+        if check(metadata):
+            return metadata
+        await asyncio.sleep(.1)
+    return metadata
+
+
+@pytest.mark.asyncio
+async def test_mpris2_signals(bootstrap, dbus_session, getroot):  # pylint: disable=redefined-outer-name, unused-argument
+    ''' metadata follows PropertiesChanged and the player coming and going '''
+    config = bootstrap
+    config.cparser.setValue('mpris2/service', SERVICE)
+    cover = getroot.joinpath('tests', 'images', '1x1.jpg')
+    playerbus, player = await start_player(trackmeta('Artist 1', 'Title 1', cover.as_uri()))
+
+    plugin = nowplaying.inputs.mpris2.Plugin(config=config)
+    assert SERVICE in plugin.mpris2.get_mpris2_services()
+    await plugin.start()
+    # the very first snapshot already carries the cover art
+    metadata = await plugin.getplayingtrack()
+    assert metadata['artist'] == 'Artist 1'
+    assert metadata['title'] == 'Title 1'
+    assert metadata['coverimageraw'] == cover.read_bytes()
+
+    player.settrack(trackmeta('Artist 2', 'Title 2'))
+    metadata = await waitfor(plugin, lambda metadata: metadata['title'] == 'Title 2')
+    assert metadata['artist'] == 'Artist 2'
+    assert 'coverimageraw' not in metadata
+
+    playerbus.disconnect()
+    metadata = await waitfor(plugin, lambda metadata: not metadata['title'])
+    assert not metadata['artist']
+
+    playerbus, player = await start_player(trackmeta('Artist 3', 'Title 3'))
+    metadata = await waitfor(plugin, lambda metadata: metadata['title'] == 'Title 3')
+    assert metadata['artist'] == 'Artist 3'
+
+    await plugin.stop()
+    playerbus.disconnect()
@@ -3,6 +3,7 @@
 
 import pytest
 
+import nowplaying.apicache  # pylint: disable=import-error
 import nowplaying.musicbrainz  # pylint: disable=import-error
 
 # either one of these is valid for Computer Blue
@@ -270,3 +271,60 @@ def test_fallback_complex_and_with_feature(getmusicbrainz):  # pylint: disable=r
         'c3c82bdc-d9e7-4836-9746-c24ead47ca19'
     ]
     assert not newdata.get('musicbrainzrecordingid')
+
+
+def test_cached_recordingid(getmusicbrainz):  # pylint: disable=redefined-outer-name
+    ''' a cached recording is resolved without going to the network '''
+    mbhelper = getmusicbrainz
+    mbhelper.apicache = nowplaying.apicache.APICache(
+        cachedir=mbhelper.config.testdir.joinpath('apicache'))
+    for key, data in {
+            'recording:rid1': {
+                'recording': {
+                    'title': 'Tuning Up',
+                    'artist-credit-phrase': 'Chris McClenney',
+                    'artist-credit': [{
+                        'name': 'Chris McClenney',
+                        'artist': {
+                            'id': 'aid1'
+                        }
+                    }],
+                    'first-release-date': '2021-01-01',
+                }
+            },
+            'releases:rid1:official': {
+                'release-count':
+                1,
+                'release-list': [{
+                    'id': 'relid1',
+                    'title': 'Tuning Up',
+                    'artist-credit-phrase': 'Chris McClenney',
+                    'release-group': {
+                        'id': 'rgid1'
+                    },
+                }]
+            },
+            'groupfront:rgid1': b'not really a png',
+            'artist:aid1': {
+                'artist': {
+                    'url-relation-list': [{
+                        'type': 'wikidata',
+                        'target': 'https://www.wikidata.org/wiki/Q1'
+                    }]
+                }
+            },
+    }.items():
+        mbhelper.apicache.put('musicbrainz', key, data)
+
+    metadata = mbhelper.recordingid('rid1')
+    assert metadata['album'] == 'Tuning Up'
+    assert metadata['artist'] == 'Chris McClenney'
+    assert metadata['coverimageraw'] == b'not really a png'
+    assert metadata['date'] == '2021-01-01'
+    assert metadata['musicbrainzartistid'] == ['aid1']
+    assert 'https://www.wikidata.org/wiki/Q1' in metadata['artistwebsites']
+
+    # not found is remembered
+    mbhelper.apicache.put('musicbrainz', 'recording:rid2', {})
+    assert mbhelper.recordingid('rid2') is None
+    mbhelper.apicache.close()
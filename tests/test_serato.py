@@ -1,10 +1,12 @@
 #!/usr/bin/env python3
 ''' test serato '''
 
+import asyncio
 from datetime import datetime
 import logging
 import pathlib
 import os
+import threading
 
 import pytest
 import pytest_asyncio  # pylint: disable=import-error
@@ -91,6 +93,54 @@ async def test_serato_remote2(getseratoplugin, getroot, httpserver):  # pylint:
     assert 'filename' not in metadata
 
 
+@pytest.mark.seratosettings(mode='remote', url='https://localhost')
+@pytest.mark.asyncio
+async def test_serato_remote_conditional(getseratoplugin, getroot, httpserver):  # pylint: disable=redefined-outer-name
+    ''' test serato remote only re-parses changed pages '''
+    plugin = getseratoplugin
+    with open(os.path.join(getroot, 'tests', 'seratolive', '2021_08_25_pong.html'),
+              encoding='utf8') as inputfh:
+        content = inputfh.read()
+    httpserver.expect_ordered_request('/index.html').respond_with_data(
+        content, headers={'ETag': '"pong"'})
+    httpserver.expect_ordered_request('/index.html',
+                                      headers={
+                                          'If-None-Match': '"pong"'
+                                      }).respond_with_data('', status=304)
+    plugin.config.cparser.setValue('serato/url', httpserver.url_for('/index.html'))
+    plugin.config.cparser.sync()
+
+    metadata = await plugin.getplayingtrack()
+    assert metadata['artist'] == 'Chris McClenney'
+    assert metadata['title'] == 'Tuning Up'
+
+    metadata = await plugin.getplayingtrack()
+    assert metadata['artist'] == 'Chris McClenney'
+    assert metadata['title'] == 'Tuning Up'
+    httpserver.check_assertions()
+
+
+@pytest.mark.asyncio
+async def test_serato_wait_for_update(tmp_path):
+    ''' local mode wakes up on session updates rather than sleeping '''
+    tmp_path.joinpath('History', 'Sessions').mkdir(parents=True)
+    handler = nowplaying.inputs.serato.SeratoHandler(seratodir=tmp_path, testmode=True)
+    await handler.start()
+
+    loop = asyncio.get_running_loop()
+    starttime = loop.time()
+    await handler.wait_for_update(0.1)
+    assert loop.time() - starttime >= 0.1
+
+    # as if from the watchdog thread
+    threading.Thread(target=handler._notify).start()  # pylint: disable=protected-access
+    starttime = loop.time()
+    await handler.wait_for_update(30)
+    assert loop.time() - starttime < 5
+    assert not handler.updated.is_set()
+    await handler.close()
+
+
 @pytest.mark.asyncio
 @pytest.mark.seratosettings(datadir='serato-2.4-mac', mixmode='oldest')
 async def test_serato24_mac_oldest(getseratoplugin):  # pylint: disable=redefined-outer-name
@@ -239,3 +289,54 @@ async def test_serato_remote1(getseratoplugin):  # pylint: disable=redefined-out
     assert mode == 'newest'
     mode = plugin.getmixmode()
     assert mode == 'newest'
+
+
+def fullparse_decks(sessiondata):
+    ''' the original full rescan of every adat, for comparison '''
+    decks = {}
+    for adat in reversed(sessiondata):
+        if not adat.get('deck') or not adat.get('played'):
+            continue
+        if adat['deck'] in decks and adat.get('starttime') < decks[adat['deck']].get('starttime'):
+            continue
+        decks[adat['deck']] = adat
+    return decks
+
+
+@pytest.mark.asyncio
+async def test_serato_incremental(getroot, tmp_path):
+    ''' appended session data is decoded incrementally and matches a full parse '''
+    source = pathlib.Path(getroot).joinpath('tests', 'serato-2.4-mac', 'History', 'Sessions',
+                                            '12.session').read_bytes()
+    sessiondir = tmp_path.joinpath('History', 'Sessions')
+    sessiondir.mkdir(parents=True)
+    sessionfile = sessiondir.joinpath('1.session')
+
+    handler = nowplaying.inputs.serato.SeratoHandler(seratodir=tmp_path, testmode=True)
+    reference = nowplaying.inputs.serato.SeratoSessionReader()
+
+    # feed the file in odd-sized pieces so chunks get split
+    written = 0
+    for size in [10, 1000, 3333, 7777, len(source)]:
+        written = min(written + size, len(source))
+        sessionfile.write_bytes(source[:written])
+        await handler._async_process_sessions()  # pylint: disable=protected-access
+        assert handler.sessionreader.offset <= written
+
+    assert handler.sessionreader.offset == len(source)
+    await reference.loadsessionfile(sessionfile)
+    reference.condense()
+    assert nowplaying.inputs.serato.PARSEDSESSIONS == reference.sessiondata
+    handler.computedecks()
+    assert handler.decks == fullparse_decks(reference.sessiondata)
+    assert handler.decks
+
+    # nothing new, nothing decoded
+    assert await handler.sessionreader.loadnewsessiondata(sessionfile) == ([], False)
+
+    # shrinking forces a full parse
+    sessionfile.write_bytes(source[:len(source) // 2])
+    newadats, reset = await handler.sessionreader.loadnewsessiondata(sessionfile)
+    assert reset
+    assert handler.sessionreader.sessiondata == newadats
+    handler.stop()
@@ -4,6 +4,7 @@
 import os
 import tempfile
 
+import jinja2
 import pytest
 
 import nowplaying.utils  # pylint: disable=import-error
@@ -119,3 +120,44 @@ def test_justafile():  # pylint: disable=redefined-outer-name
             content = tempfn.readlines()
 
         assert content[0] == '{{ artist }} - {{ title }}'
+
+
+def test_registry_cache(tmp_path):
+    ''' compiled templates are reused until edited and renders are memoized per dbid + values '''
+    registry = nowplaying.utils.TemplateRegistry(
+        bytecodecache=jinja2.FileSystemBytecodeCache(str(tmp_path)))
+    template = tmp_path.joinpath('registry.txt')
+    template.write_text('{{ artist }} - {{ title }}', encoding='utf-8')
+
+    handler = nowplaying.utils.TemplateHandler(filename=str(template), registry=registry)
+    first = handler.template
+    assert handler.generate({'artist': 'a', 'title': 't', 'dbid': 1}) == 'a - t'
+    assert nowplaying.utils.TemplateHandler(filename=str(template),
+                                            registry=registry).template is first
+    assert list(tmp_path.glob('__jinja2_*.cache'))
+
+    # same dbid and values is a cache hit
+    assert handler.generate({'artist': 'a', 'title': 't', 'dbid': 1}) == 'a - t'
+    assert len(registry.renders) == 1
+    # per-call values are part of the key
+    assert handler.generate({'artist': 'changed', 'title': 't', 'dbid': 1}) == 'changed - t'
+    assert handler.generate({'artist': 'b', 'title': 't', 'dbid': 2}) == 'b - t'
+    # no dbid, no memo
+    assert handler.generate({'artist': 'c', 'title': 't'}) == 'c - t'
+
+    template.write_text('{{ title }} by {{ artist }}', encoding='utf-8')
+    os.utime(template, ns=(first[0] + 1_000_000_000, first[0] + 1_000_000_000))
+    assert handler.generate({'artist': 'a', 'title': 't', 'dbid': 1}) == 't by a'
+    assert handler.template is not first
+
+
+def test_registry_rendercachesize(tmp_path):
+    ''' the render memo is bounded '''
+    registry = nowplaying.utils.TemplateRegistry(
+        bytecodecache=jinja2.FileSystemBytecodeCache(str(tmp_path)), rendercachesize=2)
+    template = tmp_path.joinpath('registry.txt')
+    template.write_text('{{ title }}', encoding='utf-8')
+    handler = nowplaying.utils.TemplateHandler(filename=str(template), registry=registry)
+    for dbid in range(5):
+        assert handler.generate({'title': f'{dbid}', 'dbid': dbid}) == f'{dbid}'
+    assert len(registry.renders) == 2
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+''' test the track bus '''
+
+import asyncio
+
+import pytest
+
+import nowplaying.db  # pylint: disable=import-error
+import nowplaying.trackbus  # pylint: disable=import-error
+
+
+@pytest.mark.asyncio
+async def test_trackbus_roundtrip(tmp_path):
+    ''' every subscriber gets the same record, blobs included '''
+    publisher = nowplaying.trackbus.TrackPublisher(busdir=tmp_path)
+    subscribers = [
+        nowplaying.trackbus.TrackSubscriber(f'sub{counter}', busdir=tmp_path)
+        for counter in range(3)
+    ]
+    for subscriber in subscribers:
+        await subscriber.start()
+
+    metadata = {
+        'artist': 'Nine Inch Nails',
+        'title': '15 Ghosts II',
+        'genres': ['industrial', 'ambient'],
+        'dbid': 1,
+        'coverimageraw': b'\x89PNG\r\n\x1a\nnotreally',
+        'artistlogoraw': b'',
+    }
+    seq = await publisher.publish(metadata)
+
+    for subscriber in subscribers:
+        assert await subscriber.wait_for_update(0, timeout=5)
+        assert subscriber.seq == seq
+        assert subscriber.latest() == metadata
+        await subscriber.stop()
+
+    assert not list(tmp_path.glob('*.port'))
+
+
+@pytest.mark.asyncio
+async def test_trackbus_textonly(tmp_path):
+    ''' text-only subscribers never see image data '''
+    publisher = nowplaying.trackbus.TrackPublisher(busdir=tmp_path)
+    fullsub = nowplaying.trackbus.TrackSubscriber('full', busdir=tmp_path)
+    textsub = nowplaying.trackbus.TrackSubscriber('text', busdir=tmp_path, blobs=False)
+    await fullsub.start()
+    await textsub.start()
+
+    await publisher.publish({
+        'title': 'images',
+        'coverimageraw': b'cover',
+        'coverimagehash': nowplaying.db.blobhash(b'cover')
+    })
+
+    assert await fullsub.wait_for_update(0, timeout=5)
+    assert await textsub.wait_for_update(0, timeout=5)
+    assert fullsub.latest()['coverimageraw'] == b'cover'
+    assert 'coverimageraw' not in textsub.latest()
+    assert textsub.latest()['coverimagehash'] == fullsub.latest()['coverimagehash']
+    await fullsub.stop()
+    await textsub.stop()
+
+
+@pytest.mark.asyncio
+async def test_trackbus_sequence(tmp_path):
+    ''' sequence numbers increase and old records are ignored '''
+    publisher = nowplaying.trackbus.TrackPublisher(busdir=tmp_path)
+    subscriber = nowplaying.trackbus.TrackSubscriber('sequence', busdir=tmp_path)
+    received = []
+
+    async def callback(metadata):
+        received.append(metadata['title'])
+
+    subscriber.add_callback(callback)
+    await subscriber.start()
+
+    firstseq = await publisher.publish({'title': 'one'})
+    await subscriber.wait_for_update(0, timeout=5)
+    secondseq = await publisher.publish({'title': 'two'})
+    await subscriber.wait_for_update(firstseq, timeout=5)
+    assert secondseq > firstseq
+    assert subscriber.latest()['title'] == 'two'
+
+    # a late delivery of an older record must not win
+    _, writer = await asyncio.open_connection('127.0.0.1',
+                                              int(subscriber.portfile.read_text(encoding='utf-8')))
+    writer.write(nowplaying.trackbus.encode_record(firstseq, {'title': 'one'}))
+    await writer.drain()
+    writer.close()
+    assert not await subscriber.wait_for_update(secondseq, timeout=1)
+    assert subscriber.latest()['title'] == 'two'
+
+    await asyncio.sleep(.5)
+    assert received == ['one', 'two']
+    await subscriber.stop()
+
+
+@pytest.mark.asyncio
+async def test_trackbus_stale_subscriber(tmp_path):
+    ''' subscribers that went away get cleaned up '''
+    publisher = nowplaying.trackbus.TrackPublisher(busdir=tmp_path)
+    subscriber = nowplaying.trackbus.TrackSubscriber('stale', busdir=tmp_path)
+    await subscriber.start()
+    portfile = subscriber.portfile
+    subscriber.server.close()
+    await subscriber.server.wait_closed()
+
+    await publisher.publish({'title': 'nobody home'})
+    assert not portfile.exists()
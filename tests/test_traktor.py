@@ -1,6 +1,10 @@
 #!/usr/bin/env python3
 ''' test virtualdj '''
 
+import os
+import re
+import sqlite3
+
 import pytest
 
 import nowplaying.inputs.traktor  # pylint: disable=import-error
@@ -35,6 +39,52 @@ async def test_read_collections(bootstrap, getroot):
     assert data['album'] == 'The Best of Divine'
 
 
+@pytest.mark.asyncio
+async def test_incremental_refresh(bootstrap, getroot, tmp_path):
+    ''' a changed collection.nml gets merged in without a rebuild '''
+    config = bootstrap
+    cml = tmp_path.joinpath('collection.nml')
+    cml.write_text(getroot.joinpath('tests', 'playlists', 'traktor',
+                                    'collection.nml').read_text(encoding='utf-8'),
+                   encoding='utf-8')
+    config.cparser.setValue('traktor/collections', str(cml))
+    traktor = nowplaying.inputs.traktor.Traktor(config=config)
+    traktor.databasefile = tmp_path.joinpath('traktor.db')
+    traktor.initdb()
+
+    with sqlite3.connect(traktor.databasefile) as connection:
+        indexes = {
+            row[0]
+            for row in connection.execute("SELECT name FROM sqlite_master WHERE type='index'")
+        }
+        before = dict(connection.execute('SELECT location, id FROM songs').fetchall())
+    assert set(nowplaying.inputs.traktor.INDEXDEFS).issubset(indexes)
+    assert len(before) == 395
+
+    data = await traktor.lookup(artist='divine', title='shoot your shot')
+    assert data['album'] == 'The Best of Divine'
+    assert await traktor.lookup(artist='Queen', title='Ogre Battle')
+
+    content = cml.read_text(encoding='utf-8')
+    content = content.replace('TITLE="The Best of Divine"', 'TITLE="Divine Hits"')
+    content = re.sub(r'<ENTRY [^>]*ARTIST="Queen".*?</ENTRY>\n', '', content, flags=re.DOTALL)
+    cml.write_text(content, encoding='utf-8')
+    stat = cml.stat()
+    os.utime(cml, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+
+    # the changed file is picked up in the background
+    assert await traktor.lookup(artist='Divine', title='Shoot Your Shot')
+    await traktor.refreshtask
+    data = await traktor.lookup(artist='Divine', title='Shoot Your Shot')
+    assert data['album'] == 'Divine Hits'
+    assert not await traktor.lookup(artist='Queen', title='Ogre Battle')
+
+    with sqlite3.connect(traktor.databasefile) as connection:
+        after = dict(connection.execute('SELECT location, id FROM songs').fetchall())
+    assert len(after) == len(before) - 1
+    assert all(before[location] == rowid for location, rowid in after.items())
+
+
 # @pytest.mark.asyncio
 # async def test_playlist_read(virtualdj_bootstrap, getroot):  # pylint: disable=redefined-outer-name
 #     ''' test getting random tracks '''
@@ -483,3 +483,76 @@ async def test_playlist_read(virtualdj_bootstrap, getroot):  # pylint: disable=r
     assert filename
     filename = await plugin.getrandomtrack('testplaylist')
     assert filename
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh(virtualdj_bootstrap, getroot, tmp_path, monkeypatch):  # pylint: disable=redefined-outer-name
+    ''' only changed playlists get re-read '''
+    config = virtualdj_bootstrap
+    testmp3 = str(getroot.joinpath('tests', 'audio', '15_Ghosts_II_64kb_orig.mp3'))
+    playlistdir = tmp_path.joinpath('playlists')
+    playlistdir.mkdir()
+    write_virtualdj8(playlistdir.joinpath('first.m3u'), testmp3)
+    write_virtualdj8(playlistdir.joinpath('second.m3u'), testmp3)
+    config.cparser.setValue('virtualdj/playlists', str(playlistdir))
+    plugin = nowplaying.inputs.virtualdj.Plugin(config=config)
+    plugin.databasefile = tmp_path.joinpath('virtualdj.db')
+
+    reads = []
+
+    def playlist_lines(filepath):
+        reads.append(pathlib.Path(filepath).name)
+        return nowplaying.inputs.virtualdj.Plugin._playlist_lines(filepath)  # pylint: disable=protected-access
+
+    monkeypatch.setattr(plugin, '_playlist_lines', playlist_lines)
+
+    plugin.initdb()
+    assert sorted(reads) == ['first.m3u', 'second.m3u']
+    assert await plugin.getrandomtrack('first') == testmp3
+
+    reads.clear()
+    plugin.initdb()
+    assert not reads
+
+    playlistdir.joinpath('first.m3u').unlink()
+    with open(playlistdir.joinpath('second.m3u'), 'a', encoding='utf-8') as m3ufh:
+        m3ufh.write(f'{testmp3}{os.linesep}')
+    plugin.initdb()
+    assert not await plugin.getrandomtrack('first')
+    assert reads == ['second.m3u']
+    assert await plugin.getrandomtrack('second') == testmp3
+
+
+@pytest.mark.asyncio
+async def test_playlist_refresh_stop(virtualdj_bootstrap, getroot, tmp_path, monkeypatch):  # pylint: disable=redefined-outer-name
+    ''' a stopped refresh gives up between playlists and writes nothing '''
+    config = virtualdj_bootstrap
+    testmp3 = str(getroot.joinpath('tests', 'audio', '15_Ghosts_II_64kb_orig.mp3'))
+    playlistdir = tmp_path.joinpath('playlists')
+    playlistdir.mkdir()
+    write_virtualdj8(playlistdir.joinpath('first.m3u'), testmp3)
+    write_virtualdj8(playlistdir.joinpath('second.m3u'), testmp3)
+    config.cparser.setValue('virtualdj/playlists', str(playlistdir))
+    plugin = nowplaying.inputs.virtualdj.Plugin(config=config)
+    plugin.databasefile = tmp_path.joinpath('virtualdj.db')
+
+    reads = []
+
+    def playlist_lines(filepath):
+        reads.append(pathlib.Path(filepath).name)
+        plugin.stopevent.set()
+        return nowplaying.inputs.virtualdj.Plugin._playlist_lines(filepath)  # pylint: disable=protected-access
+
+    monkeypatch.setattr(plugin, '_playlist_lines', playlist_lines)
+
+    plugin.initdb()
+    assert len(reads) == 1
+    assert not await plugin.getrandomtrack('first')
+    assert not await plugin.getrandomtrack('second')
+
+    monkeypatch.setattr(plugin, '_playlist_lines',
+                        nowplaying.inputs.virtualdj.Plugin._playlist_lines)  # pylint: disable=protected-access
+    plugin.stopevent.clear()
+    plugin.initdb()
+    assert await plugin.getrandomtrack('first') == testmp3
+    assert await plugin.getrandomtrack('second') == testmp3
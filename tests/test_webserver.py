@@ -2,16 +2,20 @@
 ''' test webserver '''
 
 import asyncio
+import json
 import logging
 import socket
 import sys
 
+import aiohttp
 import pytest
 import pytest_asyncio
 import requests
 
 import nowplaying.db  # pylint: disable=import-error
 import nowplaying.subprocesses  # pylint: disable=import-error
+import nowplaying.trackbus  # pylint: disable=import-error
+import nowplaying.utils  # pylint: disable=import-error
 import nowplaying.processes.webserver  # pylint: disable=import-error
 
 
@@ -235,3 +239,196 @@ def test_webserver_logo_test(getwebserver):  # pylint: disable=redefined-outer-n
 
     req = requests.get('http://localhost:8899/artistlogo.png', timeout=5)
     assert req.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_webserver_wsstream_trackbus(getwebserver):  # pylint: disable=redefined-outer-name
+    ''' tracks published on the bus get pushed to websocket clients '''
+    config, metadb = getwebserver  # pylint: disable=unused-variable
+    port = config.cparser.value('weboutput/httpport', type=int)
+    publisher = nowplaying.trackbus.TrackPublisher()
+
+    metadata = {'artist': 'busartist', 'title': 'bustitle'}
+    dbid = await metadb.write_to_metadb(metadata=metadata)
+    await publisher.publish(await metadb.make_record_async(metadata, dbid))
+
+    async with aiohttp.ClientSession() as session:
+        async with session.ws_connect(f'http://localhost:{port}/wsstream') as websocket:
+            data = await asyncio.wait_for(websocket.receive_json(), timeout=10)
+            assert data['artist'] == 'busartist'
+            assert data['title'] == 'bustitle'
+            assert data['coverimagebase64']
+
+            metadata = {'artist': 'busartist2', 'title': 'bustitle2'}
+            dbid = await metadb.write_to_metadb(metadata=metadata)
+            await publisher.publish(await metadb.make_record_async(metadata, dbid))
+            data = await asyncio.wait_for(websocket.receive_json(), timeout=5)
+            assert data['artist'] == 'busartist2'
+            assert data['title'] == 'bustitle2'
+
+    req = requests.get(f'http://localhost:{port}/v1/last', timeout=5)
+    assert req.json()['title'] == 'bustitle2'
+
+    req = requests.get(f'http://localhost:{port}/v1/last?images=false', timeout=5)
+    assert req.json()['title'] == 'bustitle2'
+    assert 'coverimagebase64' not in req.json()
+
+
+@pytest.mark.asyncio
+async def test_webserver_coverpng_etag(getwebserver):  # pylint: disable=redefined-outer-name
+    ''' images are served by hash and honor If-None-Match '''
+    config, metadb = getwebserver
+    port = config.cparser.value('weboutput/httpport', type=int)
+    cover = nowplaying.utils.TRANSPARENT_PNG_BIN + b'cover'
+
+    await metadb.write_to_metadb(metadata={
+        'artist': 'etagartist',
+        'title': 'etagtitle',
+        'coverimageraw': cover
+    })
+    await asyncio.sleep(1)
+
+    req = requests.get(f'http://localhost:{port}/cover.png', timeout=5)
+    assert req.status_code == 200
+    assert req.content == cover
+    etag = req.headers['ETag']
+    assert nowplaying.db.blobhash(cover) in etag
+
+    req = requests.get(f'http://localhost:{port}/cover.png',
+                       headers={'If-None-Match': etag},
+                       timeout=5)
+    assert req.status_code == 304
+    assert not req.content
+
+    req = requests.get(f'http://localhost:{port}/artistlogo.png',
+                       headers={'If-None-Match': etag},
+                       timeout=5)
+    assert req.status_code == 200
+    assert req.content == nowplaying.utils.TRANSPARENT_PNG_BIN
+
+    # missing images are cacheable too
+    req = requests.get(f'http://localhost:{port}/artistlogo.png',
+                       headers={'If-None-Match': req.headers['ETag']},
+                       timeout=5)
+    assert req.status_code == 304
+
+    req = requests.get(f'http://localhost:{port}/v1/last', timeout=5)
+    assert req.status_code == 200
+    assert req.headers['Cache-Control'] == 'no-cache'
+    lastetag = req.headers['ETag']
+    lastmodified = req.headers['Last-Modified']
+    req = requests.get(f'http://localhost:{port}/v1/last',
+                       headers={'If-None-Match': lastetag},
+                       timeout=5)
+    assert req.status_code == 304
+    req = requests.get(f'http://localhost:{port}/v1/last',
+                       headers={'If-Modified-Since': lastmodified},
+                       timeout=5)
+    assert req.status_code == 304
+    req = requests.get(f'http://localhost:{port}/v1/last?images=false',
+                       headers={'If-None-Match': lastetag},
+                       timeout=5)
+    assert req.status_code == 200
+
+    # a new track invalidates everything
+    await metadb.write_to_metadb(metadata={
+        'artist': 'etagartist',
+        'title': 'etagtitle2',
+        'coverimageraw': cover
+    })
+    await asyncio.sleep(1)
+    req = requests.get(f'http://localhost:{port}/cover.png',
+                       headers={'If-None-Match': etag},
+                       timeout=5)
+    assert req.status_code == 200
+    assert req.content == cover
+    req = requests.get(f'http://localhost:{port}/v1/last',
+                       headers={'If-None-Match': lastetag},
+                       timeout=5)
+    assert req.status_code == 200
+    assert req.json()['title'] == 'etagtitle2'
+
+
+@pytest.mark.asyncio
+async def test_webserver_history(getwebserver):  # pylint: disable=redefined-outer-name
+    ''' /v1/history pages through played tracks '''
+    config, metadb = getwebserver
+    port = config.cparser.value('weboutput/httpport', type=int)
+
+    for counter in range(3):
+        await metadb.write_to_metadb(metadata={'artist': f'a{counter}', 'title': f't{counter}'})
+
+    req = requests.get(f'http://localhost:{port}/v1/history', timeout=5)
+    assert req.status_code == 200
+    assert [track['title'] for track in req.json()] == ['t2', 't1', 't0']
+
+    req = requests.get(f'http://localhost:{port}/v1/history?limit=1&before=3', timeout=5)
+    assert req.json() == [{'dbid': 2, 'artist': 'a1', 'title': 't1'}]
+
+    req = requests.get(f'http://localhost:{port}/v1/history?limit=bad', timeout=5)
+    assert req.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_wsstream_broadcaster(bootstrap):  # pylint: disable=unused-argument
+    ''' frames are encoded once per track and slow clients only get the newest '''
+    encoded = []
+
+    def encoder(metadata):
+        encoded.append(metadata['title'])
+        return metadata['title']
+
+    trackbus = nowplaying.trackbus.TrackSubscriber('test')
+    await trackbus.start()
+    broadcaster = nowplaying.processes.webserver.WSStreamBroadcaster(trackbus, encoder)
+    stopevent = asyncio.Event()
+    task = asyncio.create_task(broadcaster.run(stopevent))
+
+    fast = broadcaster.subscribe()
+    slow = broadcaster.subscribe()
+    publisher = nowplaying.trackbus.TrackPublisher()
+    for title in ['one', 'two', 'three']:
+        await publisher.publish({'artist': 'artist', 'title': title})
+        assert await asyncio.wait_for(fast.get(), timeout=1) == title
+
+    assert encoded == ['one', 'two', 'three']
+    assert slow.qsize() == 1
+    assert slow.get_nowait() == 'three'
+
+    late = broadcaster.subscribe()
+    assert late.get_nowait() == 'three'
+
+    stopevent.set()
+    await task
+    await trackbus.stop()
+
+
+def test_payloadcache():
+    ''' payloads are built once per track version and evicted by the next one '''
+    calls = []
+
+    def builder(metadata):
+        calls.append(metadata.get('dbid'))
+        metadata['built'] = True
+        return metadata
+
+    cache = nowplaying.processes.webserver.PayloadCache({'one': builder, 'two': builder})
+    metadata = {'dbid': 1, 'title': 'title1'}
+    assert json.loads(cache.payload(metadata, 'one')) == {'dbid': 1, 'title': 'title1', 'built': True}
+    assert cache.payload(metadata, 'two') == cache.payload(metadata, 'one')
+    assert 'built' not in metadata
+    assert calls == [1, 1]
+
+    cache.payload({'dbid': 2, 'title': 'title2'}, 'one')
+    assert calls == [1, 1, 2, 2]
+    assert cache.version == (2, 0)
+    assert json.loads(cache.payload({'dbid': 2, 'title': 'ignored'}, 'two'))['title'] == 'title2'
+
+    # late artist extras keep the dbid but bump the revision
+    late = {'dbid': 2, 'dbrevision': 1, 'title': 'title2', 'artistshortbio': 'late'}
+    assert json.loads(cache.payload(late, 'one'))['artistshortbio'] == 'late'
+    assert cache.version == (2, 1)
+
+    # nothing to key on, so never cached
+    cache.payload({'title': 'nodbid'}, 'one')
+    assert cache.version == (2, 1)